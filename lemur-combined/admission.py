@@ -0,0 +1,247 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from metrics import RENDER_PEAK_BYTES
+
+logger = logging.getLogger(__name__)
+
+_CGROUP_LIMITS = (
+    "/sys/fs/cgroup/memory.max",  # cgroup v2
+    "/sys/fs/cgroup/memory/memory.limit_in_bytes",  # cgroup v1
+)
+
+
+def rss_bytes():
+    """
+    Return the resident set size of this process, or None where /proc is
+    not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def container_memory_limit():
+    """
+    Return the container's memory limit in bytes from its cgroup, or None
+    if it has none.
+    """
+    for path in _CGROUP_LIMITS:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value == "max":
+            return None
+        try:
+            limit = int(value)
+        except ValueError:
+            continue
+        # cgroup v1 reports "unlimited" as a huge page-aligned number
+        return limit if limit < 1 << 60 else None
+    return None
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a render could not start within its wait because the memory
+    budget is in use.
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class MemoryAdmission:
+    """
+    Admit renders only while their expected memory fits in `budget` bytes.
+
+    While renders run, a sampler thread reads the process RSS every
+    `sample_interval` seconds. When a render finishes, the peak growth over
+    its start RSS (shared equally with the renders that overlapped it) is
+    its measured cost; the largest cost of the last `window` renders, but
+    never less than `estimate`, is what a new render reserves. The floor
+    matters once allocator arenas stay mapped between renders: RSS then
+    barely grows while a render runs, and measured costs shrink toward
+    zero although every render still needs the memory. A
+    render is admitted when the RSS measured while idle plus the
+    reservations of the running renders and its own fits the budget, or
+    when nothing else is running. Otherwise it waits for a render to
+    finish and AdmissionRejected is raised after its timeout. `budget=None`
+    admits everything but still measures.
+
+    With `recycle_drift`, the idle RSS after the first `warmup` renders is
+    the worker's baseline; once idle RSS has grown more than
+    `recycle_drift` bytes above it, should_recycle() asks for a fresh
+    worker.
+    """
+
+    def __init__(
+        self,
+        budget=None,
+        estimate=128 * 1024 * 1024,
+        window=50,
+        sample_interval=0.02,
+        recycle_drift=0,
+        warmup=5,
+        rss=rss_bytes,
+    ):
+        self.budget = budget
+        self.estimate = estimate
+        self.sample_interval = sample_interval
+        self.recycle_drift = recycle_drift
+        self.warmup = warmup
+        self._rss = rss
+        self._costs = deque(maxlen=window)
+        self._active = {}
+        self._next_token = 0
+        self._idle_rss = rss() or 0
+        self._baseline = None
+        self._finished = 0
+        self._hold = None
+        self._waiting = 0
+        self._recycle = False
+        self._sampler = None
+        self._lock = threading.Condition()
+        self._stats = {"admitted": 0, "queued": 0, "rejected": 0}
+
+    @contextmanager
+    def admit(self, timeout=None):
+        """
+        Hold a share of the memory budget for the duration of one render,
+        waiting up to `timeout` seconds (None waits indefinitely) for one.
+        """
+        token = self._acquire(timeout)
+        try:
+            yield
+        finally:
+            self._release(token)
+
+    def should_recycle(self):
+        """
+        Return True once RSS has drifted past the recycle threshold and no
+        render is running, so the worker can be replaced without losing one.
+        """
+        with self._lock:
+            return self._recycle and not self._active
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._active)
+            stats["waiting"] = self._waiting
+            stats["reserved_bytes"] = sum(entry["reserved"] for entry in self._active.values())
+            stats["estimate_bytes"] = self._estimate()
+            stats["idle_rss_bytes"] = self._idle_rss
+            stats["baseline_rss_bytes"] = self._baseline or 0
+            stats["recycle_requested"] = int(self._recycle)
+            if self.budget is not None:
+                stats["budget_bytes"] = self.budget
+        stats["rss_bytes"] = self._rss() or 0
+        return stats
+
+    def _estimate(self):
+        return max(self.estimate, max(self._costs, default=0))
+
+    def _fits(self, reserve):
+        if not self._active or self.budget is None:
+            return True
+        reserved = sum(entry["reserved"] for entry in self._active.values())
+        return self._idle_rss + reserved + reserve <= self.budget
+
+    def _acquire(self, timeout):
+        stop = time.monotonic() + timeout if timeout is not None else None
+        with self._lock:
+            reserve = self._estimate()
+            if not self._fits(reserve):
+                self._stats["queued"] += 1
+                self._waiting += 1
+                try:
+                    while not self._fits(reserve):
+                        remaining = stop - time.monotonic() if stop is not None else None
+                        if remaining is not None and remaining <= 0:
+                            self._stats["rejected"] += 1
+                            retry_after = self._hold or 1.0
+                            raise AdmissionRejected(
+                                f"Memory budget is full ({len(self._active)} renders running), "
+                                f"retry in {retry_after:.0f}s",
+                                retry_after,
+                            )
+                        self._lock.wait(remaining)
+                        reserve = self._estimate()
+                finally:
+                    self._waiting -= 1
+            start = self._rss() or 0
+            token = self._next_token
+            self._next_token += 1
+            self._active[token] = {
+                "reserved": reserve,
+                "start": start,
+                "peak": start,
+                "overlap": len(self._active) + 1,
+                "started": time.monotonic(),
+            }
+            for entry in self._active.values():
+                entry["overlap"] = max(entry["overlap"], len(self._active))
+            self._stats["admitted"] += 1
+            if self._sampler is None:
+                # Started on first use, so a preloading gunicorn master never
+                # forks a running thread
+                self._sampler = threading.Thread(
+                    target=self._sample, name="memory-sampler", daemon=True
+                )
+                self._sampler.start()
+            else:
+                self._lock.notify_all()
+        return token
+
+    def _release(self, token):
+        rss = self._rss()
+        with self._lock:
+            entry = self._active.pop(token)
+            if rss is not None:
+                entry["peak"] = max(entry["peak"], rss)
+                cost = max(0, entry["peak"] - entry["start"]) // entry["overlap"]
+                self._costs.append(cost)
+                RENDER_PEAK_BYTES.observe(cost)
+            held = time.monotonic() - entry["started"]
+            self._hold = held if self._hold is None else 0.8 * self._hold + 0.2 * held
+            self._finished += 1
+            if not self._active and rss is not None:
+                self._idle(rss)
+            self._lock.notify_all()
+
+    def _idle(self, rss):
+        self._idle_rss = rss
+        if self._finished < self.warmup:
+            return
+        if self._baseline is None:
+            self._baseline = rss
+            logger.info(f"Worker memory baseline after {self._finished} renders: {rss} bytes")
+        elif self.recycle_drift and not self._recycle and rss - self._baseline > self.recycle_drift:
+            self._recycle = True
+            logger.warning(
+                f"Worker RSS drifted to {rss} bytes, {rss - self._baseline} over its "
+                f"baseline; requesting a recycle"
+            )
+
+    def _sample(self):
+        while True:
+            with self._lock:
+                while not self._active:
+                    self._lock.wait()
+            rss = self._rss()
+            if rss is None:
+                return
+            with self._lock:
+                for entry in self._active.values():
+                    entry["peak"] = max(entry["peak"], rss)
+            time.sleep(self.sample_interval)
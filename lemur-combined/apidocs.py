@@ -0,0 +1,56 @@
+import logging
+import threading
+
+from flask import Flask
+
+logger = logging.getLogger(__name__)
+
+# Paths flasgger serves with its default config
+DOCS_PREFIXES = ("/apidocs", "/apispec_1.json", "/flasgger_static")
+
+
+class LazySwagger:
+    """
+    WSGI middleware serving the Swagger UI of `app` at /apidocs.
+
+    flasgger pulls in jsonschema and friends, so it is only imported on the
+    first request for the docs. Flask accepts no new routes once an app has
+    served a request, so the UI runs in a separate app that mirrors the
+    routes, and so the docstrings, of `app`. Every other request goes
+    straight to `app`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+        self._docs = None
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO", "").startswith(DOCS_PREFIXES):
+            return self._get_docs()(environ, start_response)
+        return self.wsgi_app(environ, start_response)
+
+    def _get_docs(self):
+        if self._docs is None:
+            with self._lock:
+                if self._docs is None:
+                    self._docs = self._build()
+        return self._docs
+
+    def _build(self):
+        from flasgger import Swagger
+
+        docs = Flask(self.app.import_name)
+        for rule in self.app.url_map.iter_rules():
+            if rule.endpoint == "static":
+                continue
+            docs.add_url_rule(
+                rule.rule,
+                rule.endpoint,
+                self.app.view_functions[rule.endpoint],
+                methods=rule.methods,
+            )
+        Swagger(docs)
+        logger.info("Loaded flasgger for /apidocs")
+        return docs
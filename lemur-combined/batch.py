@@ -0,0 +1,70 @@
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import render
+from logs import configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker(template_path):
+    # Spawned workers start with a bare root logger
+    if not logging.getLogger().handlers:
+        configure_logging()
+    render.load_template(template_path)
+
+
+def _render(data, trim):
+    return render.render_deck(data, trim)
+
+
+class RenderPool:
+    """
+    Process pool rendering decks on every CPU core.
+
+    populate_slide() and prs.save() are CPU-bound pure Python, so threads
+    would serialize on the GIL. Workers load the template once when they
+    start and are created on first use, so a preloading gunicorn master
+    never forks them. They start with "forkserver" by default: the pool is
+    created inside a threaded web worker, and forking that could copy a
+    lock some other thread holds.
+    """
+
+    def __init__(self, template_path, max_workers=None, start_method="forkserver"):
+        self.template_path = template_path
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.start_method = start_method
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    context = multiprocessing.get_context(self.start_method)
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=context,
+                        initializer=_init_worker,
+                        initargs=(self.template_path,),
+                    )
+                    logger.info(
+                        f"Started {self.max_workers} render processes ({context.get_start_method()})"
+                    )
+        return self._executor
+
+    def submit(self, data, trim=False):
+        """
+        Render `data` ({slide_no: content}) in a worker; returns a Future of
+        the .pptx bytes.
+        """
+        return self._get_executor().submit(_render, data, trim)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
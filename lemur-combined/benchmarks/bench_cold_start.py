@@ -0,0 +1,107 @@
+"""
+Measure cold start: fresh interpreters importing main.py and serving a first request.
+
+Each run starts a new Python process that imports main.py, answers /health,
+renders one deck with /generate (built-in sample data, in-memory fake
+Drive) and builds one real Drive client from the bundled discovery document.
+Results are printed as JSON.
+
+    python benchmarks/bench_cold_start.py --runs 5
+    SWAGGER_ENABLED=false python benchmarks/bench_cold_start.py --runs 5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def child():
+    started = time.perf_counter()
+    sys.path[:0] = [ROOT, HERE]
+    os.chdir(ROOT)
+
+    import main
+    from metrics import REGISTRY
+
+    imported = time.perf_counter()
+
+    from fakes import FakeDrive
+
+    main.drive_pool.factory = FakeDrive
+    client = main.app.test_client()
+    if client.get("/health").status_code != 200:
+        sys.exit("/health failed")
+    health = time.perf_counter()
+    response = client.post("/generate", json={"file_id": "cold-start"})
+    if response.status_code != 200:
+        sys.exit(f"/generate failed: {response.get_data(as_text=True)}")
+    generated = time.perf_counter()
+
+    from google.auth.credentials import AnonymousCredentials
+    from googleapiclient.discovery import build
+
+    build("drive", "v3", credentials=AnonymousCredentials(), static_discovery=True, cache_discovery=False)
+    built = time.perf_counter()
+
+    print(json.dumps({
+        "import_s": imported - started,
+        "init_s": REGISTRY.get_sample_value("lemur_startup_seconds"),
+        "first_health_s": health - imported,
+        "first_generate_s": generated - health,
+        "drive_client_build_s": built - generated,
+    }))
+
+
+def summarize(values):
+    ordered = sorted(values)
+    return {
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 1),
+        "min_ms": round(ordered[0] * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return
+
+    env = dict(os.environ)
+    env.setdefault("LOG_LEVEL", "CRITICAL")
+    env.setdefault("DECK_CACHE_ENABLED", "false")
+    env.pop("API_ENDPOINT_URL", None)
+
+    runs = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child"],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        # Interpreter start-up to first /generate answered, as seen from outside
+        result["process_to_first_generate_s"] = time.perf_counter() - start - result["drive_client_build_s"]
+        runs.append(result)
+
+    results = {
+        "runs": args.runs,
+        "swagger_enabled": env.get("SWAGGER_ENABLED", "true"),
+        "phases": {key: summarize([run[key] for run in runs]) for key in runs[0]},
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+End-to-end benchmark of /generate against local fakes of Drive and the slide API.
+
+Synthetic payloads shaped like hardcoded_data (scaled with --scale) are
+served by a loopback slide server and every upload lands in an in-memory
+Drive. Reports p50/p99 latency, per-stage time, peak RSS, output size and
+microbenchmarks of populate_slide() and set_font() as JSON, so runs from
+different commits can be compared with --compare. With --update every
+request refreshes the same deck in place after one slide's payload changed.
+--engine slides renders through the Google Slides path against FakeSlides
+instead, for comparison with the default pptx engine.
+
+    python benchmarks/bench_generate.py --iterations 20 --scale 4 --output run.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import statistics
+import subprocess
+
+from pptx.util import Pt
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+from fakes import FakeDrive, FakeSlides, SlideServer, scale_payloads  # noqa: E402
+from metrics import REGISTRY  # noqa: E402
+from render import populate_slide  # noqa: E402
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of `values`.
+    """
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize(timings):
+    return {
+        "p50_ms": round(percentile(timings, 50) * 1000, 3),
+        "p99_ms": round(percentile(timings, 99) * 1000, 3),
+        "mean_ms": round(statistics.mean(timings) * 1000, 3),
+        "min_ms": round(min(timings) * 1000, 3),
+        "max_ms": round(max(timings) * 1000, 3),
+    }
+
+
+SLIDES_TEMPLATE_ID = "slides-template"
+
+
+def import_app(api_url, drive, deck_cache, slides=None, engine="pptx"):
+    """
+    Import main.py with Google credentials and every Drive and Slides client
+    replaced by fakes.
+    """
+    os.environ["API_ENDPOINT_URL"] = api_url
+    os.environ.setdefault("TEMPLATE_PATH", os.path.join(ROOT, "template.pptx"))
+    # Keep stdout for the results; set LOG_LEVEL to include logging cost
+    os.environ.setdefault("LOG_LEVEL", "CRITICAL")
+    os.environ["DECK_CACHE_ENABLED"] = "true" if deck_cache else "false"
+    os.environ["RENDER_ENGINE"] = engine
+    os.environ["SLIDES_TEMPLATE_ID"] = SLIDES_TEMPLATE_ID
+
+    import google.auth
+    import googleapiclient.discovery
+
+    google.auth.default = lambda scopes=None, **kwargs: (None, None)
+    googleapiclient.discovery.build = (
+        lambda service, *args, **kwargs: slides if service == "slides" else drive
+    )
+
+    import main
+
+    return main
+
+
+def stage_totals():
+    """
+    Return {stage: (sum, count)} from the stage duration histogram.
+    """
+    totals = {}
+    for metric in REGISTRY.collect():
+        if metric.name != "lemur_stage_duration_seconds":
+            continue
+        for sample in metric.samples:
+            stage = sample.labels.get("stage")
+            if sample.name.endswith("_sum"):
+                totals.setdefault(stage, [0.0, 0])[0] = sample.value
+            elif sample.name.endswith("_count"):
+                totals.setdefault(stage, [0.0, 0])[1] = sample.value
+    return totals
+
+
+def stage_deltas(before, after):
+    stages = {}
+    for stage, (total, count) in after.items():
+        prev_total, prev_count = before.get(stage, (0.0, 0))
+        if count > prev_count:
+            stages[stage] = {
+                "mean_ms": round((total - prev_total) / (count - prev_count) * 1000, 3),
+                "calls": int(count - prev_count),
+            }
+    return stages
+
+
+def bench_end_to_end(main, drive, iterations, warmup, server=None, update=False):
+    client = main.app.test_client()
+
+    def request_body(name):
+        if not update:
+            return {"file_id": name}
+        # Touch one slide per request, round-robin
+        slide_no = main.SLIDE_NUMBERS[request_body.count % len(main.SLIDE_NUMBERS)]
+        request_body.count += 1
+        server.set_payload(slide_no, dict(server.payloads[str(slide_no)], refreshed=request_body.count))
+        return {"file_id": "bench", "update": True}
+
+    request_body.count = 0
+    for i in range(warmup):
+        response = client.post("/generate", json=request_body(f"warmup-{i}"))
+        if response.status_code != 200:
+            sys.exit(f"/generate failed during warmup: {response.get_data(as_text=True)}")
+
+    before = stage_totals()
+    timings = []
+    response_bytes = 0
+    for i in range(iterations):
+        start = time.perf_counter()
+        response = client.post("/generate", json=request_body(f"bench-{i}"))
+        timings.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            sys.exit(f"/generate failed: {response.get_data(as_text=True)}")
+        response_bytes = len(response.get_data())
+    after = stage_totals()
+
+    uploads = [f["content"] for f in drive.files_by_id.values() if f.get("content")]
+    return {
+        "latency": summarize(timings),
+        "stages": stage_deltas(before, after),
+        "output_bytes": len(uploads[-1]) if uploads else 0,
+        "response_bytes": response_bytes,
+    }
+
+
+def bench_populate_slide(main, slide_data, repeat):
+    """
+    Time populate_slide() per slide on fresh template copies.
+    """
+    timings = {slide_no: [] for slide_no in slide_data}
+    for _ in range(repeat):
+        prs = main.template_cache.checkout(slide_data.keys())
+        for slide_no, content in slide_data.items():
+            slide = prs.slides[slide_no - 1]
+            start = time.perf_counter()
+            populate_slide(slide, content, slide_no)
+            timings[slide_no].append(time.perf_counter() - start)
+    per_slide = {str(slide_no): summarize(t) for slide_no, t in timings.items()}
+    total = [sum(t[i] for t in timings.values()) for i in range(repeat)]
+    return {"deck": summarize(total), "slides": per_slide}
+
+
+def _set_font(cell):
+    # The per-cell restyle the old rendering path ran after every write
+    for paragraph in cell.text_frame.paragraphs:
+        for run in paragraph.runs:
+            run.font.name = "Arial"
+            run.font.size = Pt(8)
+
+
+def bench_set_font(main, slide_no, repeat):
+    """
+    Time the old per-cell set_font() over every cell of the main table of
+    one slide.
+    """
+    prs = main.template_cache.checkout([slide_no])
+    plan = main.template_cache.derive("layouts", main.compile_layouts)[slide_no]
+    table = prs.slides[slide_no - 1].shapes[plan.main_table].table
+    cells = [cell for row in table.rows for cell in row.cells]
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for cell in cells:
+            _set_font(cell)
+        timings.append(time.perf_counter() - start)
+    result = summarize(timings)
+    result["cells"] = len(cells)
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """
+    Ratio of each latency figure to the same figure in `baseline` (>1 is slower).
+    """
+    def ratios(new, old, prefix=""):
+        out = {}
+        for key, value in new.items():
+            if isinstance(value, dict) and isinstance(old.get(key), dict):
+                out.update(ratios(value, old[key], f"{prefix}{key}."))
+            elif key.endswith("_ms") and old.get(key):
+                out[f"{prefix}{key}"] = round(value / old[key], 3)
+        return out
+
+    return ratios(
+        {k: results[k] for k in ("end_to_end", "micro")},
+        {k: baseline.get(k, {}) for k in ("end_to_end", "micro")},
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--scale", type=int, default=1, help="payload scale factor")
+    parser.add_argument("--slide-latency-ms", type=float, default=0.0)
+    parser.add_argument("--drive-latency-ms", type=float, default=0.0)
+    parser.add_argument("--micro-repeat", type=int, default=20)
+    parser.add_argument("--deck-cache", action="store_true", help="leave the deck cache on")
+    parser.add_argument("--update", action="store_true", help="refresh one deck in place")
+    parser.add_argument("--engine", choices=("pptx", "slides"), default="pptx")
+    parser.add_argument("--data", default=os.path.join(HERE, "sample_slide_data.json"))
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON results to compare against")
+    args = parser.parse_args()
+
+    with open(args.data) as f:
+        sample = {int(slide_no): content for slide_no, content in json.load(f).items()}
+    payloads = scale_payloads(sample, args.scale)
+
+    slides = FakeSlides(latency=args.drive_latency_ms / 1000)
+    # The Slides template is modelled from the same .pptx the pptx engine fills
+    template_path = os.environ.get("TEMPLATE_PATH", os.path.join(ROOT, "template.pptx"))
+    slides.add_pptx(SLIDES_TEMPLATE_ID, template_path)
+    drive = FakeDrive(latency=args.drive_latency_ms / 1000, slides=slides)
+    drive.add_file(SLIDES_TEMPLATE_ID, {"name": "Slides template"})
+    with SlideServer(payloads, latency=args.slide_latency_ms / 1000) as server:
+        app = import_app(server.url, drive, args.deck_cache, slides=slides, engine=args.engine)
+        app.SLIDE_NUMBERS = sorted(payloads)
+        end_to_end = bench_end_to_end(
+            app, drive, args.iterations, args.warmup, server=server, update=args.update
+        )
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "args": vars(args),
+            "payload_bytes": sum(len(json.dumps(p)) for p in payloads.values()),
+        },
+        "end_to_end": end_to_end,
+        "micro": {
+            "populate_slide": bench_populate_slide(app, payloads, args.micro_repeat),
+            "set_font": bench_set_font(app, min(payloads), args.micro_repeat),
+        },
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            results["compare"] = compare(results, json.load(f))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark the bulk table-fill engine against the per-cell python-pptx path.
+
+Both paths fill every layout in layouts.py with the sample slide data on a
+fresh copy of the template, and the resulting slide XML is compared to make
+sure they produce the same document.
+
+    python benchmarks/bench_table_fill.py --repeat 20
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from pptx.util import Pt  # noqa: E402
+
+from layouts import compile_layouts, lookup  # noqa: E402
+from normalize import normalize_slide  # noqa: E402
+from table_fill import RunStyle, fill_cells, fill_insights  # noqa: E402
+from template_cache import TemplateCache  # noqa: E402
+
+STYLE = RunStyle(font="Arial", size=8)
+
+
+def per_cell_fill(slide, plan, content):
+    """
+    The previous rendering path: cell.text plus set_font() per cell.
+    """
+    shapes = slide.shapes
+    if plan.main_table is not None:
+        table = shapes[plan.main_table].table
+        for path, cells in plan.cell_groups:
+            values = lookup(content, path)
+            for row, col, fmt, _ in cells:
+                cell = table.cell(row, col)
+                cell.text = fmt(values)
+                _set_font(cell)
+    if plan.insights_table is not None:
+        table = shapes[plan.insights_table].table
+        for row, title, narrative in plan.insights(content):
+            cell = table.cell(row, 0)
+            _set_font(cell)
+            paragraph = cell.text_frame.paragraphs[0]
+            run = paragraph.add_run()
+            run.text = title
+            run.font.bold = True
+            run.font.size = Pt(8)
+            run.font.name = "Arial"
+            run = paragraph.add_run()
+            run.text = f" {narrative}"
+            run.font.size = Pt(8)
+            run.font.name = "Arial"
+
+
+def _set_font(cell):
+    for paragraph in cell.text_frame.paragraphs:
+        for run in paragraph.runs:
+            run.font.name = "Arial"
+            run.font.size = Pt(8)
+
+
+def bulk_fill(slide, plan, content):
+    """
+    The bulk engine used by populate_slide().
+    """
+    shapes = slide.shapes
+    normalized = normalize_slide(content, plan, bands=False)
+    if plan.main_table is not None:
+        writes = zip(normalized.rows, normalized.columns, normalized.texts)
+        fill_cells(shapes[plan.main_table].table, writes, STYLE)
+    if plan.insights_table is not None:
+        fill_insights(shapes[plan.insights_table].table, normalized.insights, STYLE)
+
+
+def run(fill, template, plans, slide_data):
+    prs = template.checkout(slide_data.keys())
+    slides = {slide_no: prs.slides[slide_no - 1] for slide_no in slide_data}
+    start = time.perf_counter()
+    for slide_no, content in slide_data.items():
+        fill(slides[slide_no], plans[slide_no], content)
+    elapsed = time.perf_counter() - start
+    return elapsed, {slide_no: slide.part.blob for slide_no, slide in slides.items()}
+
+
+def load_sample_data(path):
+    with open(path) as f:
+        return {int(slide_no): content for slide_no, content in json.load(f).items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--template", default=os.path.join(os.path.dirname(HERE), "template.pptx"))
+    parser.add_argument("--data", default=os.path.join(HERE, "sample_slide_data.json"))
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    template = TemplateCache(args.template)
+    template.load()
+    plans = template.derive("layouts", compile_layouts)
+    slide_data = load_sample_data(args.data)
+
+    _, reference = run(per_cell_fill, template, plans, slide_data)
+    _, candidate = run(bulk_fill, template, plans, slide_data)
+    if reference != candidate:
+        differing = sorted(n for n in reference if reference[n] != candidate[n])
+        sys.exit(f"Bulk fill output differs from the per-cell path on slides {differing}")
+
+    results = {}
+    for name, fill in (("per_cell", per_cell_fill), ("bulk", bulk_fill)):
+        timings = [run(fill, template, plans, slide_data)[0] for _ in range(args.repeat)]
+        results[name] = {
+            "median_ms": round(statistics.median(timings) * 1000, 3),
+            "min_ms": round(min(timings) * 1000, 3),
+        }
+    results["speedup"] = round(results["per_cell"]["median_ms"] / results["bulk"]["median_ms"], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+"""
+Local stand-ins for Google Drive and the slide-data API used by benchmarks.
+
+FakeDrive implements the subset of the Drive v3 client main.py calls
+(resumable files().create and files().update, files().get, files().copy,
+files().delete, permissions().create and batch requests) and keeps
+everything in memory. FakeSlides is the matching Slides v1 client, with
+presentations modelled from a .pptx file. SlideServer answers slide-data requests, single or
+batched, from a dict of payloads on a loopback HTTP server; single-slide
+answers carry an ETag and honour If-None-Match.
+"""
+import copy
+import json
+import hashlib
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httplib2
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaUploadProgress
+
+
+class _Request:
+    def __init__(self, fn, latency):
+        self._fn = fn
+        self._latency = latency
+
+    def execute(self):
+        if self._latency:
+            time.sleep(self._latency)
+        return self._fn()
+
+
+class _Upload:
+    """
+    Resumable upload session: each next_chunk() consumes one media chunk.
+    """
+
+    def __init__(self, drive, body, media, latency, file_id=None):
+        self._drive = drive
+        self._body = body
+        self._media = media
+        self._latency = latency
+        self._file_id = file_id
+        self._offset = 0
+        self._chunks = []
+        self.resumable_uri = None
+
+    def next_chunk(self):
+        if self._latency:
+            time.sleep(self._latency)
+        if self.resumable_uri is None:
+            if self._file_id is not None:
+                self._drive._get(self._file_id)
+            self.resumable_uri = f"fake://upload/{id(self)}"
+        size = self._media.size()
+        chunk_size = self._media.chunksize()
+        if chunk_size < 0:
+            chunk_size = size
+        chunk = self._media.getbytes(self._offset, chunk_size)
+        self._chunks.append(chunk)
+        self._offset += len(chunk)
+        if self._offset < size:
+            return MediaUploadProgress(self._offset, size), None
+        return None, self._drive._store(self._body, b"".join(self._chunks), self._file_id)
+
+
+class _Files:
+    def __init__(self, drive):
+        self._drive = drive
+
+    def create(self, body=None, media_body=None, fields=None, **kwargs):
+        if media_body is not None and media_body.resumable():
+            return _Upload(self._drive, body, media_body, self._drive.latency)
+        content = b"" if media_body is None else media_body.getbytes(0, media_body.size())
+        return _Request(lambda: self._drive._store(body, content), self._drive.latency)
+
+    def update(self, fileId=None, body=None, media_body=None, fields=None, **kwargs):
+        return _Upload(self._drive, body, media_body, self._drive.latency, file_id=fileId)
+
+    def get(self, fileId=None, fields=None, **kwargs):
+        return _Request(lambda: self._drive._get(fileId), self._drive.latency)
+
+    def copy(self, fileId=None, body=None, fields=None, **kwargs):
+        return _Request(lambda: self._drive._copy(fileId, body), self._drive.latency)
+
+    def delete(self, fileId=None, **kwargs):
+        return _Request(lambda: self._drive._delete(fileId), self._drive.latency)
+
+
+class _Permissions:
+    def __init__(self, drive):
+        self._drive = drive
+
+    def create(self, fileId=None, body=None, **kwargs):
+        return _Request(lambda: self._drive._share(fileId, body), self._drive.latency)
+
+
+class _Batch:
+    def __init__(self, callback):
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, request_id=None, callback=None):
+        self._requests.append((request, request_id, callback or self._callback))
+
+    def execute(self):
+        # A batch costs one round trip however many calls it carries
+        latency = self._requests[0][0]._latency if self._requests else 0
+        if latency:
+            time.sleep(latency)
+        for request, request_id, callback in self._requests:
+            try:
+                response, exception = request._fn(), None
+            except Exception as e:
+                response, exception = None, e
+            callback(request_id, response, exception)
+
+
+class FakeDrive:
+    """
+    In-memory Drive v3 client. `latency` seconds are slept per API call.
+
+    Copying a file that is a presentation of `slides` (a FakeSlides) also
+    copies the presentation, keeping its object ids as Drive does.
+    """
+
+    def __init__(self, latency=0.0, slides=None):
+        self.latency = latency
+        self.slides = slides
+        self.files_by_id = {}
+        self.shared = {}
+        self.calls = 0
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def files(self):
+        return _Files(self)
+
+    def permissions(self):
+        return _Permissions(self)
+
+    def new_batch_http_request(self, callback=None):
+        return _Batch(callback)
+
+    def add_file(self, file_id, metadata=None, content=None):
+        """
+        Put a file with a chosen id in place, e.g. a template to copy.
+        """
+        with self._lock:
+            self.files_by_id[file_id] = {"metadata": dict(metadata or {}), "content": content}
+
+    def _store(self, body, content, file_id=None):
+        with self._lock:
+            self.calls += 1
+            if file_id is None:
+                self._created += 1
+                file_id = f"fake-{self._created}"
+                self.files_by_id[file_id] = {"metadata": {}}
+            self.files_by_id[file_id]["metadata"].update(body or {})
+            self.files_by_id[file_id]["content"] = content
+        return {"id": file_id}
+
+    def _get(self, file_id):
+        with self._lock:
+            self.calls += 1
+            if file_id not in self.files_by_id:
+                raise HttpError(httplib2.Response({"status": 404}), b"File not found", uri=file_id)
+        return {"id": file_id, "trashed": False}
+
+    def _copy(self, file_id, body):
+        self._get(file_id)
+        copied = self._store(body, self.files_by_id[file_id].get("content"))
+        if self.slides is not None and file_id in self.slides.presentations_by_id:
+            self.slides.presentations_by_id[copied["id"]] = copy.deepcopy(
+                self.slides.presentations_by_id[file_id]
+            )
+        return copied
+
+    def _delete(self, file_id):
+        self._get(file_id)
+        with self._lock:
+            del self.files_by_id[file_id]
+        if self.slides is not None:
+            self.slides.presentations_by_id.pop(file_id, None)
+        return ""
+
+    def _share(self, file_id, body):
+        with self._lock:
+            self.calls += 1
+            self.shared.setdefault(file_id, []).append(body)
+        return {"id": f"perm-{file_id}"}
+
+
+def _bad_request(message):
+    return HttpError(httplib2.Response({"status": 400}), message.encode(), uri="batchUpdate")
+
+
+def _py_index(text, index):
+    # Slides indexes count UTF-16 code units
+    count = 0
+    for i, ch in enumerate(text):
+        if count >= index:
+            return i
+        count += 2 if ord(ch) > 0xFFFF else 1
+    if count < index:
+        raise _bad_request(f"Index {index} is past the end of the text")
+    return len(text)
+
+
+def _text_body(text):
+    """
+    Render `text` as a Slides text body (every paragraph ends in a newline).
+    """
+    elements, index = [], 0
+    for paragraph in text.split("\n"):
+        end = index + len((paragraph + "\n").encode("utf-16-le")) // 2
+        elements.append({"startIndex": index, "endIndex": end, "paragraphMarker": {}})
+        elements.append(
+            {"startIndex": index, "endIndex": end, "textRun": {"content": paragraph + "\n"}}
+        )
+        index = end
+    return {"textElements": elements}
+
+
+class _Presentations:
+    def __init__(self, slides):
+        self._slides = slides
+
+    def get(self, presentationId=None, fields=None, **kwargs):
+        return _Request(lambda: self._slides._get(presentationId), self._slides.latency)
+
+    def batchUpdate(self, presentationId=None, body=None, **kwargs):
+        return _Request(
+            lambda: self._slides._batch_update(presentationId, body["requests"]),
+            self._slides.latency,
+        )
+
+
+class FakeSlides:
+    """
+    In-memory Slides v1 client. `latency` seconds are slept per API call.
+
+    A presentation is modelled as its slides' tables (cell text) and
+    speaker notes. batchUpdate applies deleteText, insertText,
+    updateTextStyle and deleteObject, and rejects what the real API would:
+    unknown objects, cells outside the table, deleting from empty text and
+    indexes past the end of the text. The whole batch fails atomically.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.presentations_by_id = {}
+        self.batch_updates = 0
+        self.requests = 0
+
+    def presentations(self):
+        return _Presentations(self)
+
+    def add_pptx(self, presentation_id, path):
+        """
+        Model the .pptx at `path` as presentation `presentation_id`.
+        """
+        from pptx import Presentation
+
+        slides = []
+        for n, slide in enumerate(Presentation(path).slides, start=1):
+            elements = []
+            for i, shape in enumerate(slide.shapes):
+                element = {"objectId": f"s{n}e{i}"}
+                if shape.has_table:
+                    element["cells"] = [
+                        [{"text": cell.text, "styles": []} for cell in row.cells]
+                        for row in shape.table.rows
+                    ]
+                elements.append(element)
+            notes = slide.notes_slide.notes_text_frame.text if slide.has_notes_slide else ""
+            slides.append(
+                {
+                    "objectId": f"s{n}",
+                    "elements": elements,
+                    "notes": {"objectId": f"s{n}notes", "text": notes},
+                }
+            )
+        self.presentations_by_id[presentation_id] = {"slides": slides}
+
+    def _get(self, presentation_id):
+        presentation = self.presentations_by_id.get(presentation_id)
+        if presentation is None:
+            raise HttpError(httplib2.Response({"status": 404}), b"Not found", uri=presentation_id)
+        slides = []
+        for slide in presentation["slides"]:
+            page_elements = []
+            for element in slide["elements"]:
+                if "cells" not in element:
+                    page_elements.append({"objectId": element["objectId"]})
+                    continue
+                rows = element["cells"]
+                page_elements.append(
+                    {
+                        "objectId": element["objectId"],
+                        "table": {
+                            "rows": len(rows),
+                            "columns": len(rows[0]) if rows else 0,
+                            "tableRows": [
+                                {"tableCells": [{"text": _text_body(c["text"])} for c in row]}
+                                for row in rows
+                            ],
+                        },
+                    }
+                )
+            notes = slide["notes"]
+            slides.append(
+                {
+                    "objectId": slide["objectId"],
+                    "pageElements": page_elements,
+                    "slideProperties": {
+                        "notesPage": {
+                            "notesProperties": {"speakerNotesObjectId": notes["objectId"]},
+                            "pageElements": [
+                                {
+                                    "objectId": notes["objectId"],
+                                    "shape": {"text": _text_body(notes["text"])},
+                                }
+                            ],
+                        }
+                    },
+                }
+            )
+        return {"presentationId": presentation_id, "slides": slides}
+
+    def _batch_update(self, presentation_id, requests):
+        if presentation_id not in self.presentations_by_id:
+            raise HttpError(httplib2.Response({"status": 404}), b"Not found", uri=presentation_id)
+        presentation = copy.deepcopy(self.presentations_by_id[presentation_id])
+        for request in requests:
+            (kind, args), = request.items()
+            if kind == "deleteObject":
+                kept = [s for s in presentation["slides"] if s["objectId"] != args["objectId"]]
+                if len(kept) == len(presentation["slides"]):
+                    raise _bad_request(f"Unknown object {args['objectId']}")
+                presentation["slides"] = kept
+                continue
+            target = self._text_target(presentation, args)
+            text = target["text"]
+            if kind == "deleteText":
+                if not text:
+                    raise _bad_request("The object has no text")
+                target["text"] = ""
+            elif kind == "insertText":
+                index = _py_index(text, args.get("insertionIndex", 0))
+                target["text"] = text[:index] + args["text"] + text[index:]
+            elif kind == "updateTextStyle":
+                text_range = args["textRange"]
+                if text_range["type"] == "FIXED_RANGE":
+                    start = _py_index(text, text_range["startIndex"])
+                    end = _py_index(text, text_range["endIndex"])
+                else:
+                    start, end = 0, len(text)
+                target.setdefault("styles", []).append((start, end, args["style"]))
+            else:
+                raise _bad_request(f"Unsupported request {kind}")
+        self.presentations_by_id[presentation_id] = presentation
+        self.batch_updates += 1
+        self.requests += len(requests)
+        return {"presentationId": presentation_id, "replies": [{} for _ in requests]}
+
+    def _text_target(self, presentation, args):
+        for slide in presentation["slides"]:
+            if slide["notes"]["objectId"] == args["objectId"]:
+                return slide["notes"]
+            for element in slide["elements"]:
+                if element["objectId"] != args["objectId"]:
+                    continue
+                location = args.get("cellLocation")
+                if "cells" not in element or location is None:
+                    raise _bad_request(f"Object {args['objectId']} has no text to edit")
+                try:
+                    return element["cells"][location["rowIndex"]][location["columnIndex"]]
+                except IndexError:
+                    raise _bad_request(f"Cell {location} is outside the table")
+        raise _bad_request(f"Unknown object {args['objectId']}")
+
+
+class SlideServer:
+    """
+    Loopback HTTP server answering {"slide_no"} and {"slide_nos"} requests.
+
+        with SlideServer(payloads, latency=0.05) as server:
+            os.environ["API_ENDPOINT_URL"] = server.url
+    """
+
+    def __init__(self, payloads, latency=0.0):
+        self.payloads = {str(slide_no): content for slide_no, content in payloads.items()}
+        self.latency = latency
+        self.requests = 0
+        self.not_modified = 0
+        self._bodies = {
+            slide_no: json.dumps(content).encode() for slide_no, content in self.payloads.items()
+        }
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def set_payload(self, slide_no, content):
+        """
+        Serve `content` for `slide_no` from now on.
+        """
+        self.payloads[str(slide_no)] = content
+        self._bodies[str(slide_no)] = json.dumps(content).encode()
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}/slides"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                if "slide_nos" in request:
+                    body = json.dumps(
+                        {n: server.payloads[n] for n in request["slide_nos"] if n in server.payloads}
+                    ).encode()
+                    etag = None
+                else:
+                    body = server._bodies.get(str(request.get("slide_no")))
+                    etag = body and f'"{hashlib.sha1(body).hexdigest()}"'
+                if body is None:
+                    self.send_error(404)
+                    return
+                if etag and self.headers.get("If-None-Match") == etag:
+                    server.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                if etag:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def scale_payloads(slide_data, scale):
+    """
+    Grow payloads shaped like hardcoded_data by `scale`.
+
+    Every region and metric dict gets `scale - 1` synthetic siblings and the
+    insight/driver/recommendation lists are repeated `scale` times. The data
+    tables grow by about scale**2 while the cells the layouts read are kept.
+    """
+    scaled = {}
+    for slide_no, content in slide_data.items():
+        content = copy.deepcopy(content)
+        data = content.get("data")
+        if isinstance(data, dict) and scale > 1:
+            for region, metrics in list(data.items()):
+                if isinstance(metrics, dict):
+                    for metric, values in list(metrics.items()):
+                        for k in range(1, scale):
+                            metrics[f"{metric} #{k}"] = copy.deepcopy(values)
+                for k in range(1, scale):
+                    data[f"{region} #{k}"] = copy.deepcopy(metrics)
+        for key in ("insights", "drivers", "recommendations"):
+            if isinstance(content.get(key), list):
+                content[key] = content[key] * scale
+        scaled[slide_no] = content
+    return scaled
@@ -0,0 +1,208 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(slide_data, template_digest, variant=None):
+    """
+    Return the cache key for rendering `slide_data` into the given template.
+
+    Payloads are normalized to canonical JSON (string keys, sorted, compact)
+    so that equal data always hashes the same regardless of key order or
+    whether slide numbers arrive as ints or strings. `variant` names render
+    options that change the output for the same data, e.g. "trimmed".
+    """
+    normalized = _canonical_json(
+        {str(slide_no): content for slide_no, content in slide_data.items()}
+    )
+    digest = hashlib.sha256()
+    digest.update(template_digest.encode("ascii"))
+    digest.update(b"\0")
+    if variant:
+        digest.update(variant.encode("utf-8"))
+        digest.update(b"\0")
+    digest.update(normalized.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def link_key(cache_key, file_id):
+    """
+    Return the key of the Drive file uploaded for `file_id` from the deck
+    with `cache_key`. Links are per file_id, so one caller's file is never
+    handed to another; the rendered bytes stay shared under `cache_key`.
+    """
+    return hashlib.sha256(f"{cache_key}\0{file_id}".encode("utf-8")).hexdigest()
+
+
+def payload_digest(content):
+    """
+    Return the SHA-256 of one slide payload in the same canonical JSON form,
+    so callers can tell whether the data changed without receiving it.
+    """
+    return hashlib.sha256(_canonical_json(content).encode("utf-8")).hexdigest()
+
+
+def _canonical_json(value):
+    return json.dumps(
+        value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+
+
+class DeckCache:
+    """
+    Content-addressed cache of rendered decks.
+
+    Maps a content hash to the rendered bytes, and a link_key() to the
+    Drive file id of an upload of those bytes for one file_id. The memory tier is an LRU bounded by `max_bytes`;
+    the optional disk tier under `directory` is bounded by `disk_max_bytes`
+    and evicts the least recently used files first.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, directory=None, disk_max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, key):
+        """
+        Return {"drive_file_id": ..., "content": ...} for `key`, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return dict(entry)
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["disk_hits"] += 1
+            self._put_memory(key, entry)
+        return dict(entry)
+
+    def put(self, key, drive_file_id=None, content=None):
+        """
+        Record the rendered bytes and/or Drive file id for `key`.
+        """
+        with self._lock:
+            entry = dict(self._entries.get(key) or {})
+            if drive_file_id is not None:
+                entry["drive_file_id"] = drive_file_id
+            if content is not None:
+                entry["content"] = content
+            self._put_memory(key, entry)
+        self._write_disk(key, entry)
+
+    def discard_drive_file(self, key):
+        """
+        Forget the Drive file for `key`, keeping any cached bytes.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.pop("drive_file_id", None)
+        if self.directory:
+            try:
+                os.remove(self._path(key, ".json"))
+            except OSError:
+                pass
+
+    def stats(self):
+        """
+        Return hit/miss counters and current sizes.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._size
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = (
+            round((stats["hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        )
+        return stats
+
+    def _put_memory(self, key, entry):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old.get("content") or b"")
+        size = len(entry.get("content") or b"")
+        if size > self.max_bytes:
+            # Too large for the memory tier; keep only the Drive file id
+            entry = {k: v for k, v in entry.items() if k != "content"}
+            size = 0
+        self._entries[key] = entry
+        self._size += size
+        while self._size > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted.get("content") or b"")
+            self._stats["evictions"] += 1
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, key + suffix)
+
+    def _read_disk(self, key):
+        if not self.directory:
+            return None
+        entry = {}
+        try:
+            with open(self._path(key, ".json")) as f:
+                entry.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        try:
+            with open(self._path(key, ".pptx"), "rb") as f:
+                entry["content"] = f.read()
+            os.utime(self._path(key, ".pptx"))
+        except OSError:
+            pass
+        return entry or None
+
+    def _write_disk(self, key, entry):
+        if not self.directory:
+            return
+        try:
+            if "drive_file_id" in entry:
+                with open(self._path(key, ".json"), "w") as f:
+                    json.dump({"drive_file_id": entry["drive_file_id"]}, f)
+            if entry.get("content") is not None and not os.path.exists(self._path(key, ".pptx")):
+                tmp_path = self._path(key, ".pptx.tmp")
+                with open(tmp_path, "wb") as f:
+                    f.write(entry["content"])
+                os.replace(tmp_path, self._path(key, ".pptx"))
+                self._evict_disk()
+        except OSError as e:
+            logger.error(f"Could not write deck cache entry {key}: {e}")
+
+    def _evict_disk(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pptx"):
+                stat = os.stat(os.path.join(self.directory, name))
+                files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            key = name[: -len(".pptx")]
+            for suffix in (".pptx", ".json"):
+                try:
+                    os.remove(self._path(key, suffix))
+                except OSError:
+                    pass
+            total -= size
+            with self._lock:
+                self._stats["evictions"] += 1
@@ -0,0 +1,231 @@
+import os
+import json
+import zlib
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from lxml import etree
+from pptx.oxml import parse_xml
+
+from deck_cache import content_hash
+
+logger = logging.getLogger(__name__)
+
+_COMPRESS_LEVEL = 1  # The XML compresses ~10x even at the fastest level
+
+
+def slide_digests(slide_data, template_digest):
+    """
+    Return {slide_no: digest} of each slide's payload rendered into the
+    given template.
+    """
+    return {
+        slide_no: content_hash({slide_no: content}, template_digest)
+        for slide_no, content in slide_data.items()
+    }
+
+
+def decode_slides(slides):
+    """
+    Parse the compressed (slide, notes) XML of history entry slides back
+    into elements for render_deck(reuse=...). Slides that do not parse are
+    left out, so they are populated again.
+    """
+    decoded = {}
+    for slide_no, pair in slides.items():
+        try:
+            decoded[slide_no] = tuple(
+                parse_xml(zlib.decompress(xml)) if xml is not None else None for xml in pair
+            )
+        except (zlib.error, etree.XMLSyntaxError) as e:
+            logger.error(f"Ignoring unreadable history XML of slide {slide_no}: {e}")
+    return decoded
+
+
+def _compress(element):
+    return zlib.compress(etree.tostring(element), _COMPRESS_LEVEL) if element is not None else None
+
+
+def _entry_size(entry):
+    return sum(len(xml) for pair in entry["slides"].values() for xml in pair if xml is not None)
+
+
+class DeckHistory:
+    """
+    The last deck published for each file_id, for in-place updates.
+
+    An entry records the Drive file, the template digest and trim option it
+    was rendered with, the digest of every populated slide's payload and the
+    rendered XML of those slides as (slide, notes) pairs of zlib-compressed
+    bytes; decode_slides() turns them back into elements. Live element trees
+    cost about 16 MB per deck, their compressed XML a few hundred KB.
+
+    The memory tier is an LRU bounded by `max_bytes` of compressed XML; with
+    a `directory` entries are also written to disk and survive restarts.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._size = 0
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "updates": 0,
+            "unchanged": 0,
+            "created": 0,
+            "slides_reused": 0,
+            "slides_rendered": 0,
+            "evictions": 0,
+        }
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def lock(self, file_id):
+        """
+        Serialize updates of the same file_id.
+        """
+        with self._lock:
+            entry = self._locks.get(file_id)
+            if entry is None:
+                entry = self._locks[file_id] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[file_id]
+
+    def get(self, file_id):
+        """
+        Return the entry for `file_id`, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(file_id)
+            if entry is not None:
+                self._entries.move_to_end(file_id)
+                return entry
+        entry = self._read_disk(file_id)
+        if entry is not None:
+            with self._lock:
+                self._put_memory(file_id, entry)
+        return entry
+
+    def put(self, file_id, drive_file_id, template_digest, trim, digests, slides):
+        """
+        Record the deck just published for `file_id`; `slides` maps slide
+        numbers to their rendered (slide, notes) elements.
+        """
+        entry = {
+            "drive_file_id": drive_file_id,
+            "template_digest": template_digest,
+            "trim": trim,
+            "digests": dict(digests),
+            "slides": {
+                slide_no: tuple(_compress(element) for element in pair)
+                for slide_no, pair in slides.items()
+            },
+        }
+        with self._lock:
+            self._put_memory(file_id, entry)
+        self._write_disk(file_id, entry)
+
+    def discard(self, file_id):
+        """
+        Forget `file_id`, e.g. after its Drive file was deleted.
+        """
+        with self._lock:
+            entry = self._entries.pop(file_id, None)
+            if entry is not None:
+                self._size -= _entry_size(entry)
+        if self.directory:
+            try:
+                os.remove(self._path(file_id))
+            except OSError:
+                pass
+
+    def record(self, **counts):
+        with self._lock:
+            for name, count in counts.items():
+                self._stats[name] += count
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._size
+        return stats
+
+    def _put_memory(self, file_id, entry):
+        old = self._entries.pop(file_id, None)
+        if old is not None:
+            self._size -= _entry_size(old)
+        size = _entry_size(entry)
+        if size > self.max_bytes:
+            # Too large for the memory tier; it is only read back from disk
+            return
+        self._entries[file_id] = entry
+        self._size += size
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= _entry_size(evicted)
+            self._stats["evictions"] += 1
+
+    def _path(self, file_id):
+        name = hashlib.sha256(str(file_id).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name + ".json")
+
+    def _read_disk(self, file_id):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(file_id)) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            slides = {
+                int(slide_no): tuple(
+                    zlib.compress(xml.encode("utf-8"), _COMPRESS_LEVEL) if xml else None
+                    for xml in pair
+                )
+                for slide_no, pair in stored["slides"].items()
+            }
+            return {
+                "drive_file_id": stored["drive_file_id"],
+                "template_digest": stored["template_digest"],
+                "trim": stored["trim"],
+                "digests": {int(slide_no): d for slide_no, d in stored["digests"].items()},
+                "slides": slides,
+            }
+        except (KeyError, ValueError, AttributeError) as e:
+            logger.error(f"Ignoring unreadable deck history for {file_id}: {e}")
+            return None
+
+    def _write_disk(self, file_id, entry):
+        if not self.directory:
+            return
+        stored = dict(entry)
+        stored["slides"] = {
+            str(slide_no): [
+                zlib.decompress(xml).decode("utf-8") if xml is not None else None
+                for xml in pair
+            ]
+            for slide_no, pair in entry["slides"].items()
+        }
+        stored["digests"] = {str(slide_no): d for slide_no, d in entry["digests"].items()}
+        path = self._path(file_id)
+        try:
+            with open(path + ".tmp", "w") as f:
+                json.dump(stored, f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.error(f"Could not write deck history for {file_id}: {e}")
@@ -0,0 +1,172 @@
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Drive accepts at most 100 calls in one batch request
+MAX_BATCH_SIZE = 100
+
+
+class DrivePool:
+    """
+    Pool of Drive API clients for concurrent use.
+
+    A googleapiclient service object wraps one httplib2 connection, which is
+    not thread-safe, so each thread leases its own client for the duration
+    of a call sequence. Clients are built lazily by `factory`, up to `size`
+    of them; every client is built from the same credentials object, so a
+    token refreshed by one is used by all.
+    """
+
+    def __init__(self, factory, size=8):
+        self.factory = factory
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def lease(self):
+        """
+        Borrow a client, building one if none is idle and the pool has room.
+        """
+        client = self._acquire()
+        try:
+            yield client
+        finally:
+            self._idle.put(client)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            build = self._created < self.size
+            if build:
+                self._created += 1
+        if not build:
+            return self._idle.get()
+        try:
+            return self.factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "created": self._created,
+            "idle": self._idle.qsize(),
+        }
+
+
+class _Grant:
+    __slots__ = ("file_id", "body", "wake", "finished", "result", "error")
+
+    def __init__(self, file_id, body):
+        self.file_id = file_id
+        self.body = body
+        # Set once the grant was sent, or when its caller is to send the next batch
+        self.wake = threading.Event()
+        self.finished = False
+        self.result = None
+        self.error = None
+
+
+class PermissionBatcher:
+    """
+    Coalesce permission grants from concurrent decks into batch requests.
+
+    The first caller sends its grant straight away (after an optional
+    `window` in seconds for others to join). Grants arriving while that
+    request is in flight are sent together in the next batch, so decks that
+    finish at the same time share one Drive round trip. A caller sends at
+    most one batch, the one holding its own grant: when a batch is done,
+    the caller of the oldest grant still queued sends the next.
+    """
+
+    def __init__(self, pool, window=0.0):
+        self.pool = pool
+        self.window = window
+        self.batches = 0
+        self.grants = 0
+        self._pending = []
+        self._flushing = False
+        self._lock = threading.Lock()
+
+    def grant(self, file_id, body):
+        """
+        Create permission `body` on `file_id`, returning the API response.
+        """
+        entry = _Grant(file_id, body)
+        with self._lock:
+            self._pending.append(entry)
+            leader = not self._flushing
+            self._flushing = True
+        if leader and self.window:
+            time.sleep(self.window)
+        while not entry.finished:
+            if leader:
+                self._flush()
+            else:
+                entry.wake.wait()
+                entry.wake.clear()
+                leader = True
+        if entry.error is not None:
+            raise entry.error
+        return entry.result
+
+    def _flush(self):
+        # Send the grants queued right now, which start with the caller's
+        # own, then hand the rest to the caller at the head of the queue
+        with self._lock:
+            batch = self._pending[:MAX_BATCH_SIZE]
+            del self._pending[:MAX_BATCH_SIZE]
+        try:
+            self._send(batch)
+        except Exception as e:
+            logger.error(f"Permission batch of {len(batch)} failed: {e}")
+            for entry in batch:
+                entry.error = e
+        with self._lock:
+            for entry in batch:
+                entry.finished = True
+                entry.wake.set()
+            if self._pending:
+                self._pending[0].wake.set()
+            else:
+                self._flushing = False
+
+    def _send(self, batch):
+        with self.pool.lease() as drive_service:
+            self.batches += 1
+            self.grants += len(batch)
+            if len(batch) == 1:
+                entry = batch[0]
+                entry.result = drive_service.permissions().create(
+                    fileId=entry.file_id, body=entry.body
+                ).execute()
+                return
+
+            def callback(request_id, response, exception):
+                entry = batch[int(request_id)]
+                entry.result = response
+                entry.error = exception
+
+            request = drive_service.new_batch_http_request(callback=callback)
+            for i, entry in enumerate(batch):
+                request.add(
+                    drive_service.permissions().create(
+                        fileId=entry.file_id, body=entry.body
+                    ),
+                    request_id=str(i),
+                )
+            request.execute()
+
+    def stats(self):
+        return {"batches": self.batches, "grants": self.grants}
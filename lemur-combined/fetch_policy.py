@@ -0,0 +1,180 @@
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from metrics import HEDGED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an upstream the circuit breaker considers down.
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Fail fast while an upstream is unhealthy.
+
+    After `failures` consecutive failures the breaker opens and every call
+    is rejected for `reset_after` seconds. Then one trial call is let
+    through (half-open) while other callers wait for its outcome: success
+    closes the breaker, failure opens it again. A trial that reports no
+    outcome within its `timeout` (or `reset_after` without one) is given
+    up on and the next caller makes a new one. `failures=0` disables the
+    breaker.
+    """
+
+    def __init__(self, name, failures=5, reset_after=30.0):
+        self.name = name
+        self.failures = failures
+        self.reset_after = reset_after
+        self.state = BREAKER_CLOSED
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._trial_until = None
+        self._lock = threading.Condition()
+        self._stats = {"opened": 0, "rejected": 0}
+
+    def before_call(self, timeout=None):
+        """
+        Raise CircuitOpenError unless a call may go ahead now, waiting up to
+        `timeout` seconds for the outcome of a trial call in progress.
+        """
+        if not self.failures:
+            return
+        stop = time.monotonic() + timeout if timeout is not None else None
+        with self._lock:
+            while self.state != BREAKER_CLOSED:
+                now = time.monotonic()
+                waited = now - self._opened_at
+                if self.state == BREAKER_OPEN and waited >= self.reset_after:
+                    self.state = BREAKER_HALF_OPEN
+                    self._trial_until = None
+                if self.state == BREAKER_HALF_OPEN:
+                    if self._trial_until is None or now >= self._trial_until:
+                        self._trial_until = now + (
+                            timeout if timeout is not None else self.reset_after
+                        )
+                        return
+                    remaining = self._trial_until - now
+                    if stop is not None:
+                        remaining = min(remaining, stop - now)
+                    if remaining > 0:
+                        self._lock.wait(remaining)
+                        continue
+                self._stats["rejected"] += 1
+                retry_after = max(0.0, self.reset_after - waited)
+                raise CircuitOpenError(
+                    f"{self.name} is unavailable, not retrying for {retry_after:.0f}s",
+                    retry_after,
+                )
+
+    def record_success(self):
+        if not self.failures:
+            return
+        with self._lock:
+            if self.state != BREAKER_CLOSED:
+                logger.info(f"Circuit breaker for {self.name} closed")
+                self._lock.notify_all()
+            self.state = BREAKER_CLOSED
+            self._consecutive = 0
+
+    def record_failure(self):
+        if not self.failures:
+            return
+        with self._lock:
+            self._consecutive += 1
+            if self.state == BREAKER_HALF_OPEN or (
+                self.state == BREAKER_CLOSED and self._consecutive >= self.failures
+            ):
+                self.state = BREAKER_OPEN
+                self._opened_at = time.monotonic()
+                self._stats["opened"] += 1
+                self._lock.notify_all()
+                logger.error(
+                    f"Circuit breaker for {self.name} opened after {self._consecutive} failures"
+                )
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["open"] = int(self.state != BREAKER_CLOSED)
+            stats["consecutive_failures"] = self._consecutive
+        return stats
+
+
+class LatencyWindow:
+    """
+    Recent successful call latencies per key, for hedging decisions.
+    """
+
+    def __init__(self, size=100, min_samples=20):
+        self.size = size
+        self.min_samples = min_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.size)
+            samples.append(seconds)
+
+    def percentile(self, key, pct):
+        """
+        Return the `pct` percentile latency for `key`, or None until
+        `min_samples` calls have been recorded.
+        """
+        with self._lock:
+            samples = list(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        samples.sort()
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def hedged_call(executor, fn, hedge_after, timeout, operation):
+    """
+    Run `fn()` on `executor`; if it has not finished after `hedge_after`
+    seconds, start a duplicate and return whichever succeeds first.
+
+    `timeout` bounds the whole wait. The losing call is left to finish on
+    its own; its result is discarded. An exception is only raised once
+    every started call has failed.
+    """
+    started = time.monotonic()
+    primary = executor.submit(fn)
+    done, _ = wait([primary], timeout=min(hedge_after, timeout))
+    if done:
+        return primary.result()
+
+    HEDGED_REQUESTS.labels(operation, "sent").inc()
+    pending = {primary, executor.submit(fn)}
+    error = None
+    while pending:
+        remaining = timeout - (time.monotonic() - started)
+        done, pending = wait(pending, timeout=max(0, remaining), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                if future is not primary:
+                    HEDGED_REQUESTS.labels(operation, "won").inc()
+                return future.result()
+            error = future.exception()
+    if error is not None:
+        raise error
+    raise TimeoutError(f"{operation} did not answer within {timeout:.1f}s")
@@ -0,0 +1,28 @@
+import gc
+import os
+import sys
+
+# Gunicorn settings for the container. With preload_app the master imports
+# main.py (parsing the template and compiling the layouts) once, and every
+# worker forks from it with that state already in memory.
+bind = f":{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get("GUNICORN_WORKERS", "1"))
+threads = int(os.environ.get("GUNICORN_THREADS", "1"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "1800"))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() == "true"
+
+
+def pre_fork(server, worker):
+    # Move everything allocated so far out of the collector's reach, so the
+    # garbage collector does not touch (and un-share) the preloaded pages.
+    gc.freeze()
+
+
+def post_request(worker, req, environ, resp):
+    # Replace a worker whose idle RSS drifted past ADMISSION_RECYCLE_DRIFT once
+    # it has no render running; the master starts a fresh one from the
+    # preloaded state.
+    main = sys.modules.get("main")
+    if main is not None and main.admission.should_recycle():
+        worker.log.info(f"Recycling worker {worker.pid} after its memory grew")
+        worker.alive = False
@@ -0,0 +1,208 @@
+import os
+import time
+import uuid
+import copy
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+STAGE_PENDING = "pending"
+STAGE_RUNNING = "running"
+STAGE_DONE = "done"
+STAGE_FAILED = "failed"
+STAGE_SKIPPED = "skipped"
+
+
+class JobQueueFull(Exception):
+    """
+    Raised when the render pool already has its maximum number of pending jobs.
+    """
+
+
+class JobStore(ABC):
+    """
+    Interface for job state backends.
+
+    Jobs are plain dicts; implementations must return copies so callers can
+    never mutate stored state directly.
+    """
+
+    @abstractmethod
+    def create(self, job):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, job_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update(self, job_id, **fields):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_stage(self, job_id, stage, state):
+        raise NotImplementedError
+
+
+class InMemoryJobStore(JobStore):
+    """
+    Process-local job store keeping at most `max_jobs` jobs.
+
+    When full, the oldest finished jobs are evicted first.
+    """
+
+    def __init__(self, max_jobs=1000):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, job):
+        with self._lock:
+            self._jobs[job["id"]] = copy.deepcopy(job)
+            self._evict()
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return copy.deepcopy(job) if job is not None else None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+                job["updated_at"] = time.time()
+
+    def update_stage(self, job_id, stage, state):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            now = time.time()
+            entry = job["stages"].setdefault(stage, {"state": STAGE_PENDING})
+            entry["state"] = state
+            if state == STAGE_RUNNING:
+                entry["started_at"] = now
+            else:
+                entry["finished_at"] = now
+                if "started_at" in entry:
+                    entry["duration"] = round(now - entry["started_at"], 3)
+            job["updated_at"] = now
+
+    def _evict(self):
+        overflow = len(self._jobs) - self.max_jobs
+        if overflow <= 0:
+            return
+        finished = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job["state"] in (JOB_SUCCEEDED, JOB_FAILED)
+        ]
+        for job_id in finished[:overflow]:
+            del self._jobs[job_id]
+
+
+# Registered job store backends, by name
+JOB_STORE_BACKENDS = {
+    "memory": InMemoryJobStore,
+}
+
+
+def register_job_store(name, factory):
+    """
+    Make a job store backend available to create_job_store().
+    """
+    JOB_STORE_BACKENDS[name] = factory
+
+
+def create_job_store(name=None):
+    """
+    Build the job store named by `name` or the JOB_STORE_BACKEND setting.
+    """
+    name = name or os.environ.get("JOB_STORE_BACKEND", "memory")
+    try:
+        factory = JOB_STORE_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown job store backend: {name}")
+    return factory()
+
+
+class JobRunner:
+    """
+    Bounded background worker pool that runs jobs and records their progress.
+    """
+
+    def __init__(self, store, max_workers=2, max_pending=20):
+        self.store = store
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="render-job"
+        )
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, stages=(), params=None):
+        """
+        Queue `fn(*args, progress=...)` and return the new job id.
+
+        `progress(stage, state)` records per-stage progress on the job. The
+        return value of `fn` is stored as the job result.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(
+                    f"Render queue is full ({self.max_pending} pending jobs)"
+                )
+            self._pending += 1
+
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "state": JOB_QUEUED,
+            "params": params,
+            "stages": {stage: {"state": STAGE_PENDING} for stage in stages},
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        self.store.create(job)
+        try:
+            self._executor.submit(self._run, job["id"], fn, args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        return job["id"]
+
+    def _run(self, job_id, fn, args):
+        current = {}
+
+        def progress(stage, state):
+            if state == STAGE_RUNNING:
+                current["stage"] = stage
+            else:
+                current.pop("stage", None)
+            self.store.update_stage(job_id, stage, state)
+
+        self.store.update(job_id, state=JOB_RUNNING)
+        try:
+            result = fn(*args, progress=progress)
+            self.store.update(job_id, state=JOB_SUCCEEDED, result=result)
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            if "stage" in current:
+                self.store.update_stage(job_id, current["stage"], STAGE_FAILED)
+            self.store.update(job_id, state=JOB_FAILED, error=str(e))
+        finally:
+            with self._lock:
+                self._pending -= 1
@@ -0,0 +1,329 @@
+import json
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Placeholders in a grid's data path, replaced by the row and column keys
+ROW = "{row}"
+COLUMN = "{column}"
+
+
+def value(key):
+    """
+    Cell formatter writing a single field of the looked-up dict.
+    """
+    def fmt(data):
+        return data.get(key, "")
+    return fmt
+
+
+def value_with_paren(key, paren_key):
+    """
+    Cell formatter writing "<key> (<paren_key>)", or "" if both are empty.
+    """
+    def fmt(data):
+        if data.get(key) or data.get(paren_key):
+            return f"{data.get(key, '')} ({data.get(paren_key, '')})"
+        return ""
+    return fmt
+
+
+SALES_REGIONS = ["NORTHAM", "LATAM", "EMEA", "JAPAC", "US PUBLIC SECTOR", "GLOBAL"]
+SALES_CELLS = [
+    {"offset": 1, "format": value_with_paren("QTD", "Attain")},
+    # Coloured by YoY band when YOY_COLORS is on (see normalize.BANDS)
+    {"offset": 2, "format": value("YoY"), "band": "yoy"},
+]
+GCP_METRICS = [
+    ("Direct Named", "QSO"),
+    ("Direct Named", "Pipeline"),
+    ("Startup", "QSO"),
+    ("Startup", "Pipeline"),
+    ("SMB", "QSO"),
+    ("SMB", "Pipeline"),
+    ("Partner", "Pipeline"),
+    ("GCP Direct QSOs", "QSO"),
+    ("GCP Direct + Partner Pipe", "Pipeline"),
+]
+GWS_METRICS = [
+    ("Direct Named", "QSO"),
+    ("Direct Named", "Pipeline"),
+    ("Partner", "Pipeline"),
+    ("GWS Direct QSOs", "QSO"),
+    ("GWS Direct + Partner Pipe", "Pipeline"),
+]
+BRAND_REGIONS = ["EMEA", "TOTAL", "JAPAC", "LATAM", "NORTHAM"]
+BRAND_CELLS = [
+    {"offset": 1, "format": value("value")},
+    {"offset": 2, "format": value("QoQ")},
+]
+
+MAIN_TABLE = {"min_rows": 5}
+INSIGHTS_TABLE = {"max_rows": 4}
+
+SALES_INSIGHTS = {
+    "mode": "list",
+    "path": ("insights",),
+    "drivers": ("drivers",),
+    "decode_json": True,
+    "notes": ("recommendations",),
+}
+
+# Declarative layout of every slide we populate.
+#
+# "grid" describes the main table: row i / column j of the grid is written
+# at table row start_row + i and column offset + j * col_stride, from the
+# dict found by walking `path` (with ROW/COLUMN substituted) in the payload.
+# "insights" describes how the insight cells are filled.
+SLIDE_LAYOUTS = {
+    14: {
+        "tables": {"main": MAIN_TABLE, "insights": INSIGHTS_TABLE},
+        "grid": {
+            "path": ("data", COLUMN, ROW),
+            "rows": GCP_METRICS,
+            "columns": SALES_REGIONS,
+            "start_row": 3,
+            "col_stride": 2,
+            "cells": SALES_CELLS,
+        },
+        "insights": SALES_INSIGHTS,
+    },
+    15: {
+        "tables": {"main": MAIN_TABLE, "insights": INSIGHTS_TABLE},
+        "grid": {
+            "path": ("data", COLUMN, ROW),
+            "rows": GCP_METRICS,
+            "columns": SALES_REGIONS,
+            "start_row": 3,
+            "col_stride": 2,
+            "cells": SALES_CELLS,
+        },
+        "insights": SALES_INSIGHTS,
+    },
+    16: {
+        "tables": {"main": MAIN_TABLE, "insights": INSIGHTS_TABLE},
+        "grid": {
+            "path": ("data", COLUMN, ROW),
+            "rows": GWS_METRICS,
+            "columns": SALES_REGIONS,
+            "start_row": 3,
+            "col_stride": 2,
+            "cells": SALES_CELLS,
+        },
+        "insights": SALES_INSIGHTS,
+    },
+    17: {
+        "tables": {"main": MAIN_TABLE, "insights": INSIGHTS_TABLE},
+        "grid": {
+            "path": ("data", COLUMN, ROW),
+            "rows": GWS_METRICS,
+            "columns": SALES_REGIONS,
+            "start_row": 3,
+            "col_stride": 2,
+            "cells": SALES_CELLS,
+        },
+        "insights": SALES_INSIGHTS,
+    },
+    23: {
+        "tables": {"main": MAIN_TABLE, "insights": INSIGHTS_TABLE},
+        "grid": {
+            "path": ("data", COLUMN, ROW),
+            "rows": [("Ticket Volume",), ("SLA Adherence",), ("Marketer Satisfaction",)],
+            "columns": ["NORTHAM", "GLOBAL", "LATAM", "EMEA", "APAC", "JAPAN", "PUBLIC SECTOR", "TOTAL"],
+            "start_row": 2,
+            "col_stride": 2,
+            "cells": [
+                {"offset": 1, "format": value("Q1")},
+                {"offset": 2, "format": value("Chg")},
+                # YTD only exists for the TOTAL column
+                {"offset": 3, "format": value("YTD"), "columns": ["TOTAL"]},
+            ],
+        },
+        "insights": SALES_INSIGHTS,
+    },
+    38: {
+        "tables": {"main": MAIN_TABLE, "insights": INSIGHTS_TABLE},
+        "grid": {
+            "path": ("data", ROW, COLUMN),
+            "rows": [("Consideration",), ("AI Perception",)],
+            "columns": BRAND_REGIONS,
+            "start_row": 3,
+            "col_stride": 2,
+            "cells": BRAND_CELLS,
+        },
+        "insights": {"mode": "groups", "path": ("insights",)},
+    },
+    39: {
+        "tables": {"main": MAIN_TABLE, "insights": INSIGHTS_TABLE},
+        "grid": {
+            "path": ("data", ROW, COLUMN),
+            "rows": [("Unaided Awareness",), ("Familiarity",)],
+            "columns": BRAND_REGIONS,
+            "start_row": 3,
+            "col_stride": 2,
+            "cells": BRAND_CELLS,
+        },
+        "insights": {"mode": "list", "path": ("insights", "leading_indicators")},
+    },
+}
+
+# A compiled slide layout.
+#
+# main_table / insights_table are indexes into slide.shapes (or None).
+# cell_groups is a tuple of (path, ((row, col, format, band), ...)): every
+# dict looked up by `path` feeds all of its cell writes, and band names the
+# colour band of the cell (or None). insights(content)
+# returns the (row, title, narrative) triples to write into the insights
+# table, and notes is the payload path of the speaker-notes text (or None).
+SlidePlan = namedtuple(
+    "SlidePlan", ["main_table", "insights_table", "cell_groups", "insights", "notes"]
+)
+
+
+def lookup(content, path):
+    """
+    Walk `path` through nested dicts, returning {} if any key is missing.
+    """
+    for key in path:
+        if not isinstance(content, dict):
+            return {}
+        content = content.get(key, {})
+    return content
+
+
+def compile_layouts(prs, layouts=None):
+    """
+    Compile the layout specs against the template into {slide_no: SlidePlan}.
+
+    Table selectors are resolved to shape indexes and every cell coordinate
+    is checked against the template's table dimensions once, here, so that
+    rendering is a straight loop over precomputed writes.
+    """
+    layouts = SLIDE_LAYOUTS if layouts is None else layouts
+    plans = {}
+    for slide_no, spec in layouts.items():
+        if not 0 < slide_no <= len(prs.slides):
+            logger.error(f"Layout for slide {slide_no} is out of range for the template")
+            continue
+        plans[slide_no] = _compile_slide(prs.slides[slide_no - 1], slide_no, spec)
+    return plans
+
+
+def _select_table(tables, selector):
+    index = None
+    for shape_index, table in tables:
+        rows = len(table.rows)
+        if rows < selector.get("min_rows", 0):
+            continue
+        if rows > selector.get("max_rows", rows):
+            continue
+        index = shape_index  # The last matching table wins
+    return index
+
+
+def _compile_slide(slide, slide_no, spec):
+    tables = [
+        (shape_index, shape.table)
+        for shape_index, shape in enumerate(slide.shapes)
+        if shape.has_table
+    ]
+    table_by_index = dict(tables)
+    main_table = _select_table(tables, spec["tables"]["main"])
+    insights_table = _select_table(tables, spec["tables"]["insights"])
+
+    cell_groups = ()
+    if main_table is not None and "grid" in spec:
+        cell_groups = _compile_grid(table_by_index[main_table], slide_no, spec["grid"])
+
+    insights = _no_insights
+    notes = None
+    if insights_table is not None and "insights" in spec:
+        rows = len(table_by_index[insights_table].rows)
+        insights = _compile_insights(spec["insights"], rows)
+        notes = spec["insights"].get("notes")
+
+    return SlidePlan(main_table, insights_table, cell_groups, insights, notes)
+
+
+def _expand_path(path, row_key, column_key):
+    expanded = []
+    for part in path:
+        if part == ROW:
+            expanded.extend(row_key)
+        elif part == COLUMN:
+            expanded.append(column_key)
+        else:
+            expanded.append(part)
+    return tuple(expanded)
+
+
+def _compile_grid(table, slide_no, grid):
+    n_rows, n_cols = len(table.rows), len(table.columns)
+    groups = []
+    for i, row_key in enumerate(grid["rows"]):
+        for j, column_key in enumerate(grid["columns"]):
+            writes = []
+            for cell in grid["cells"]:
+                if "columns" in cell and column_key not in cell["columns"]:
+                    continue
+                row = grid["start_row"] + i
+                col = cell["offset"] + j * grid["col_stride"]
+                if row >= n_rows or col >= n_cols:
+                    raise ValueError(
+                        f"Layout for slide {slide_no} writes cell ({row}, {col}) "
+                        f"outside its {n_rows}x{n_cols} table"
+                    )
+                writes.append((row, col, cell["format"], cell.get("band")))
+            groups.append((_expand_path(grid["path"], row_key, column_key), tuple(writes)))
+    return tuple(groups)
+
+
+def _no_insights(content):
+    return []
+
+
+def _compile_insights(spec, table_rows):
+    path = spec["path"]
+
+    if spec["mode"] == "groups":
+        # {category: [[insight, ...], ...]}; row is group index * group size + position
+        def extract(content):
+            triples = []
+            for category_insights in lookup(content, path).values():
+                if not isinstance(category_insights, list):
+                    continue
+                for i, group in enumerate(category_insights):
+                    if not isinstance(group, list):
+                        continue
+                    for j, insight in enumerate(group):
+                        row = i * len(group) + j
+                        if isinstance(insight, dict) and row < table_rows:
+                            triples.append(
+                                (row, insight.get("title", ""), insight.get("narrative", ""))
+                            )
+            return triples
+        return extract
+
+    drivers_path = spec.get("drivers")
+    decode_json = spec.get("decode_json", False)
+
+    def extract(content):
+        insights = lookup(content, path) or []
+        count = len(insights)
+        if drivers_path is not None:
+            # Loop through the longer of the drivers and insights lists
+            count = max(count, len(lookup(content, drivers_path) or []))
+        triples = []
+        for i in range(min(count, table_rows)):
+            insight = insights[i] if i < len(insights) else ""
+            if isinstance(insight, str) and decode_json:
+                try:
+                    insight = json.loads(insight)
+                except json.JSONDecodeError as e:
+                    logger.error(f"Error parsing insight string: {e}")
+                    insight = {}
+            if isinstance(insight, dict):
+                triples.append((i, insight.get("title", ""), insight.get("narrative", "")))
+        return triples
+    return extract
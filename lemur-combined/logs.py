@@ -0,0 +1,153 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+# Logging configuration
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()
+LOG_ASYNC = os.environ.get("LOG_ASYNC", "true").lower() == "true"
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.01"))
+LOG_MAX_FIELD_CHARS = int(os.environ.get("LOG_MAX_FIELD_CHARS", "2048"))
+
+# Pass as `extra=SAMPLED` for high-volume records; only LOG_SAMPLE_RATE of
+# them are emitted.
+SAMPLED = {"sampled": True}
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message",
+    "asctime",
+    "sampled",
+}
+
+_listener = None
+
+
+class Truncated:
+    """
+    Log argument rendered lazily and cut to LOG_MAX_FIELD_CHARS.
+
+    Wrap large bodies (payloads, responses) in this and pass it as a %-style
+    argument, so nothing is stringified unless the record is emitted.
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit=None):
+        self.value = value
+        self.limit = LOG_MAX_FIELD_CHARS if limit is None else limit
+
+    def __str__(self):
+        value = self.value
+        if isinstance(value, bytes):
+            # Never decode more than we are going to print
+            text = value[: self.limit * 4].decode("utf-8", errors="replace")
+            size = len(value)
+        else:
+            text = value if isinstance(value, str) else str(value)
+            size = len(text)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}... [truncated, {size} total]"
+
+
+class SampleFilter(logging.Filter):
+    """
+    Drop all but `rate` of the records logged with `extra=SAMPLED`.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if getattr(record, "sampled", False):
+            return random.random() < self.rate
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, in the shape Cloud Logging parses from stdout.
+    """
+
+    def format(self, record):
+        entry = {
+            "severity": record.levelname,
+            "message": record.getMessage(),
+            "logger": record.name,
+            "time": datetime.datetime.fromtimestamp(
+                record.created, tz=datetime.timezone.utc
+            ).isoformat(),
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Queue records unformatted so the listener thread does all the work.
+
+    The stock QueueHandler renders the message on the calling thread; here
+    that is left to the listener, so log arguments must not be mutated after
+    the call (payloads and responses never are).
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def configure_logging():
+    """
+    Install the root handler: JSON (or text) records written by a background
+    thread, with sampled records filtered out before they are queued.
+    """
+    global _listener
+    handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(
+            logging.Formatter("%(levelname)s:%(name)s:%(message)s")
+        )
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.setLevel(LOG_LEVEL)
+
+    if LOG_ASYNC:
+        queue_handler = _DeferredQueueHandler(queue.SimpleQueue())
+        queue_handler.addFilter(SampleFilter(LOG_SAMPLE_RATE))
+        root.addHandler(queue_handler)
+        _listener = QueueListener(queue_handler.queue, handler)
+        _listener.start()
+        atexit.register(_stop_listener)
+        # Threads do not survive fork (e.g. gunicorn --preload); restart
+        # the writer in each worker.
+        os.register_at_fork(after_in_child=_restart_listener)
+    else:
+        handler.addFilter(SampleFilter(LOG_SAMPLE_RATE))
+        root.addHandler(handler)
+
+
+def _stop_listener():
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def _restart_listener():
+    if _listener is not None:
+        _listener._thread = None
+        _listener.start()
@@ -1,27 +1,62 @@
+import io
 import os
-import re
+import math
+import queue
 import logging
-import json
-import requests
-from flask import Flask, request, jsonify
-from google.auth import default
-from googleapiclient.discovery import build
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, request, jsonify, url_for
 import time
-from pptx import Presentation
-from pptx.util import Pt
-from pptx.dml.color import RGBColor
-from googleapiclient.http import MediaFileUpload
-from flasgger import Swagger
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
+from slide_fetch import breaker, fetch_all_slide_data, slide_cache
+from fetch_policy import CircuitOpenError
+from admission import AdmissionRejected, MemoryAdmission, container_memory_limit
+from template_cache import TemplateCache
+from deck_cache import DeckCache, content_hash, link_key, payload_digest
+from deck_history import DeckHistory, decode_slides, slide_digests
+from layouts import compile_layouts
+from render import YOY_COLORS, render_deck, use_template
+from normalize import YOY_HIGH, YOY_LOW
+from slides_render import SlidesTemplate
+from batch import RenderPool
+from logs import Truncated, configure_logging
+from responses import dumps, json_response
+from apidocs import LazySwagger
+from metrics import (
+    REQUESTS,
+    STARTUP_SECONDS,
+    StatsCollector,
+    record_retry,
+    register_collector,
+    render_metrics,
+    timed_stage,
+)
+from drive_pool import DrivePool, PermissionBatcher
+from jobs import (
+    JOB_QUEUED,
+    STAGE_DONE,
+    STAGE_RUNNING,
+    STAGE_SKIPPED,
+    JobQueueFull,
+    JobRunner,
+    create_job_store,
+)
 
 # from google.oauth2 import service_account
 
 # Flask app
 app = Flask(__name__)
-swagger = Swagger(app)
+# flasgger is only imported on the first /apidocs request
+swagger = None
+if os.environ.get("SWAGGER_ENABLED", "true").lower() == "true":
+    swagger = LazySwagger(app)
+    app.wsgi_app = swagger
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
+_init_started = time.perf_counter()
 
 # Google Drive API setup
 SCOPES = [
@@ -32,29 +67,215 @@ SCOPES = [
 # SERVICE_ACCOUNT_FILE = '/app/service-account.json'  # Update with your file path
 # creds = service_account.Credentials.from_service_account_file(
 #     SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-creds, project = default(scopes=SCOPES)
-drive_service = build("drive", "v3", credentials=creds)
+# Credentials and Drive clients are created on first use, not at import, so
+# workers start without any metadata-server or token round trips
+_creds = None
+_creds_lock = threading.Lock()
 
-def fetch_slide_data_with_retry(api_url, slide_no, retries=3):
-    attempt = 0
-    while attempt < retries:
-        try:
-            response = requests.post(
-                api_url, json={"slide_no": str(slide_no)}, timeout=3600
-            )
-            logger.info(
-                f"API response status code for slide {slide_no}: {response.status_code}"
-            )
-            logger.info(f"API response content for slide {slide_no}: {response.text}")
-            response.raise_for_status()  # Raise an exception for HTTP errors
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Attempt {attempt + 1} failed with error: {e}")
-            attempt += 1
-            time.sleep(2**attempt)  # Exponential backoff
-    raise Exception(
-        f"Failed to fetch slide data for slide {slide_no} after several retries"
+def get_credentials():
+    """
+    Return the application default credentials, resolving them on first use.
+    """
+    global _creds
+    if _creds is None:
+        with _creds_lock:
+            if _creds is None:
+                from google.auth import default
+
+                _creds, _ = default(scopes=SCOPES)
+    return _creds
+
+def build_drive_client():
+    """
+    Build a Drive v3 client from the discovery document bundled with
+    google-api-python-client, without fetching it over the network.
+    """
+    from googleapiclient.discovery import build
+
+    return build(
+        "drive",
+        "v3",
+        credentials=get_credentials(),
+        static_discovery=True,
+        cache_discovery=False,
+    )
+
+def build_slides_client():
+    """
+    Build a Slides v1 client from the bundled discovery document.
+    """
+    from googleapiclient.discovery import build
+
+    return build(
+        "slides",
+        "v1",
+        credentials=get_credentials(),
+        static_discovery=True,
+        cache_discovery=False,
+    )
+
+# One Drive client per concurrent caller; their HTTP transports are not thread-safe
+DRIVE_POOL_SIZE = int(os.environ.get("DRIVE_POOL_SIZE", "8"))
+DRIVE_PERMISSION_BATCH_WINDOW = float(
+    os.environ.get("DRIVE_PERMISSION_BATCH_WINDOW", "0")
+)
+drive_pool = DrivePool(build_drive_client, size=DRIVE_POOL_SIZE)
+permission_batcher = PermissionBatcher(
+    drive_pool, window=DRIVE_PERMISSION_BATCH_WINDOW
+)
+
+# Render engines: "pptx" fills template.pptx locally and uploads the file,
+# "slides" copies a Google Slides template and fills it with one batchUpdate
+RENDER_ENGINES = ("pptx", "slides")
+RENDER_ENGINE_DEFAULT = os.environ.get("RENDER_ENGINE", "pptx")
+SLIDES_TEMPLATE_ID = os.environ.get("SLIDES_TEMPLATE_ID")
+slides_pool = DrivePool(build_slides_client, size=DRIVE_POOL_SIZE)
+slides_template = None
+if SLIDES_TEMPLATE_ID:
+    slides_template = SlidesTemplate(
+        SLIDES_TEMPLATE_ID,
+        slides_pool,
+        refresh_after=float(os.environ.get("SLIDES_TEMPLATE_REFRESH", "300")),
+    )
+
+# Parse the template once per worker; requests get cheap copies of it
+TEMPLATE_PATH = os.environ.get("TEMPLATE_PATH", "template.pptx")
+template_cache = TemplateCache(TEMPLATE_PATH)
+template_cache.load()
+template_cache.derive("layouts", compile_layouts)
+use_template(template_cache)
+
+PPTX_MIMETYPE = (
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+)
+# Resumable upload chunk size; Drive requires a multiple of 256 KiB
+UPLOAD_CHUNK_SIZE = int(os.environ.get("DRIVE_UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+SLIDE_NUMBERS = [14, 15, 16, 17, 23, 38, 39]
+# Leave unpopulated template slides out of the deck unless a request says otherwise
+DECK_TRIM_DEFAULT = os.environ.get("DECK_TRIM_DEFAULT", "false").lower() == "true"
+
+# Content-addressed cache of rendered decks, keyed by slide data + template,
+# and of the Drive file uploaded from them for each file_id
+deck_cache = None
+if os.environ.get("DECK_CACHE_ENABLED", "true").lower() == "true":
+    deck_cache = DeckCache(
+        max_bytes=int(os.environ.get("DECK_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        directory=os.environ.get("DECK_CACHE_DIR") or None,
+        disk_max_bytes=int(os.environ.get("DECK_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024))),
+    )
+register_collector(
+    StatsCollector(
+        "lemur_drive_permission", permission_batcher.stats, counters=("batches", "grants")
+    )
+)
+if deck_cache is not None:
+    register_collector(
+        StatsCollector(
+            "lemur_deck_cache",
+            deck_cache.stats,
+            counters=("hits", "disk_hits", "misses", "evictions"),
+        )
+    )
+register_collector(
+    StatsCollector("lemur_slide_breaker", breaker.stats, counters=("opened", "rejected"))
+)
+if slide_cache is not None:
+    register_collector(
+        StatsCollector(
+            "lemur_slide_cache",
+            slide_cache.stats,
+            counters=(
+                "hits",
+                "stale_hits",
+                "misses",
+                "coalesced",
+                "revalidated",
+                "refreshes",
+                "refresh_errors",
+                "evictions",
+            ),
+        )
+    )
+# Check that a cached Drive file still exists before handing out its link
+DECK_CACHE_VERIFY = os.environ.get("DECK_CACHE_VERIFY", "true").lower() == "true"
+
+# Last deck published per file_id, so "update" requests can refresh it in place
+DECK_UPDATE_DEFAULT = os.environ.get("DECK_UPDATE_DEFAULT", "false").lower() == "true"
+deck_history = None
+if os.environ.get("DECK_HISTORY_ENABLED", "true").lower() == "true":
+    deck_history = DeckHistory(
+        max_bytes=int(os.environ.get("DECK_HISTORY_MAX_BYTES", str(16 * 1024 * 1024))),
+        directory=os.environ.get("DECK_HISTORY_DIR") or None,
     )
+    register_collector(
+        StatsCollector(
+            "lemur_deck_history",
+            deck_history.stats,
+            counters=(
+                "updates",
+                "unchanged",
+                "created",
+                "slides_reused",
+                "slides_rendered",
+                "evictions",
+            ),
+        )
+    )
+
+# Time budget of one deck: the slide fetch may use GENERATE_FETCH_SHARE of it
+# and the Drive upload whatever is left once the deck is rendered. The default
+# is the gunicorn worker timeout, which already bounded a synchronous request.
+GENERATE_DEADLINE = float(os.environ.get("GENERATE_DEADLINE", "1800"))
+GENERATE_FETCH_SHARE = float(os.environ.get("GENERATE_FETCH_SHARE", "0.5"))
+
+# Memory admission control for /generate renders. The budget defaults to
+# ADMISSION_MEMORY_FRACTION of the container's memory limit, shared between
+# the gunicorn workers; synchronous requests wait ADMISSION_MAX_WAIT seconds
+# for room before they are answered 503, background jobs until their deadline.
+ADMISSION_MAX_WAIT = float(os.environ.get("ADMISSION_MAX_WAIT", "10"))
+_memory_budget = int(os.environ.get("ADMISSION_MEMORY_BUDGET", "0")) or None
+if _memory_budget is None and container_memory_limit() is not None:
+    _memory_budget = int(
+        container_memory_limit()
+        * float(os.environ.get("ADMISSION_MEMORY_FRACTION", "0.8"))
+        / int(os.environ.get("GUNICORN_WORKERS", "1"))
+    )
+admission = MemoryAdmission(
+    budget=_memory_budget,
+    estimate=int(os.environ.get("ADMISSION_RENDER_ESTIMATE", str(128 * 1024 * 1024))),
+    recycle_drift=int(os.environ.get("ADMISSION_RECYCLE_DRIFT", "0")),
+)
+register_collector(
+    StatsCollector("lemur_admission", admission.stats, counters=("admitted", "queued", "rejected"))
+)
+
+# How much of the slide data /generate echoes back as "api_data": none, a
+# digest per slide, or full
+API_DATA_MODES = ("none", "digest", "full")
+GENERATE_API_DATA_DEFAULT = os.environ.get("GENERATE_API_DATA", "none")
+
+# Background render pool for asynchronous /generate requests
+GENERATE_STAGES = ("fetch", "render", "upload", "share")
+GENERATE_ASYNC_DEFAULT = os.environ.get("GENERATE_ASYNC_DEFAULT", "false").lower() == "true"
+job_store = create_job_store()
+job_runner = JobRunner(
+    job_store,
+    max_workers=int(os.environ.get("RENDER_WORKERS", "2")),
+    max_pending=int(os.environ.get("RENDER_MAX_PENDING", "20")),
+)
+
+# Multi-deck /generate/batch: rendering runs in a process pool on every core
+# while finished decks are uploaded from a thread pool
+BATCH_MAX_DECKS = int(os.environ.get("BATCH_MAX_DECKS", "100"))
+render_pool = RenderPool(
+    TEMPLATE_PATH,
+    max_workers=int(os.environ.get("RENDER_PROCESSES", "0")) or None,
+    start_method=os.environ.get("RENDER_START_METHOD", "forkserver"),
+)
+upload_executor = ThreadPoolExecutor(
+    max_workers=DRIVE_POOL_SIZE, thread_name_prefix="batch-upload"
+)
 
 # Hardcoded data for slides
 hardcoded_data = {
@@ -82,6 +303,37 @@ def health_check():
     """
     return jsonify({"status": "healthy"}), 200
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Prometheus metrics endpoint.
+    ---
+    responses:
+      200:
+        description: Stage timings, retry counters and payload sizes in Prometheus text format
+    """
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    """
+    Deck cache statistics.
+    ---
+    responses:
+      200:
+        description: >
+          Hit/miss counters and size of the deck cache, with those of the
+          slide data cache under "slide_data"
+    """
+    stats = {"enabled": False}
+    if deck_cache is not None:
+        stats = dict(deck_cache.stats(), enabled=True)
+    stats["slide_data"] = {"enabled": False}
+    if slide_cache is not None:
+        stats["slide_data"] = dict(slide_cache.stats(), enabled=True)
+    return jsonify(stats), 200
+
 @app.route("/generate", methods=["POST"])
 def generate():
     """
@@ -97,6 +349,39 @@ def generate():
             file_id:
               type: string
               example: "1"
+            async:
+              type: boolean
+              description: Run as a background job and return 202 with a job id
+            slides:
+              type: array
+              items:
+                type: integer
+              description: Only fetch and populate these slides (default all)
+            trim:
+              type: boolean
+              description: Leave every slide that is not populated out of the deck
+            update:
+              type: boolean
+              description: >
+                Refresh the deck last generated for this file_id in place,
+                re-populating only the slides whose data changed
+            engine:
+              type: string
+              enum: [pptx, slides]
+              description: >
+                pptx renders template.pptx and uploads it; slides fills a
+                copy of the Google Slides template in place (default
+                RENDER_ENGINE)
+            api_data:
+              description: >
+                Slide data to echo back: "none", "digest" (a SHA-256 per
+                slide), "full", or a list of payload fields to return per
+                slide (default GENERATE_API_DATA, "none")
+      - name: Prefer
+        in: header
+        type: string
+        required: false
+        description: '"respond-async" has the same effect as async=true'
     responses:
       200:
         description: Presentation generated successfully
@@ -109,445 +394,852 @@ def generate():
               type: string
             api_data:
               type: object
+      202:
+        description: Job accepted; poll the status_url for progress
+        schema:
+          type: object
+          properties:
+            job_id:
+              type: string
+            state:
+              type: string
+            status_url:
+              type: string
+      400:
+        description: Invalid request parameters
+      503:
+        description: >
+          Render queue or memory budget is full, or the slide API is failing
+          and calls to it are paused; retry after the Retry-After delay
       500:
         description: Error generating presentation
     """
     try:
         data = request.get_json()
-        logger.info(f"Received request data: {data}")
-
-        slide_numbers = [14, 15, 16, 17, 23, 38, 39]
-        slide_data = {}
-        api_data = {}
-
-        # api_url = "http://34.90.192.243/insight_slide"
-        # for slide_no in slide_numbers:
-        #     slide_data[slide_no] = fetch_slide_data_with_retry(api_url, slide_no)
-        #     api_data[slide_no] = slide_data[slide_no]
-        #     logger.info(
-        #         f"Received slide data from API for slide {slide_no}: {slide_data[slide_no]}"
-        #     )
+        logger.info("Received request data: %s", Truncated(data))
 
-        # Use hardcoded data for each slide number
-        for slide_no in slide_numbers:
-            slide_data[slide_no] = hardcoded_data.get(slide_no, {})
-            api_data[slide_no] = slide_data[slide_no]
-            logger.info(
-                f"Using hardcoded data for slide {slide_no}: {slide_data[slide_no]}"
+        try:
+            requested_slides(data)
+            render_engine(data)
+            api_data_mode(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        if wants_async(data):
+            if not isinstance(data, dict) or "file_id" not in data:
+                return jsonify({"error": "file_id is required"}), 400
+            try:
+                job_id = job_runner.submit(
+                    generate_presentation,
+                    data,
+                    stages=GENERATE_STAGES,
+                    params=data,
+                )
+            except JobQueueFull as e:
+                REQUESTS.labels("async", "rejected").inc()
+                return jsonify({"error": str(e)}), 503, {"Retry-After": "30"}
+            REQUESTS.labels("async", "accepted").inc()
+            status_url = url_for("get_job", job_id=job_id)
+            return (
+                jsonify({"job_id": job_id, "state": JOB_QUEUED, "status_url": status_url}),
+                202,
+                {"Location": status_url},
             )
 
-        # Generate the presentation
-        presentation_link = create_presentation(slide_data, data["file_id"])
-        logger.info(f"Generated presentation link: {presentation_link}")
-
-        response_data = {
-            "original_parameters": data,
-            "presentation_link": presentation_link,
-            "api_data": api_data,  # Add API data to response
-        }
-        return jsonify(response_data), 200
+        with timed_stage("total"):
+            response_data = generate_presentation(data, admission_wait=ADMISSION_MAX_WAIT)
+        REQUESTS.labels("sync", "succeeded").inc()
+        return json_response(response_data)
+    except (CircuitOpenError, AdmissionRejected) as e:
+        logger.error(f"Error generating presentation: {e}")
+        REQUESTS.labels("sync", "rejected").inc()
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(math.ceil(e.retry_after))}
     except Exception as e:
         logger.error(f"Error generating presentation: {e}")
+        REQUESTS.labels("sync", "failed").inc()
         return jsonify({"error": str(e)}), 500
 
-def create_presentation(data, file_id):
+@app.route("/generate/batch", methods=["POST"])
+def generate_batch():
     """
-    Create a presentation and populate it with data.
+    Endpoint to generate many presentations in one call.
+    ---
+    parameters:
+      - name: data
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            decks:
+              type: array
+              description: One entry per deck; a file id string or an object with file_id and optional slides/trim overrides
+              items:
+                type: object
+                properties:
+                  file_id:
+                    type: string
+                  slides:
+                    type: array
+                    items:
+                      type: integer
+                  trim:
+                    type: boolean
+            slides:
+              type: array
+              items:
+                type: integer
+              description: Default slides for every deck
+            trim:
+              type: boolean
+              description: Default trim option for every deck
+            stream:
+              type: boolean
+              description: Stream one JSON line per deck as it finishes (also chosen by Accept application/x-ndjson)
+    responses:
+      200:
+        description: Per-deck results, each with either presentation_link or error
+      400:
+        description: Invalid request parameters
+      500:
+        description: Error fetching the slide data
     """
     try:
-        # Load the template presentation
-        template_path = "template.pptx"
-        prs = Presentation(template_path)
-
-        # Populate the presentation with data
-        for slide_no, content in data.items():
-            if slide_no - 1 < len(prs.slides):
-                slide = prs.slides[
-                    slide_no - 1
-                ]  # Adjust index since slides are 0-indexed
-                populate_slide(slide, content, slide_no)
-            else:
-                logger.error(
-                    f"Slide number {slide_no} is out of range for the presentation"
-                )
+        data = request.get_json()
+        logger.info("Received batch request data: %s", Truncated(data))
+        try:
+            decks = batch_decks(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        results = start_batch(decks)
+        if data.get("stream") or "application/x-ndjson" in request.headers.get("Accept", ""):
+            lines = (dumps(result) + b"\n" for result in results)
+            return Response(lines, mimetype="application/x-ndjson")
+        return json_response({"results": sorted(results, key=lambda result: result["index"])})
+    except Exception as e:
+        logger.error(f"Error generating presentation batch: {e}")
+        return jsonify({"error": str(e)}), 500
 
-        # Save the modified presentation
-        output_path = f"/tmp/{file_id}.pptx"
-        prs.save(output_path)
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """
+    Endpoint to check on an asynchronous presentation job.
+    ---
+    parameters:
+      - name: job_id
+        in: path
+        type: string
+        required: true
+    responses:
+      200:
+        description: Current state of the job
+        schema:
+          type: object
+          properties:
+            job_id:
+              type: string
+            state:
+              type: string
+              enum: [queued, running, succeeded, failed]
+            stages:
+              type: object
+            presentation_link:
+              type: string
+            result:
+              type: object
+            error:
+              type: string
+      404:
+        description: Unknown job id
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    result = job["result"] or {}
+    return json_response({
+        "job_id": job["id"],
+        "state": job["state"],
+        "stages": job["stages"],
+        "presentation_link": result.get("presentation_link"),
+        "result": job["result"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    })
+
+def wants_async(data):
+    """
+    Return True if the caller asked for /generate to run as a background job.
+    """
+    if isinstance(data, dict) and "async" in data:
+        return bool(data["async"])
+    if "respond-async" in request.headers.get("Prefer", ""):
+        return True
+    return GENERATE_ASYNC_DEFAULT
+
+def requested_slides(data):
+    """
+    Return the slide numbers the request asked for, in template order.
+
+    Raises ValueError for slides that have no layout.
+    """
+    if not isinstance(data, dict) or data.get("slides") is None:
+        return list(SLIDE_NUMBERS)
+    slides = data["slides"]
+    if not isinstance(slides, list) or not slides:
+        raise ValueError("slides must be a non-empty list of slide numbers")
+    try:
+        wanted = {int(slide_no) for slide_no in slides}
+    except (TypeError, ValueError):
+        raise ValueError("slides must be a non-empty list of slide numbers")
+    unknown = sorted(wanted.difference(SLIDE_NUMBERS))
+    if unknown:
+        raise ValueError(f"Unknown slides {unknown}; available slides are {SLIDE_NUMBERS}")
+    return [slide_no for slide_no in SLIDE_NUMBERS if slide_no in wanted]
+
+def wants_trim(data):
+    """
+    Return True if the deck should only contain the populated slides.
+    """
+    if isinstance(data, dict) and "trim" in data:
+        return bool(data["trim"])
+    return DECK_TRIM_DEFAULT
 
-        # Upload the presentation to Google Drive
-        file_metadata = {"name": f"Generated Presentation {file_id}"}
-        media = MediaFileUpload(
-            output_path,
-            mimetype="application/vnd.openxmlformats-officedocument.presentationml.presentation",
+def wants_update(data):
+    """
+    Return True if the deck last generated for the file_id should be
+    refreshed in place rather than published as a new Drive file.
+    """
+    if isinstance(data, dict) and "update" in data:
+        return bool(data["update"])
+    return DECK_UPDATE_DEFAULT
+
+def render_engine(data):
+    """
+    Return the render engine the request asked for.
+
+    Raises ValueError for unknown engines, a "slides" request without
+    SLIDES_TEMPLATE_ID, and "update", which only the pptx engine supports.
+    """
+    engine = RENDER_ENGINE_DEFAULT
+    if isinstance(data, dict) and data.get("engine") is not None:
+        engine = data["engine"]
+    if engine not in RENDER_ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}; available engines are {list(RENDER_ENGINES)}")
+    if engine == "slides":
+        if slides_template is None:
+            raise ValueError("The slides engine needs SLIDES_TEMPLATE_ID to be set")
+        if wants_update(data):
+            raise ValueError("update is only supported by the pptx engine")
+    return engine
+
+def api_data_mode(data):
+    """
+    Return how much slide data the response should echo back: one of
+    API_DATA_MODES, or a list of payload fields to keep per slide.
+
+    Raises ValueError for anything else.
+    """
+    mode = GENERATE_API_DATA_DEFAULT
+    if isinstance(data, dict) and data.get("api_data") is not None:
+        mode = data["api_data"]
+    if isinstance(mode, list) and all(isinstance(field, str) for field in mode):
+        return mode
+    if mode not in API_DATA_MODES:
+        raise ValueError(
+            f"api_data must be one of {list(API_DATA_MODES)} or a list of field names"
         )
-        uploaded_file = upload_to_drive_with_retry(file_metadata, media)
-        logger.info(f"Uploaded presentation with ID: {uploaded_file.get('id')}")
+    return mode
+
+def shape_api_data(slide_data, mode):
+    """
+    Return the "api_data" to send back for `slide_data`, or None to leave it out.
+    """
+    if mode == "none":
+        return None
+    if mode == "digest":
+        return {slide_no: payload_digest(content) for slide_no, content in slide_data.items()}
+    if mode == "full":
+        return slide_data
+    return {
+        slide_no: {field: content[field] for field in mode if field in content}
+        if isinstance(content, dict) else content
+        for slide_no, content in slide_data.items()
+    }
+
+def batch_decks(data):
+    """
+    Validate a /generate/batch body into a list of per-deck requests.
 
-        # Set file permissions to make it accessible by anyone with the link
-        permission = {
-            "type": "anyone",
-            "role": "reader",
+    Top-level "slides" and "trim" are defaults that each deck may override.
+    Raises ValueError for malformed input.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("decks"), list) or not data["decks"]:
+        raise ValueError("decks must be a non-empty list")
+    if len(data["decks"]) > BATCH_MAX_DECKS:
+        raise ValueError(f"At most {BATCH_MAX_DECKS} decks can be generated per batch")
+    defaults = {key: data[key] for key in ("slides", "trim") if key in data}
+    decks = []
+    for deck in data["decks"]:
+        if isinstance(deck, str):
+            deck = {"file_id": deck}
+        if not isinstance(deck, dict) or "file_id" not in deck:
+            raise ValueError("Every deck needs a file_id")
+        deck = dict(defaults, **deck)
+        deck["slides"] = requested_slides(deck)
+        decks.append(deck)
+    return decks
+
+def start_batch(decks):
+    """
+    Fetch the slide data all decks need once, start rendering every deck and
+    return an iterator over per-deck results in completion order.
+
+    Decks render in the process pool, once per distinct set of slides and
+    trim option; each deck is uploaded from the upload pool as soon as its
+    render is done, while the others are still rendering.
+    The whole batch has GENERATE_DEADLINE seconds; decks not finished by
+    then get an error result.
+    """
+    started = time.monotonic()
+    deadline = started + GENERATE_DEADLINE
+    needed = sorted({slide_no for deck in decks for slide_no in deck["slides"]})
+    with timed_stage("fetch"):
+        slide_data = get_slide_data(
+            needed, deadline=started + GENERATE_DEADLINE * GENERATE_FETCH_SHARE
+        )
+
+    groups = {}
+    for index, deck in enumerate(decks):
+        key = (tuple(sorted(deck["slides"])), wants_trim(deck))
+        groups.setdefault(key, []).append((index, deck["file_id"]))
+    results = queue.Queue()
+    for (slides, trim), members in groups.items():
+        _start_batch_group(slides, trim, members, slide_data, results, deadline)
+    return _batch_results(decks, results, deadline)
+
+def _batch_results(decks, results, deadline):
+    pending = dict(enumerate(deck["file_id"] for deck in decks))
+    while pending:
+        try:
+            result = results.get(timeout=max(0, deadline - time.monotonic()))
+        except queue.Empty:
+            break
+        pending.pop(result["index"], None)
+        yield result
+    for index, file_id in pending.items():
+        logger.error(f"Presentation {file_id} was not finished within the batch deadline")
+        REQUESTS.labels("batch", "failed").inc()
+        yield {
+            "index": index,
+            "file_id": file_id,
+            "error": f"Not finished within {GENERATE_DEADLINE:g}s",
         }
-        drive_service.permissions().create(
-            fileId=uploaded_file["id"],
-            body=permission,
-        ).execute()
 
-        return f"https://drive.google.com/file/d/{uploaded_file.get('id')}/view"
-    except Exception as e:
-        logger.error(f"Error creating presentation: {e}")
-        raise e  # Re-raise the exception after logging it
+def _start_batch_group(slides, trim, members, slide_data, results, deadline):
+    # Every deck takes its slides from the same fetched data, so decks with
+    # the same slides and trim option render identical bytes: the group is
+    # rendered once and uploaded once per (index, file_id) in `members`
+    data = {slide_no: slide_data[slide_no] for slide_no in slides}
+
+    def fail(index, file_id, e):
+        logger.error(f"Error creating presentation {file_id}: {e}")
+        REQUESTS.labels("batch", "failed").inc()
+        results.put({"index": index, "file_id": file_id, "error": str(e)})
+
+    def succeed(index, file_id, drive_file_id):
+        REQUESTS.labels("batch", "succeeded").inc()
+        results.put(
+            {"index": index, "file_id": file_id, "presentation_link": drive_link(drive_file_id)}
+        )
 
-def upload_to_drive_with_retry(file_metadata, media, retries=3):
-    attempt = 0
-    while attempt < retries:
+    def publish(index, file_id, deck_bytes, cache_content):
         try:
-            uploaded_file = (
-                drive_service.files()
-                .create(body=file_metadata, media_body=media, fields="id")
-                .execute()
+            drive_file_id = publish_deck(
+                deck_bytes,
+                file_id,
+                cache_key,
+                deadline=deadline,
+                cache_content=cache_content,
             )
-            return uploaded_file
         except Exception as e:
-            logger.error(f"Attempt {attempt + 1} failed with error: {e}")
-            attempt += 1
-            time.sleep(2**attempt)  # Exponential backoff
-    raise Exception("Failed to upload file after several retries")
+            fail(index, file_id, e)
+            return
+        succeed(index, file_id, drive_file_id)
+
+    def publish_all(deck_bytes, cache_content):
+        for i, (index, file_id) in enumerate(pending):
+            upload_executor.submit(publish, index, file_id, deck_bytes, cache_content and not i)
+
+    def rendered(future):
+        try:
+            deck_bytes = future.result()
+        except Exception as e:
+            for index, file_id in pending:
+                fail(index, file_id, e)
+            return
+        publish_all(deck_bytes, True)
 
-def set_font(cell, font_name="Arial", font_size=8):
+    cache_key, content, pending = None, None, []
+    for index, file_id in members:
+        try:
+            cache_key, cached = lookup_deck_cache(data, trim, file_id)
+        except Exception as e:
+            fail(index, file_id, e)
+            continue
+        if cached and cached.get("drive_file_id"):
+            succeed(index, file_id, cached["drive_file_id"])
+            continue
+        if cached and cached.get("content"):
+            content = cached["content"]
+        pending.append((index, file_id))
+
+    if not pending:
+        return
+    if content is not None:
+        publish_all(content, False)
+        return
+    try:
+        render_pool.submit(data, trim).add_done_callback(rendered)
+    except Exception as e:
+        for index, file_id in pending:
+            fail(index, file_id, e)
+
+def get_slide_data(slide_numbers, deadline=None):
     """
-    Set the font for a table cell.
+    Return the payload for each slide, from the slide API when configured.
+
+    `deadline` is a time.monotonic() value bounding the whole fetch.
+    """
+    slide_data = {}
+    api_url = os.environ.get("API_ENDPOINT_URL")
+    if api_url:
+        # Fetch every slide concurrently over the pooled session
+        slide_data = fetch_all_slide_data(api_url, slide_numbers, deadline=deadline)
+        for slide_no in slide_numbers:
+            logger.debug(
+                "Received slide data from API for slide %s: %s",
+                slide_no,
+                Truncated(slide_data[slide_no]),
+            )
+    else:
+        # Use hardcoded data for each slide number
+        for slide_no in slide_numbers:
+            slide_data[slide_no] = hardcoded_data.get(slide_no, {})
+            logger.debug(
+                "Using hardcoded data for slide %s: %s",
+                slide_no,
+                Truncated(slide_data[slide_no]),
+            )
+    return slide_data
+
+def generate_presentation(data, progress=None, admission_wait=None):
     """
-    for paragraph in cell.text_frame.paragraphs:
-        for run in paragraph.runs:
-            run.font.name = font_name
-            run.font.size = Pt(font_size)
+    Fetch the slide data and build the presentation for one request.
 
-def set_yoy_color(cell, yoy_value):
+    `progress(stage, state)` is called as each stage starts and finishes.
+    The whole call has GENERATE_DEADLINE seconds, of which the fetch may
+    use GENERATE_FETCH_SHARE. The render waits at most `admission_wait`
+    seconds for memory (default until the deadline). Returns the /generate
+    response payload.
     """
-    Set the color for the YoY cell based on its value.
+    progress = progress or _ignore_progress
+    started = time.monotonic()
+    deadline = started + GENERATE_DEADLINE
+
+    progress("fetch", STAGE_RUNNING)
+    with timed_stage("fetch"):
+        slide_data = get_slide_data(
+            requested_slides(data),
+            deadline=started + GENERATE_DEADLINE * GENERATE_FETCH_SHARE,
+        )
+    api_data = shape_api_data(dict(slide_data), api_data_mode(data))
+    progress("fetch", STAGE_DONE)
+
+    # Generate the presentation
+    with timed_stage("create_presentation"):
+        presentation_link = create_presentation(
+            slide_data,
+            data["file_id"],
+            progress=progress,
+            trim=wants_trim(data),
+            update=wants_update(data),
+            deadline=deadline,
+            engine=render_engine(data),
+            admission_wait=admission_wait,
+        )
+    logger.info(f"Generated presentation link: {presentation_link}")
+
+    response = {
+        "original_parameters": data,
+        "presentation_link": presentation_link,
+    }
+    if api_data is not None:
+        response["api_data"] = api_data
+    return response
+
+def _ignore_progress(stage, state):
+    pass
+
+def create_presentation(
+    data,
+    file_id,
+    progress=None,
+    trim=False,
+    update=False,
+    deadline=None,
+    engine="pptx",
+    admission_wait=None,
+):
+    """
+    Create a presentation and populate it with data.
+
+    With `trim`, slides without data are dropped from the deck together with
+    any media only they referenced. With `update`, the deck last generated
+    for `file_id` is refreshed in place (see update_presentation). The
+    upload gives up at `deadline` (a time.monotonic() value). The "slides"
+    `engine` builds the deck in Google Slides instead (see
+    create_slides_presentation).
+
+    Rendering and uploading hold a share of the memory budget. A request
+    waits up to `admission_wait` seconds (default until `deadline`) for one
+    and AdmissionRejected is raised if none frees up in time.
     """
+    progress = progress or _ignore_progress
     try:
-        if yoy_value:
-            yoy = float(yoy_value.strip("%"))
-            if yoy > 100:
-                color = RGBColor(0, 255, 0)  # Green
-            elif 90 <= yoy <= 100:
-                color = RGBColor(218, 165, 32)  # Yellow goldenrod
+        if engine == "slides":
+            return drive_link(create_slides_presentation(data, file_id, progress, trim))
+
+        if deadline is not None:
+            remaining = max(0, deadline - time.monotonic())
+            admission_wait = remaining if admission_wait is None else min(admission_wait, remaining)
+
+        if update and deck_history is not None:
+            with admission.admit(admission_wait):
+                return drive_link(update_presentation(data, file_id, progress, trim, deadline))
+
+        # Reuse an earlier deck rendered from identical inputs
+        cache_key, cached = lookup_deck_cache(data, trim, file_id)
+        if cached and cached.get("drive_file_id"):
+            for stage in ("render", "upload", "share"):
+                progress(stage, STAGE_SKIPPED)
+            return drive_link(cached["drive_file_id"])
+
+        with admission.admit(admission_wait):
+            cache_content = not (cached and cached.get("content"))
+            if not cache_content:
+                deck = cached["content"]
+                progress("render", STAGE_SKIPPED)
             else:
-                color = RGBColor(255, 0, 0)  # Red
-            cell.text_frame.paragraphs[0].runs[0].font.color.rgb = color
-        else:
-            logger.error("Empty YoY value provided.")
-    except ValueError:
-        logger.error(f"Invalid YoY value: {yoy_value}")
+                progress("render", STAGE_RUNNING)
+                deck = render_deck(data, trim, stream=True)
+                progress("render", STAGE_DONE)
 
-def populate_slide(slide, content, slide_number):
+            drive_file_id = publish_deck(
+                deck, file_id, cache_key, progress, deadline, cache_content=cache_content
+            )
+        return drive_link(drive_file_id)
+    except Exception as e:
+        logger.error(f"Error creating presentation: {e}")
+        raise e  # Re-raise the exception after logging it
+
+def create_slides_presentation(data, file_id, progress=None, trim=False):
     """
-    Populate a slide with the given content.
+    Build a deck in Google Slides and return its Drive file id.
+
+    The Slides template is copied on Drive and every table cell, insight and
+    note is written into the copy with a single batchUpdate, so nothing is
+    rendered, saved or uploaded here. The copy is deleted if the update
+    fails.
     """
+    progress = progress or _ignore_progress
+
+    progress("render", STAGE_RUNNING)
+    with timed_stage("populate"):
+        requests = slides_template.deck_requests(data, trim)
+    with timed_stage("slides_copy"):
+        with drive_pool.lease() as drive_service:
+            presentation = drive_service.files().copy(
+                fileId=SLIDES_TEMPLATE_ID,
+                body={"name": f"Generated Presentation {file_id}"},
+                fields="id",
+            ).execute()
+    presentation_id = presentation["id"]
     try:
-        main_table = None
-        insights_table = None
-        table_count = 0
-
-        for shape in slide.shapes:
-            if shape.has_table:
-                table = shape.table
-                if len(table.rows) <= 4:
-                    insights_table = table
-                else:
-                    main_table = table
-                table_count += 1
-
-        if main_table:
-            logger.info(
-                f"Main table dimensions: {len(main_table.rows)} rows x {len(main_table.columns)} columns"
-            )
+        with timed_stage("slides_update"):
+            with slides_pool.lease() as slides_service:
+                slides_service.presentations().batchUpdate(
+                    presentationId=presentation_id, body={"requests": requests}
+                ).execute()
+    except Exception as e:
+        logger.error(f"Filling Slides presentation {presentation_id} failed, deleting it: {e}")
+        try:
+            with drive_pool.lease() as drive_service:
+                drive_service.files().delete(fileId=presentation_id).execute()
+        except Exception as delete_error:
+            logger.error(f"Could not delete presentation {presentation_id}: {delete_error}")
+        raise e
+    logger.info(f"Filled Slides presentation {presentation_id} with {len(requests)} requests")
+    progress("render", STAGE_DONE)
+    progress("upload", STAGE_SKIPPED)
+
+    # Set file permissions to make it accessible by anyone with the link
+    progress("share", STAGE_RUNNING)
+    with timed_stage("share"):
+        permission_batcher.grant(presentation_id, {"type": "anyone", "role": "reader"})
+    progress("share", STAGE_DONE)
+    return presentation_id
+
+def update_presentation(data, file_id, progress=None, trim=False, deadline=None):
+    """
+    Refresh the deck last generated for `file_id` and return its Drive file id.
 
-            if slide_number in [14, 15, 16, 17]:
-                regions = [
-                    "NORTHAM",
-                    "LATAM",
-                    "EMEA",
-                    "JAPAC",
-                    "US PUBLIC SECTOR",
-                    "GLOBAL",
-                ]
-
-                if slide_number == 14:
-                    metrics = [
-                        ("Direct Named", "QSO", "QTD", "Attain", "YoY"),
-                        ("Direct Named", "Pipeline", "QTD", "Attain", "YoY"),
-                        ("Startup", "QSO", "QTD", "Attain", "YoY"),
-                        ("Startup", "Pipeline", "QTD", "Attain", "YoY"),
-                        ("SMB", "QSO", "QTD", "Attain", "YoY"),
-                        ("SMB", "Pipeline", "QTD", "Attain", "YoY"),
-                        ("Partner", "Pipeline", "QTD", "Attain", "YoY"),
-                        ("GCP Direct QSOs", "QSO", "QTD", "Attain", "YoY"),
-                        ("GCP Direct + Partner Pipe", "Pipeline", "QTD", "Attain", "YoY"),
-                    ]
-                elif slide_number == 15:
-                    metrics = [
-                        ("Direct Named", "QSO", "QTD", "Attain", "YoY"),
-                        ("Direct Named", "Pipeline", "QTD", "Attain", "YoY"),
-                        ("Startup", "QSO", "QTD", "Attain", "YoY"),
-                        ("Startup", "Pipeline", "QTD", "Attain", "YoY"),
-                        ("SMB", "QSO", "QTD", "Attain", "YoY"),
-                        ("SMB", "Pipeline", "QTD", "Attain", "YoY"),
-                        ("Partner", "Pipeline", "QTD", "Attain", "YoY"),
-                        ("GCP Direct QSOs", "QSO", "QTD", "Attain", "YoY"),
-                        ("GCP Direct + Partner Pipe", "Pipeline", "QTD", "Attain", "YoY"),
-                    ]
-                elif slide_number in [16, 17]:
-                    metrics = [
-                        ("Direct Named", "QSO", "QTD", "Attain", "YoY"),
-                        ("Direct Named", "Pipeline", "QTD", "Attain", "YoY"),
-                        ("Partner", "Pipeline", "QTD", "Attain", "YoY"),
-                        ("GWS Direct QSOs", "QSO", "QTD", "Attain", "YoY"),
-                        ("GWS Direct + Partner Pipe", "Pipeline", "QTD", "Attain", "YoY"),
-                    ]
-
-                start_row = 3
-
-                for i, (metric_category, metric_type, qtd_key, attain_key, yoy_key) in enumerate(metrics):
-                    for j, region in enumerate(regions):
-                        metric_data = (
-                            content.get("data", {})
-                            .get(region, {})
-                            .get(metric_category, {})
-                            .get(metric_type, {})
-                        )
-                        region_value_qtd_attain = (
-                            f"{metric_data.get(qtd_key, '')} ({metric_data.get(attain_key, '')})"
-                            if metric_data.get(qtd_key) or metric_data.get(attain_key)
-                            else ""
-                        )
-                        region_value_yoy = metric_data.get(yoy_key, "")
-
-                        # QTD and Attain
-                        cell = main_table.cell(start_row + i, 1 + (j * 2))
-                        cell.text = region_value_qtd_attain
-                        set_font(cell)
-
-                        # YoY
-                        cell = main_table.cell(start_row + i, 2 + (j * 2))
-                        cell.text = region_value_yoy
-                        set_font(cell)
-                        # set_yoy_color(cell, region_value_yoy)
-
-                        logger.info(
-                            f"Populated {metric_category} {metric_type} for {region} with QTD+Attain: {region_value_qtd_attain} and YoY: {region_value_yoy}"
-                        )
-
-            elif slide_number == 23:
-                regions = ["NORTHAM", "GLOBAL", "LATAM", "EMEA", "APAC", "JAPAN", "PUBLIC SECTOR", "TOTAL"]
-                metrics = [
-                    ("Ticket Volume", "Q1", "Chg", "YTD"),
-                    ("SLA Adherence", "Q1", "Chg", "YTD"),
-                    ("Marketer Satisfaction", "Q1", "Chg", "YTD")
-                ]
-
-                start_row = 2
-
-                for i, (metric, q1_key, chg_key, ytd_key) in enumerate(metrics):
-                    for j, region in enumerate(regions):
-                        region_data = content.get("data", {}).get(region, {}).get(metric, {})
-                        q1_value = region_data.get(q1_key, "")
-                        chg_value = region_data.get(chg_key, "")
-                        ytd_value = region_data.get(ytd_key, "") if region == "TOTAL" else ""
-
-                        # Q1
-                        cell = main_table.cell(start_row + i, 1 + (j * 2))
-                        cell.text = q1_value
-                        set_font(cell)
-
-                        # Chg
-                        cell = main_table.cell(start_row + i, 2 + (j * 2))
-                        cell.text = chg_value
-                        set_font(cell)
-
-                        # YTD (only for TOTAL column)
-                        if region == "TOTAL":
-                            cell = main_table.cell(start_row + i, 3 + (j * 2))
-                            cell.text = ytd_value
-                            set_font(cell)
-
-                        logger.info(
-                            f"Populated {metric} for {region} with Q1: {q1_value}, Chg: {chg_value}, and YTD: {ytd_value}"
-                        )
-
-            elif slide_number == 38:
-                categories = ["Consideration", "AI Perception"]
-                regions = ["EMEA", "TOTAL", "JAPAC", "LATAM", "NORTHAM"]
-
-                start_row = 3
-
-                for i, category in enumerate(categories):
-                    for j, region in enumerate(regions):
-                        region_data = content.get("data", {}).get(category, {}).get(region, {})
-                        value = region_data.get("value", "")
-                        qoq = region_data.get("QoQ", "")
-
-                        # Value
-                        cell = main_table.cell(start_row + i, 1 + (j * 2))
-                        cell.text = value
-                        set_font(cell)
-
-                        # QoQ
-                        cell = main_table.cell(start_row + i, 2 + (j * 2))
-                        cell.text = qoq
-                        set_font(cell)
-
-                        logger.info(
-                            f"Populated {category} for {region} with Value: {value} and QoQ: {qoq}"
-                        )
-
-            elif slide_number == 39:
-                categories = ["Unaided Awareness", "Familiarity"]
-                regions = ["EMEA", "TOTAL", "JAPAC", "LATAM", "NORTHAM"]
-
-                start_row = 3
-
-                for i, category in enumerate(categories):
-                    for j, region in enumerate(regions):
-                        region_data = content.get("data", {}).get(category, {}).get(region, {})
-                        value = region_data.get("value", "")
-                        qoq = region_data.get("QoQ", "")
-
-                        # Value
-                        cell = main_table.cell(start_row + i, 1 + (j * 2))
-                        cell.text = value
-                        set_font(cell)
-
-                        # QoQ
-                        cell = main_table.cell(start_row + i, 2 + (j * 2))
-                        cell.text = qoq
-                        set_font(cell)
-
-                        logger.info(
-                            f"Populated {category} for {region} with Value: {value} and QoQ: {qoq}"
-                        )
-
-        if insights_table:
-            logger.info(
-                f"Insights table dimensions: {len(insights_table.rows)} rows x {len(insights_table.columns)} columns"
+    Slides whose payload is unchanged since that deck are reused as they
+    were rendered; only the others are populated again. The new deck
+    replaces the content of the existing Drive file, which keeps its link
+    and permissions. Without an earlier deck, or once its Drive file is
+    gone, the deck is published as a new file.
+    """
+    progress = progress or _ignore_progress
+    with deck_history.lock(file_id):
+        template_digest = render_digest()
+        digests = slide_digests(data, template_digest)
+        previous = deck_history.get(file_id)
+
+        reuse = {}
+        drive_file_id = None
+        if previous is not None:
+            drive_file_id = previous["drive_file_id"]
+            if previous["template_digest"] == template_digest and previous["trim"] == trim:
+                if previous["digests"] == digests:
+                    if drive_file_exists(drive_file_id):
+                        logger.info(f"Deck for {file_id} is unchanged, keeping Drive file {drive_file_id}")
+                        deck_history.record(unchanged=1)
+                        for stage in ("render", "upload", "share"):
+                            progress(stage, STAGE_SKIPPED)
+                        return drive_file_id
+                    deck_history.discard(file_id)
+                    drive_file_id = None
+                reuse = decode_slides({
+                    slide_no: previous["slides"][slide_no]
+                    for slide_no, digest in digests.items()
+                    if previous["digests"].get(slide_no) == digest and slide_no in previous["slides"]
+                })
+
+        progress("render", STAGE_RUNNING)
+        rendered = {}
+        deck = render_deck(data, trim, reuse=reuse, capture=rendered, stream=True)
+        deck_history.record(slides_reused=len(reuse), slides_rendered=len(data) - len(reuse))
+        logger.info(f"Rendered {len(data) - len(reuse)} of {len(data)} slides for {file_id}")
+        progress("render", STAGE_DONE)
+
+        if drive_file_id is not None:
+            progress("upload", STAGE_RUNNING)
+            media = MediaIoBaseUpload(
+                deck,
+                mimetype=PPTX_MIMETYPE,
+                chunksize=UPLOAD_CHUNK_SIZE,
+                resumable=True,
             )
+            try:
+                with timed_stage("upload"):
+                    upload_to_drive_with_retry(
+                        None, media, drive_file_id=drive_file_id, deadline=deadline
+                    )
+                logger.info(f"Replaced content of Drive file {drive_file_id}")
+                deck_history.record(updates=1)
+                progress("upload", STAGE_DONE)
+                # The file is already shared by link
+                progress("share", STAGE_SKIPPED)
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+                logger.error(f"Drive file {drive_file_id} for {file_id} is gone, creating a new one")
+                deck_history.discard(file_id)
+                drive_file_id = None
+
+        if drive_file_id is None:
+            drive_file_id = publish_deck(
+                deck, file_id, progress=progress, deadline=deadline
+            )
+            deck_history.record(created=1)
 
-            # Populate insights table differently based on slide number
-            if slide_number in [14, 15, 16, 17, 23]:
-                drivers = content.get("drivers", [])
-                insights = content.get("insights", [])
-                logger.info(f"Length of insights is: {len(insights)}")
-                logger.info(f"Length of insight table is: {len(insights_table.rows)}")
-
-                for i in range(
-                    max(len(drivers), len(insights))
-                ):  # Ensure we loop through the longest list
-                    if i < len(insights_table.rows):
-                        driver_text = drivers[i] if i < len(drivers) else ""
-                        insight_text = insights[i] if i < len(insights) else ""
-                        if isinstance(insight_text, str):
-                            try:
-                                insight_text = json.loads(insight_text)
-                            except json.JSONDecodeError as e:
-                                logger.error(f"Error parsing insight string: {e}")
-                                insight_text = {}
-                        driver_text = insight_text.get("title", "")
-                        insight_text = insight_text.get("narrative", "")
-
-                        cell = insights_table.cell(i, 0)
-                        set_font(cell)
-
-                        # Bold the driver_text part
-                        paragraph = cell.text_frame.paragraphs[0]
-                        run = paragraph.add_run()
-                        run.text = driver_text
-                        run.font.bold = True
-                        run.font.size = Pt(8)
-                        run.font.name = "Arial"
-                        run = paragraph.add_run()
-                        run.text = f" {insight_text}"
-                        run.font.size = Pt(8)
-                        run.font.name = "Arial"
-                        logger.info(
-                            f"Populated insight {i + 1}: {driver_text} {insight_text}"
-                        )
-
-                recommendations = content.get("recommendations", [])
-                recommendations = [re.sub(r"\*\*", "", rec) for rec in recommendations]
-                footnote_text = " ".join(recommendations)
-                notes_slide = slide.notes_slide
-                text_frame = notes_slide.notes_text_frame
-                text_frame.text += "\n" + footnote_text
-
-            elif slide_number == 38:
-                insights = content.get("insights", {})
-                logger.info(f"Insights for slide 38: {insights}")
-
-                for category, category_insights in insights.items():
-                    if isinstance(category_insights, list):  # Ensure it's a list
-                        for i, insight_group in enumerate(category_insights):
-                            if isinstance(insight_group, list):  # Ensure it's a list
-                                for j, insight in enumerate(insight_group):
-                                    if isinstance(insight, dict):  # Ensure it's a dict
-                                        if i * len(insight_group) + j < len(insights_table.rows):
-                                            cell = insights_table.cell(i * len(insight_group) + j, 0)
-                                            set_font(cell)
-
-                                            title = insight.get("title", "")
-                                            narrative = insight.get("narrative", "")
-
-                                            # Bold the title part
-                                            paragraph = cell.text_frame.paragraphs[0]
-                                            run = paragraph.add_run()
-                                            run.text = title
-                                            run.font.bold = True
-                                            run.font.size = Pt(8)
-                                            run.font.name = "Arial"
-                                            run = paragraph.add_run()
-                                            run.text = f" {narrative}"
-                                            run.font.size = Pt(8)
-                                            run.font.name = "Arial"
-                                            logger.info(
-                                                f"Populated insight {i + 1}: {title} {narrative}"
-                                            )
-
-                
-            elif slide_number == 39:
-                insights = content.get("insights", {}).get("leading_indicators", [])
-                logger.info(f"Leading indicators for slide 39: {insights}")
-
-                for i, insight in enumerate(insights):
-                    if isinstance(insight, dict):  # Ensure it's a dict
-                        if i < len(insights_table.rows):
-                            cell = insights_table.cell(i, 0)
-                            set_font(cell)
-
-                            title = insight.get("title", "")
-                            narrative = insight.get("narrative", "")
-
-                            # Bold the title part
-                            paragraph = cell.text_frame.paragraphs[0]
-                            run = paragraph.add_run()
-                            run.text = title
-                            run.font.bold = True
-                            run.font.size = Pt(8)
-                            run.font.name = "Arial"
-                            run = paragraph.add_run()
-                            run.text = f" {narrative}"
-                            run.font.size = Pt(8)
-                            run.font.name = "Arial"
-                            logger.info(
-                                f"Populated insight {i + 1}: {title} {narrative}"
-                            )
+        deck_history.put(file_id, drive_file_id, template_digest, trim, digests, rendered)
+        return drive_file_id
 
+def drive_link(drive_file_id):
+    return f"https://drive.google.com/file/d/{drive_file_id}/view"
 
-    except Exception as e:
-        logger.error(f"Error populating slide: {e}")
-        raise e  # Re-raise the exception after logging it
+def render_digest():
+    """
+    Return the digest of everything besides the data that a rendered deck
+    depends on: the template and the YoY colouring options.
+    """
+    digest = template_cache.current_digest()
+    if YOY_COLORS:
+        digest += f":yoy:{YOY_LOW}:{YOY_HIGH}"
+    return digest
+
+def lookup_deck_cache(data, trim=False, file_id=None):
+    """
+    Return (cache_key, cached) for a deck; both are None if caching is off.
+
+    `cached` holds the Drive file earlier uploaded for the same `file_id`
+    from identical inputs, or else the rendered bytes of identical inputs,
+    whichever file_id they were rendered for. A cached Drive file id is
+    only returned after checking that the file still exists (unless
+    DECK_CACHE_VERIFY is off).
+    """
+    if deck_cache is None:
+        return None, None
+    with timed_stage("cache_lookup"):
+        cache_key = content_hash(
+            data,
+            render_digest(),
+            variant="trimmed" if trim else None,
+        )
+        key = link_key(cache_key, file_id)
+        linked = deck_cache.get(key)
+    if linked and linked.get("drive_file_id"):
+        drive_file_id = linked["drive_file_id"]
+        if not DECK_CACHE_VERIFY or drive_file_exists(drive_file_id):
+            logger.info(f"Deck cache hit {cache_key}, reusing Drive file {drive_file_id}")
+            return cache_key, {"drive_file_id": drive_file_id}
+        deck_cache.discard_drive_file(key)
+    cached = deck_cache.get(cache_key)
+    if cached and cached.get("content"):
+        logger.info(f"Deck cache hit {cache_key}, reusing rendered bytes")
+        return cache_key, {"content": cached["content"]}
+    return cache_key, None
+
+def publish_deck(
+    deck, file_id, cache_key=None, progress=None, deadline=None, cache_content=True
+):
+    """
+    Upload a rendered deck to Drive, share it by link and remember it in the
+    deck cache. Returns the Drive file id.
+
+    `deck` is the .pptx bytes or a seekable file object over them, such as
+    the DeckPackage render_deck(stream=True) returns; the upload then reads
+    its chunks straight from the package. The Drive file is cached for
+    `file_id` alone; with `cache_content` the bytes are cached as well, for
+    other file_ids with the same data.
+    """
+    progress = progress or _ignore_progress
+    size = len(deck)
+    if isinstance(deck, bytes):
+        deck = io.BytesIO(deck)
+
+    # Upload the presentation to Google Drive in resumable chunks
+    progress("upload", STAGE_RUNNING)
+    file_metadata = {"name": f"Generated Presentation {file_id}"}
+    media = MediaIoBaseUpload(
+        deck,
+        mimetype=PPTX_MIMETYPE,
+        chunksize=UPLOAD_CHUNK_SIZE,
+        resumable=True,
+    )
+    with timed_stage("upload"):
+        uploaded_file = upload_to_drive_with_retry(file_metadata, media, deadline=deadline)
+    logger.info(f"Uploaded presentation with ID: {uploaded_file.get('id')}")
+    progress("upload", STAGE_DONE)
+
+    # Set file permissions to make it accessible by anyone with the link
+    progress("share", STAGE_RUNNING)
+    permission = {
+        "type": "anyone",
+        "role": "reader",
+    }
+    with timed_stage("share"):
+        # Grants from decks finishing together share one batch request
+        permission_batcher.grant(uploaded_file["id"], permission)
+    progress("share", STAGE_DONE)
+
+    if cache_key is not None:
+        deck_cache.put(link_key(cache_key, file_id), drive_file_id=uploaded_file["id"])
+        if cache_content and size <= deck_cache.max_bytes:
+            deck_cache.put(cache_key, content=deck.getvalue())
+
+    return uploaded_file["id"]
+
+def drive_file_exists(file_id):
+    """
+    Return True if the Drive file exists and is not in the trash.
+    """
+    try:
+        with drive_pool.lease() as drive_service:
+            file = drive_service.files().get(fileId=file_id, fields="id,trashed").execute()
+        return not file.get("trashed", False)
+    except HttpError as e:
+        if e.resp.status == 404:
+            return False
+        raise
+
+def upload_to_drive_with_retry(
+    file_metadata, media, retries=3, drive_file_id=None, deadline=None
+):
+    """
+    Upload a file to Drive using the resumable upload protocol.
+
+    A failed chunk is retried from the last offset Drive acknowledged rather
+    than from byte zero. The retry budget resets whenever a chunk succeeds.
+    With `drive_file_id` the content of that existing file is replaced; an
+    HttpError 404 is raised if the file does not exist. No chunk or backoff
+    sleep is started after `deadline` (a time.monotonic() value).
+    """
+    with drive_pool.lease() as drive_service:
+
+        def start_upload():
+            if drive_file_id is not None:
+                return drive_service.files().update(
+                    fileId=drive_file_id, body=file_metadata, media_body=media, fields="id"
+                )
+            return drive_service.files().create(
+                body=file_metadata, media_body=media, fields="id"
+            )
 
+        upload = start_upload()
+        attempt = 0
+        response = None
+        while response is None:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise Exception("Upload did not finish within the deadline")
+            try:
+                status, response = upload.next_chunk()
+                attempt = 0
+                if status:
+                    logger.info(
+                        f"Uploaded {status.resumable_progress} of {status.total_size} bytes"
+                    )
+            except HttpError as e:
+                if drive_file_id is not None and e.resp.status == 404 and upload.resumable_uri is None:
+                    # No session was started: the file to update does not exist
+                    raise
+                if e.resp.status in (404, 410):
+                    # The upload session expired; start a new one from byte zero
+                    logger.error(f"Upload session expired, restarting upload: {e}")
+                    upload = start_upload()
+                attempt = _upload_backoff(attempt, retries, e, deadline)
+            except Exception as e:
+                attempt = _upload_backoff(attempt, retries, e, deadline)
+        return response
+
+def _upload_backoff(attempt, retries, error, deadline=None):
+    logger.error(f"Attempt {attempt + 1} failed with error: {error}")
+    attempt += 1
+    if attempt >= retries:
+        raise Exception("Failed to upload file after several retries")
+    backoff = 2**attempt  # Exponential backoff
+    if deadline is not None:
+        backoff = max(0, min(backoff, deadline - time.monotonic()))
+    record_retry("drive_upload", backoff)
+    time.sleep(backoff)
+    return attempt
+
+
+STARTUP_SECONDS.set(time.perf_counter() - _init_started)
+logger.info(f"Initialised in {time.perf_counter() - _init_started:.3f}s")
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8080)
@@ -0,0 +1,202 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+# Optional trace-span export through OpenTelemetry. Exporters are configured
+# with the usual OTEL_* environment variables of the OpenTelemetry SDK.
+tracer = None
+if os.environ.get("TRACING_ENABLED", "false").lower() == "true":
+    try:
+        from opentelemetry import trace
+
+        tracer = trace.get_tracer("lemur")
+    except ImportError:
+        logger.error("TRACING_ENABLED is set but opentelemetry is not installed")
+
+REGISTRY = CollectorRegistry(auto_describe=True)
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800,
+)
+SIZE_BUCKETS = (
+    1024, 4096, 16384, 65536, 262144, 1048576, 2097152, 4194304, 8388608, 16777216,
+)
+MEMORY_BUCKETS = tuple(2**power * 1024 * 1024 for power in range(11))  # 1 MiB to 1 GiB
+
+STAGE_SECONDS = Histogram(
+    "lemur_stage_duration_seconds",
+    "Time spent in each stage of presentation generation",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+SLIDE_FETCH_SECONDS = Histogram(
+    "lemur_slide_fetch_seconds",
+    "Time to fetch one slide payload from the slide API, including retries",
+    ["slide"],
+    buckets=LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+SLIDE_RENDER_SECONDS = Histogram(
+    "lemur_slide_render_seconds",
+    "Time to populate one slide",
+    ["slide"],
+    buckets=LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+RETRIES = Counter(
+    "lemur_retries_total",
+    "Failed attempts that were retried, by operation",
+    ["operation"],
+    registry=REGISTRY,
+)
+BACKOFF_SECONDS = Counter(
+    "lemur_backoff_seconds_total",
+    "Time spent sleeping between retries, by operation",
+    ["operation"],
+    registry=REGISTRY,
+)
+HEDGED_REQUESTS = Counter(
+    "lemur_hedged_requests_total",
+    "Duplicate requests sent for slow calls (sent), and how many answered first (won)",
+    ["operation", "outcome"],
+    registry=REGISTRY,
+)
+PAYLOAD_BYTES = Histogram(
+    "lemur_slide_payload_bytes",
+    "Size of slide payloads received from the slide API",
+    ["slide"],
+    buckets=SIZE_BUCKETS,
+    registry=REGISTRY,
+)
+SLIDE_CACHE_AGE_SECONDS = Histogram(
+    "lemur_slide_cache_age_seconds",
+    "Age of cached slide payloads when served, stale ones included",
+    buckets=LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+OUTPUT_BYTES = Histogram(
+    "lemur_output_bytes",
+    "Size of the saved presentation",
+    buckets=SIZE_BUCKETS,
+    registry=REGISTRY,
+)
+RENDER_PEAK_BYTES = Histogram(
+    "lemur_render_peak_bytes",
+    "Peak RSS growth measured per render by the admission controller",
+    buckets=MEMORY_BUCKETS,
+    registry=REGISTRY,
+)
+STARTUP_SECONDS = Gauge(
+    "lemur_startup_seconds",
+    "Time main.py spent initialising (template parse, caches, pools) after its imports",
+    registry=REGISTRY,
+)
+REQUESTS = Counter(
+    "lemur_generate_requests_total",
+    "Presentation generation requests by mode and outcome",
+    ["mode", "outcome"],
+    registry=REGISTRY,
+)
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Open a trace span when tracing is enabled; otherwise do nothing.
+    """
+    if tracer is None:
+        yield
+        return
+    with tracer.start_as_current_span(name, attributes=attributes):
+        yield
+
+
+@contextmanager
+def timed_stage(stage):
+    """
+    Record the duration of a generation stage and trace it as a span.
+    """
+    start = time.perf_counter()
+    try:
+        with span(stage):
+            yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+
+
+@contextmanager
+def timed_slide(histogram, slide_no, span_name):
+    """
+    Record the duration of per-slide work in `histogram`.
+    """
+    start = time.perf_counter()
+    try:
+        with span(span_name, slide=str(slide_no)):
+            yield
+    finally:
+        histogram.labels(str(slide_no)).observe(time.perf_counter() - start)
+
+
+def record_retry(operation, backoff_seconds):
+    """
+    Count a retried attempt and the backoff slept before the next one.
+    """
+    RETRIES.labels(operation).inc()
+    BACKOFF_SECONDS.labels(operation).inc(backoff_seconds)
+
+
+class StatsCollector:
+    """
+    Expose a component's stats() dict on /metrics.
+
+    Keys listed in `counters` become `<prefix>_<key>_total` counters; every
+    other numeric key becomes a `<prefix>_<key>` gauge.
+    """
+
+    def __init__(self, prefix, stats, counters=()):
+        self.prefix = prefix
+        self.stats = stats
+        self.counters = set(counters)
+
+    def collect(self):
+        for key, value in self.stats().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"{self.prefix}_{key}"
+            if key in self.counters:
+                family = CounterMetricFamily(name, f"{self.prefix} {key}")
+            else:
+                family = GaugeMetricFamily(name, f"{self.prefix} {key}")
+            family.add_metric([], value)
+            yield family
+
+    def describe(self):
+        return []
+
+
+def register_collector(collector):
+    """
+    Add a custom collector (e.g. cache statistics) to the /metrics output.
+    """
+    REGISTRY.register(collector)
+
+
+def render_metrics():
+    """
+    Return (body, content_type) for the Prometheus /metrics endpoint.
+    """
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,97 @@
+import os
+import re
+from collections import namedtuple
+
+from layouts import lookup
+
+# Display strings as the slide API formats them: "1.18K", "$3077.79M",
+# "-0.12%", "1,234"; anything else (e.g. "-" or "1.2K (95%)") is not a number
+_NUMBER = re.compile(
+    r"\s*(?P<sign>[-+]?)\$?(?P<digits>\d[\d,]*(?:\.\d*)?|\.\d+)\s*(?P<suffix>[KMBT%]?)\s*",
+    re.IGNORECASE,
+)
+_SCALE = {"": 1, "%": 1, "K": 1e3, "M": 1e6, "B": 1e9, "T": 1e12}
+
+# Text colours of the YoY bands, and the percentages
+# separating red from goldenrod and goldenrod from green
+YOY_GREEN = "00FF00"
+YOY_GOLDENROD = "DAA520"
+YOY_RED = "FF0000"
+YOY_LOW, YOY_HIGH = (float(edge) for edge in os.environ.get("YOY_BAND_EDGES", "90,100").split(","))
+
+# A slide payload normalized against its layout plan, in columns: the i-th
+# main table write goes to (rows[i], columns[i]) with display string
+# texts[i], numeric value values[i] (None if the text is not a number) and
+# text colour bands[i] (None to keep the template's). insights are the
+# decoded (row, title, narrative) triples and notes the speaker-notes text
+# to append (None if the slide has none).
+Normalized = namedtuple(
+    "Normalized", ["rows", "columns", "texts", "values", "bands", "insights", "notes"]
+)
+
+
+def parse_number(text):
+    """
+    Return the value of a display string such as "$3077.79M" (3077790000.0)
+    or "-0.12%" (-0.12, percentages stay in percent), or None.
+    """
+    if not isinstance(text, str):
+        return None
+    match = _NUMBER.fullmatch(text)
+    if match is None:
+        return None
+    number = float(match.group("digits").replace(",", "")) * _SCALE[match.group("suffix").upper()]
+    return -number if match.group("sign") == "-" else number
+
+
+def yoy_bands(values):
+    """
+    Return the band colour of every YoY percentage in `values`: green above
+    YOY_HIGH, goldenrod from YOY_LOW to YOY_HIGH, red below; None for
+    missing values.
+    """
+    return [
+        None if value is None
+        else YOY_GREEN if value > YOY_HIGH
+        else YOY_GOLDENROD if value >= YOY_LOW
+        else YOY_RED
+        for value in values
+    ]
+
+
+# Band functions by the name layout cells refer to them with
+BANDS = {"yoy": yoy_bands}
+
+
+def normalize_slide(content, plan, bands=True):
+    """
+    Normalize one slide payload against its compiled layout plan.
+
+    Every cell text is formatted, parsed and classified once here, a column
+    at a time, so rendering is a plain loop over ready values. Without
+    `bands` no cell is coloured.
+    """
+    rows, columns, texts, banded = [], [], [], {}
+    for path, writes in plan.cell_groups:
+        values = lookup(content, path)
+        for row, col, fmt, band in writes:
+            if band is not None:
+                banded.setdefault(band, []).append(len(texts))
+            rows.append(row)
+            columns.append(col)
+            texts.append(fmt(values))
+
+    numbers = [parse_number(text) for text in texts]
+    colors = [None] * len(texts)
+    if bands:
+        for band, indexes in banded.items():
+            for index, color in zip(indexes, BANDS[band]([numbers[i] for i in indexes])):
+                colors[index] = color
+
+    insights, notes = [], None
+    if plan.insights_table is not None:
+        insights = plan.insights(content)
+        if plan.notes is not None:
+            recommendations = lookup(content, plan.notes) or []
+            notes = " ".join(rec.replace("**", "") for rec in recommendations)
+    return Normalized(rows, columns, texts, numbers, colors, insights, notes)
@@ -0,0 +1,274 @@
+import io
+import time
+import bisect
+import zlib
+import struct
+import zipfile
+from collections import namedtuple
+
+from pptx.opc.oxml import serialize_part_xml
+from pptx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from pptx.opc.serialized import _ContentTypesItem
+
+# A member of the template zip: its compressed bytes are a slice of the
+# template file, copied into new packages as they are
+ZipEntry = namedtuple(
+    "ZipEntry", ["method", "flags", "dos_time", "dos_date", "crc", "size", "data"]
+)
+
+_LOCAL_HEADER = struct.Struct(zipfile.structFileHeader)
+_CENTRAL_HEADER = struct.Struct(zipfile.structCentralDir)
+_END_RECORD = struct.Struct(zipfile.structEndArchive)
+_UTF8_NAMES = 0x800
+_DEFLATE_LEVEL = 6  # zipfile's default, which prs.save() uses
+_CONTENT_TYPES_CACHE_SIZE = 16
+
+
+def zip_entries(blob):
+    """
+    Return {member name: ZipEntry} for every member of the zip in `blob`.
+    """
+    view = memoryview(blob)
+    entries = {}
+    with zipfile.ZipFile(io.BytesIO(blob)) as archive:
+        for info in archive.infolist():
+            header = _LOCAL_HEADER.unpack_from(blob, info.header_offset)
+            start = info.header_offset + _LOCAL_HEADER.size + header[10] + header[11]
+            dos_date, dos_time = _dos_datetime(info.date_time)
+            entries[info.filename] = ZipEntry(
+                info.compress_type,
+                info.flag_bits & _UTF8_NAMES,
+                dos_time,
+                dos_date,
+                info.CRC,
+                info.file_size,
+                view[start:start + info.compress_size],
+            )
+    return entries
+
+
+def _dos_datetime(date_time):
+    year, month, day, hour, minute, second = date_time
+    return (year - 1980) << 9 | month << 5 | day, hour << 11 | minute << 5 | second // 2
+
+
+def _rels_key(rels):
+    # Read straight from the relationships' attributes: this runs for every
+    # part of every deck saved
+    return {
+        rId: (
+            rel._reltype,
+            rel._target_mode,
+            rel._target if isinstance(rel._target, str) else rel._target.partname,
+        )
+        for rId, rel in rels._rels.items()
+    }
+
+
+def _member_names(partname):
+    return partname.membername, partname.rels_uri.membername
+
+
+def _content(part):
+    # The parsed XML of an XmlPart, or the bytes of a binary part; clones
+    # of untouched template parts share the very same object
+    return part.__dict__.get("_element", part.__dict__.get("_blob"))
+
+
+class DeltaWriter:
+    """
+    Save packages cloned from a template by copying what they did not change.
+
+    A part whose XML (or binary content) is still the template's object,
+    and a rels item whose relationships match the template's, is written
+    by copying its compressed bytes out of the template file: nothing is
+    serialized, decompressed or recompressed. Only modified and new parts,
+    their rels and [Content_Types].xml are serialized and deflated. The
+    package lists the same members in the same order as prs.save().
+
+    [Content_Types].xml only depends on the set of parts, which is the same
+    for every deck rendered with the same slides, so the last few are kept.
+    """
+
+    def __init__(self, blob, package):
+        self.entries = zip_entries(blob)
+        self._contents = {}
+        self._rels = {}
+        self._names = {}
+        for part in package.iter_parts():
+            self._contents[part.partname] = _content(part)
+            self._rels[part.partname] = _rels_key(part._rels)
+            self._names[part.partname] = _member_names(part.partname)
+        self._package_rels = _rels_key(package._rels)
+        self._content_types = {}
+
+    def write(self, package):
+        """
+        Return the package as a DeckPackage.
+        """
+        parts = tuple(package.iter_parts())
+        builder = _ZipBuilder()
+        builder.add(CONTENT_TYPES_URI.membername, self._content_types_entry(parts))
+        builder.add(
+            PACKAGE_URI.rels_uri.membername,
+            self._entry(
+                PACKAGE_URI.rels_uri.membername,
+                _rels_key(package._rels) == self._package_rels,
+                lambda: package._rels.xml,
+            ),
+        )
+        for part in parts:
+            partname = part.partname
+            names = self._names.get(partname) or _member_names(partname)
+            unchanged = partname in self._contents and _content(part) is self._contents[partname]
+            builder.add(names[0], self._entry(names[0], unchanged, lambda: part.blob))
+            if part._rels:
+                unchanged = self._rels.get(partname) == _rels_key(part._rels)
+                builder.add(names[1], self._entry(names[1], unchanged, lambda: part.rels.xml))
+        return builder.finish()
+
+    def _content_types_entry(self, parts):
+        key = tuple((part.partname, part.content_type) for part in parts)
+        entry = self._content_types.get(key)
+        if entry is None:
+            entry = _deflate(serialize_part_xml(_ContentTypesItem.xml_for(parts)))
+            if len(self._content_types) >= _CONTENT_TYPES_CACHE_SIZE:
+                self._content_types.clear()
+            self._content_types[key] = entry
+        return entry
+
+    def _entry(self, name, unchanged, serialize):
+        entry = self.entries.get(name) if unchanged else None
+        return entry if entry is not None else _deflate(serialize())
+
+
+def _deflate(data):
+    compressor = zlib.compressobj(_DEFLATE_LEVEL, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    dos_date, dos_time = _dos_datetime(time.localtime()[:6])
+    return ZipEntry(
+        zipfile.ZIP_DEFLATED, 0, dos_time, dos_date, zlib.crc32(data), len(data), compressed
+    )
+
+
+class _ZipBuilder:
+    def __init__(self):
+        self._segments = []
+        self._central = []
+        self._offset = 0
+
+    def _append(self, data):
+        self._segments.append(data)
+        self._offset += len(data)
+
+    def add(self, name, entry):
+        encoded = name.encode("utf-8")
+        flags = entry.flags | (_UTF8_NAMES if not encoded.isascii() else 0)
+        compressed_size = len(entry.data)
+        self._central.append(
+            _CENTRAL_HEADER.pack(
+                zipfile.stringCentralDir,
+                20, 0, 20, 0,
+                flags,
+                entry.method,
+                entry.dos_time,
+                entry.dos_date,
+                entry.crc,
+                compressed_size,
+                entry.size,
+                len(encoded), 0, 0, 0, 0, 0,
+                self._offset,
+            )
+            + encoded
+        )
+        self._append(
+            _LOCAL_HEADER.pack(
+                zipfile.stringFileHeader,
+                20, 0,
+                flags,
+                entry.method,
+                entry.dos_time,
+                entry.dos_date,
+                entry.crc,
+                compressed_size,
+                entry.size,
+                len(encoded), 0,
+            )
+            + encoded
+        )
+        self._append(entry.data)
+
+    def finish(self):
+        directory = b"".join(self._central)
+        count = len(self._central)
+        end = _END_RECORD.pack(
+            zipfile.stringEndArchive, 0, 0, count, count, len(directory), self._offset, 0
+        )
+        self._append(directory + end)
+        return DeckPackage(self._segments)
+
+
+class DeckPackage(io.RawIOBase):
+    """
+    Read-only, seekable file object over a saved package.
+
+    The package is a list of byte segments, most of them slices of the
+    template file, so it is never assembled in memory unless getvalue() is
+    called. MediaIoBaseUpload reads its chunks straight from the segments.
+    """
+
+    def __init__(self, segments):
+        super().__init__()
+        self._segments = [memoryview(segment) for segment in segments]
+        self._starts = []
+        size = 0
+        for segment in self._segments:
+            self._starts.append(size)
+            size += len(segment)
+        self._size = size
+        self._position = 0
+
+    def __len__(self):
+        return self._size
+
+    def getvalue(self):
+        """
+        Return the whole package as bytes.
+        """
+        return b"".join(self._segments)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}")
+        self._position = offset
+        return offset
+
+    def readinto(self, buffer):
+        target = memoryview(buffer).cast("B")
+        written = 0
+        index = self._segment_at(self._position)
+        while written < len(target) and index < len(self._segments):
+            segment = self._segments[index]
+            start = self._position - self._starts[index]
+            chunk = segment[start:start + len(target) - written]
+            target[written:written + len(chunk)] = chunk
+            written += len(chunk)
+            self._position += len(chunk)
+            index += 1
+        return written
+
+    def _segment_at(self, position):
+        return max(0, bisect.bisect_right(self._starts, position) - 1)
@@ -0,0 +1,176 @@
+import os
+import logging
+
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+
+from layouts import compile_layouts
+from logs import SAMPLED
+from normalize import normalize_slide
+from metrics import OUTPUT_BYTES, SLIDE_RENDER_SECONDS, timed_slide, timed_stage
+from table_fill import RunStyle, fill_cells, fill_insights
+from template_cache import TemplateCache, trim_presentation
+
+logger = logging.getLogger(__name__)
+
+# Style of every populated table run (insight titles are bolded on top)
+CELL_STYLE = RunStyle(font="Arial", size=8)
+
+# Colour banded cells (the YoY column) by their value
+YOY_COLORS = os.environ.get("YOY_COLORS", "false").lower() == "true"
+
+# The TemplateCache decks are rendered from; set by use_template()
+_template = None
+
+
+def use_template(template):
+    """
+    Render decks in this process from `template` (a loaded TemplateCache).
+    """
+    global _template
+    _template = template
+
+
+def load_template(path):
+    """
+    Make sure this process has the template at `path` loaded, e.g. in a
+    freshly started render worker. Processes forked from a parent that
+    already loaded it reuse the inherited copy.
+    """
+    if _template is None or _template.path != path:
+        template = TemplateCache(path)
+        template.load()
+        template.derive("layouts", compile_layouts)
+        use_template(template)
+
+
+def render_deck(data, trim=False, reuse=None, capture=None, stream=False):
+    """
+    Populate a copy of the template with `data` ({slide_no: content}) and
+    return the saved .pptx bytes, or with `stream` a seekable file object
+    over them (a DeckPackage) that is only assembled as it is read.
+
+    With `trim`, slides without data are dropped from the deck together with
+    any media only they referenced.
+
+    `reuse` maps slide numbers to (slide, notes) XML elements from an
+    earlier render with the same template and options; those slides are
+    taken as they are instead of being populated again. When `capture` is a
+    dict, the rendered elements of every slide in `data` are stored in it.
+    """
+    reuse = {slide_no: reuse[slide_no] for slide_no in data if slide_no in (reuse or {})}
+    populate = [slide_no for slide_no in data if slide_no not in reuse]
+
+    # Format, parse and classify every payload before touching the deck
+    plans = _template.derive("layouts", compile_layouts)
+    with timed_stage("normalize"):
+        normalized = {
+            slide_no: normalize_slide(data[slide_no], plans[slide_no], bands=YOY_COLORS)
+            for slide_no in populate
+            if slide_no in plans
+        }
+
+    # Clone the cached template, copying only the slides we populate. A
+    # trimmed deck edits the links of every kept slide, reused ones included.
+    with timed_stage("template"):
+        prs = _template.checkout(
+            data.keys() if trim else populate,
+            mutable_presentation=trim,
+            rendered=reuse,
+        )
+
+    # Populate the presentation with data
+    with timed_stage("populate"):
+        for slide_no in populate:
+            content = data[slide_no]
+            if slide_no - 1 < len(prs.slides):
+                slide = prs.slides[slide_no - 1]  # Adjust index since slides are 0-indexed
+                with timed_slide(SLIDE_RENDER_SECONDS, slide_no, "slide_render"):
+                    populate_slide(slide, content, slide_no, normalized=normalized.get(slide_no))
+            else:
+                logger.error(f"Slide number {slide_no} is out of range for the presentation")
+
+    if capture is not None:
+        slide_parts = {
+            slide_no: prs.slides[slide_no - 1].part
+            for slide_no in data
+            if slide_no - 1 < len(prs.slides)
+        }
+
+    if trim:
+        with timed_stage("trim"):
+            trim_presentation(prs, data.keys())
+
+    if capture is not None:
+        for slide_no, slide_part in slide_parts.items():
+            notes_part = None
+            if slide_part.has_notes_slide:
+                notes_part = slide_part.part_related_by(RT.NOTES_SLIDE)
+            notes_partname = notes_part.partname if notes_part is not None else None
+            # A notes page added while populating has no template part to
+            # stand in for; such slides are populated every time
+            if (slide_part.partname, notes_partname) != _template.slide_partnames(slide_no):
+                continue
+            capture[slide_no] = (
+                slide_part._element,
+                notes_part._element if notes_part is not None else None,
+            )
+
+    # Serialize only the parts we changed; the rest of the package is the
+    # template's compressed bytes, copied as they are. Nothing touches /tmp.
+    with timed_stage("save"):
+        package = _template.save(prs)
+    OUTPUT_BYTES.observe(len(package))
+    return package if stream else package.getvalue()
+
+
+def populate_slide(slide, content, slide_number, plan=None, normalized=None):
+    """
+    Populate a slide with the given content.
+
+    The slide is filled by running its compiled layout plan (see layouts.py)
+    over the payload normalized by normalize_slide(), which is done here
+    unless `normalized` is passed in.
+    """
+    try:
+        if plan is None:
+            plan = _template.derive("layouts", compile_layouts).get(slide_number)
+        if plan is None:
+            logger.error(f"No layout defined for slide {slide_number}")
+            return
+        if normalized is None:
+            normalized = normalize_slide(content, plan, bands=YOY_COLORS)
+
+        shapes = slide.shapes
+
+        if plan.main_table is not None:
+            fill_cells(
+                shapes[plan.main_table].table,
+                zip(normalized.rows, normalized.columns, normalized.texts),
+                CELL_STYLE,
+                colors=normalized.bands,
+            )
+            logger.info(
+                "Populated %d table cells on slide %s",
+                len(normalized.texts),
+                slide_number,
+                extra=SAMPLED,
+            )
+
+        if plan.insights_table is not None:
+            insights = normalized.insights
+            # Bold title followed by the narrative, in one styled pass
+            fill_insights(shapes[plan.insights_table].table, insights, CELL_STYLE)
+            logger.info(
+                "Populated %d insights on slide %s",
+                len(insights),
+                slide_number,
+                extra=SAMPLED,
+            )
+
+            if normalized.notes is not None:
+                notes_slide = slide.notes_slide
+                text_frame = notes_slide.notes_text_frame
+                text_frame.text += "\n" + normalized.notes
+    except Exception as e:
+        logger.error(f"Error populating slide: {e}")
+        raise e  # Re-raise the exception after logging it
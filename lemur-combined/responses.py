@@ -0,0 +1,40 @@
+import os
+import gzip
+import json
+
+from flask import Response, request
+
+# orjson serializes the nested slide payloads several times faster than the
+# standard library; without it responses fall back to json.dumps
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Bodies smaller than this are not worth the CPU of compressing them
+GZIP_MIN_BYTES = int(os.environ.get("RESPONSE_GZIP_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("RESPONSE_GZIP_LEVEL", "5"))
+
+
+def dumps(payload):
+    """
+    Serialize `payload` to compact UTF-8 JSON bytes. Non-string keys, such
+    as slide numbers, become strings as with jsonify().
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def json_response(payload, status=200, headers=None):
+    """
+    Return a JSON response for `payload`, gzip-compressed when the client
+    accepts it and the body is at least GZIP_MIN_BYTES.
+    """
+    body = dumps(payload)
+    response = Response(body, status=status, headers=headers, mimetype="application/json")
+    response.vary.add("Accept-Encoding")
+    if len(body) >= GZIP_MIN_BYTES and request.accept_encodings["gzip"] > 0:
+        response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
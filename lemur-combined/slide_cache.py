@@ -0,0 +1,167 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from metrics import SLIDE_CACHE_AGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class SlideCache:
+    """
+    TTL cache of slide payloads from the slide API.
+
+    Entries are fresh for `ttl` seconds. For `stale_ttl` seconds after that
+    they are still served while a background refresh runs on `executor`
+    (stale-while-revalidate). Expired entries that carry an ETag are
+    revalidated with If-None-Match; a 304 answer renews them without
+    transferring the payload again. Concurrent misses for the same key share
+    one upstream fetch. Memory is bounded by `max_bytes` of response bodies
+    and the least recently used entries are evicted first.
+
+    Cached payloads are shared between callers and must not be modified.
+    """
+
+    def __init__(self, ttl, stale_ttl=0, max_bytes=64 * 1024 * 1024, executor=None):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_bytes = max_bytes
+        self.executor = executor
+        self._entries = OrderedDict()
+        self._size = 0
+        self._inflight = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "revalidated": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "evictions": 0,
+        }
+
+    def get(self, key, fetch):
+        """
+        Return the payload for `key`, calling `fetch(etag)` on a miss.
+
+        `fetch` returns (payload, etag, size), or None when the upstream
+        answered 304 Not Modified to the `etag` it was given.
+        """
+        stale, refresh = None, False
+        with self._lock:
+            entry = self._entries.get(key)
+            age = time.monotonic() - entry["fetched"] if entry is not None else None
+            if age is not None and age < self.ttl + self.stale_ttl:
+                self._entries.move_to_end(key)
+                SLIDE_CACHE_AGE_SECONDS.observe(age)
+                if age < self.ttl:
+                    self._stats["hits"] += 1
+                    return entry["payload"]
+                self._stats["stale_hits"] += 1
+                stale = entry
+                refresh = self.executor is not None and key not in self._refreshing
+                if refresh:
+                    self._refreshing.add(key)
+            else:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = self._inflight[key] = Future()
+                    self._stats["misses"] += 1
+                else:
+                    self._stats["coalesced"] += 1
+
+        if stale is not None:
+            if refresh:
+                self.executor.submit(self._refresh, key, fetch, stale)
+            return stale["payload"]
+
+        if not leader:
+            return future.result()
+        try:
+            payload = self._load(key, fetch, entry)
+            future.set_result(payload)
+            return payload
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def cached(self, key):
+        """
+        Return True if `key` can be served without waiting for the upstream.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            return (
+                entry is not None
+                and time.monotonic() - entry["fetched"] < self.ttl + self.stale_ttl
+            )
+
+    def put(self, key, payload, etag=None, size=0):
+        """
+        Store a payload fetched outside get(), e.g. by a batched request.
+        """
+        entry = {"payload": payload, "etag": etag, "size": size, "fetched": time.monotonic()}
+        with self._lock:
+            self._put(key, entry)
+
+    def stats(self):
+        """
+        Return hit/miss counters and current sizes.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._size
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_ratio"] = (
+            round((stats["hits"] + stats["stale_hits"]) / lookups, 4) if lookups else 0.0
+        )
+        return stats
+
+    def _load(self, key, fetch, entry):
+        fetched = fetch(entry["etag"] if entry is not None else None)
+        if fetched is None:
+            # 304 Not Modified: the cached payload is current again
+            renewed = dict(entry, fetched=time.monotonic())
+            with self._lock:
+                self._stats["revalidated"] += 1
+                self._put(key, renewed)
+            return renewed["payload"]
+        payload, etag, size = fetched
+        self.put(key, payload, etag, size)
+        return payload
+
+    def _refresh(self, key, fetch, entry):
+        try:
+            self._load(key, fetch, entry)
+            with self._lock:
+                self._stats["refreshes"] += 1
+        except Exception as e:
+            logger.error(f"Background refresh of slide data {key} failed: {e}")
+            with self._lock:
+                self._stats["refresh_errors"] += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _put(self, key, entry):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= old["size"]
+        if entry["size"] > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._size += entry["size"]
+        while self._size > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= evicted["size"]
+            self._stats["evictions"] += 1
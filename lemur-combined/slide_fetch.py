@@ -0,0 +1,289 @@
+import os
+import time
+import logging
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from fetch_policy import CircuitBreaker, CircuitOpenError, LatencyWindow, hedged_call
+from logs import SAMPLED, Truncated
+from slide_cache import SlideCache
+from metrics import (
+    PAYLOAD_BYTES,
+    SLIDE_FETCH_SECONDS,
+    record_retry,
+    timed_slide,
+)
+
+logger = logging.getLogger(__name__)
+
+# Fetch stage configuration
+FETCH_MAX_WORKERS = int(os.environ.get("SLIDE_FETCH_MAX_WORKERS", "8"))
+FETCH_CONNECT_TIMEOUT = float(os.environ.get("SLIDE_FETCH_CONNECT_TIMEOUT", "10"))
+FETCH_DEADLINE = float(os.environ.get("SLIDE_FETCH_DEADLINE", "3600"))
+FETCH_BATCH = os.environ.get("SLIDE_FETCH_BATCH", "false").lower() == "true"
+
+# Send a duplicate request once an attempt is slower than this percentile
+# of the slide's recent latencies (0 disables hedging)
+HEDGE_PERCENTILE = float(os.environ.get("SLIDE_FETCH_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("SLIDE_FETCH_HEDGE_MIN_SAMPLES", "20"))
+# Stop calling the upstream for a while after this many consecutive failures
+BREAKER_FAILURES = int(os.environ.get("SLIDE_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.environ.get("SLIDE_BREAKER_RESET", "30"))
+
+# Slide payload cache; off unless SLIDE_CACHE_TTL is set
+CACHE_TTL = float(os.environ.get("SLIDE_CACHE_TTL", "0"))
+CACHE_STALE_TTL = float(os.environ.get("SLIDE_CACHE_STALE_TTL", "0"))
+CACHE_MAX_BYTES = int(os.environ.get("SLIDE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_session = None
+_session_lock = threading.Lock()
+_executor = ThreadPoolExecutor(
+    max_workers=FETCH_MAX_WORKERS, thread_name_prefix="slide-fetch"
+)
+# Hedged attempts run here: a primary and a duplicate per fetch thread
+_hedge_executor = ThreadPoolExecutor(
+    max_workers=2 * FETCH_MAX_WORKERS, thread_name_prefix="slide-hedge"
+)
+breaker = CircuitBreaker("slide API", failures=BREAKER_FAILURES, reset_after=BREAKER_RESET)
+latencies = LatencyWindow(min_samples=HEDGE_MIN_SAMPLES)
+
+slide_cache = None
+if CACHE_TTL > 0:
+    slide_cache = SlideCache(
+        CACHE_TTL,
+        stale_ttl=CACHE_STALE_TTL,
+        max_bytes=CACHE_MAX_BYTES,
+        executor=ThreadPoolExecutor(max_workers=2, thread_name_prefix="slide-refresh"),
+    )
+
+
+def get_session():
+    """
+    Return the shared keep-alive session used for all slide API calls.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=2 * FETCH_MAX_WORKERS
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def _remaining(deadline):
+    return deadline - time.monotonic()
+
+
+def fetch_slide_data_with_retry(api_url, slide_no, retries=3, deadline=None):
+    """
+    Fetch the payload for a single slide, retrying with exponential backoff.
+
+    `deadline` is a time.monotonic() value after which no further attempt
+    or backoff sleep is started. Payloads come from the slide cache when it
+    is enabled.
+    """
+    with timed_slide(SLIDE_FETCH_SECONDS, slide_no, "slide_fetch"):
+        if slide_cache is None:
+            payload, _, _ = _fetch_slide_data(api_url, slide_no, retries, deadline)
+            return payload
+
+        def fetch(etag):
+            return _fetch_slide_data(api_url, slide_no, retries, deadline, etag)
+
+        return slide_cache.get(_cache_key(api_url, slide_no), fetch)
+
+
+def _cache_key(api_url, slide_no):
+    return (api_url, str(slide_no))
+
+
+def _fetch_slide_data(api_url, slide_no, retries, deadline, etag=None):
+    """
+    Return (payload, etag, size) for a slide, or None if the upstream
+    answered 304 Not Modified to `etag`.
+
+    Each attempt may use an equal share of the time left before `deadline`,
+    so a hung call still leaves room for the retries after it. Attempts
+    slower than the slide's usual latency are hedged, and none are made
+    while the circuit breaker is open.
+    """
+    if deadline is None:
+        deadline = time.monotonic() + FETCH_DEADLINE
+    headers = {"If-None-Match": etag} if etag else None
+    session = get_session()
+    attempt = 0
+    while attempt < retries:
+        remaining = _remaining(deadline)
+        if remaining <= 0:
+            break
+        timeout = remaining / (retries - attempt)
+        breaker.before_call(timeout)
+        try:
+            response = _post_slide(session, api_url, slide_no, headers, timeout)
+            logger.info(
+                "API response status code for slide %s: %s",
+                slide_no,
+                response.status_code,
+                extra=SAMPLED,
+            )
+            logger.debug(
+                "API response content for slide %s: %s",
+                slide_no,
+                Truncated(response.content),
+            )
+            if response.status_code == 304 and etag:
+                breaker.record_success()
+                return None
+            response.raise_for_status()  # Raise an exception for HTTP errors
+            content = response.json()
+            breaker.record_success()
+            PAYLOAD_BYTES.labels(str(slide_no)).observe(len(response.content))
+            return content, response.headers.get("ETag"), len(response.content)
+        except (requests.exceptions.RequestException, TimeoutError, ValueError) as e:
+            logger.error(f"Attempt {attempt + 1} failed with error: {e}")
+            _record_error(e)
+            attempt += 1
+            if attempt < retries:
+                # Exponential backoff, leaving at least half the remaining
+                # budget for the next attempt
+                backoff = max(0, min(2**attempt, _remaining(deadline) / 2))
+                record_retry("slide_fetch", backoff)
+                time.sleep(backoff)
+    raise Exception(
+        f"Failed to fetch slide data for slide {slide_no} after several retries"
+    )
+
+
+def _record_error(e):
+    # Client errors mean the upstream is up; only its own faults count. A
+    # body that is not JSON is a fault of the upstream.
+    error_response = getattr(e, "response", None)
+    if error_response is None or error_response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def _post_slide(session, api_url, slide_no, headers, timeout):
+    """
+    POST one slide request, hedged once it runs past the slide's usual
+    latency.
+    """
+    post = functools.partial(
+        session.post,
+        api_url,
+        json={"slide_no": str(slide_no)},
+        headers=headers,
+        timeout=(min(FETCH_CONNECT_TIMEOUT, timeout), timeout),
+    )
+    hedge_after = None
+    if HEDGE_PERCENTILE:
+        hedge_after = latencies.percentile(slide_no, HEDGE_PERCENTILE)
+    started = time.monotonic()
+    if hedge_after is None:
+        response = post()
+    else:
+        response = hedged_call(_hedge_executor, post, hedge_after, timeout, "slide_fetch")
+    if response.ok:
+        latencies.record(slide_no, time.monotonic() - started)
+    return response
+
+
+def fetch_slides_batch(api_url, slide_numbers, deadline):
+    """
+    Fetch several slides in one request.
+
+    The upstream is expected to accept {"slide_nos": [...]} and answer with a
+    JSON object keyed by slide number. Returns whatever subset it answered.
+    """
+    # Keep half the budget for the per-slide fallback
+    remaining = _remaining(deadline) / 2
+    if remaining <= 0:
+        return {}
+    try:
+        breaker.before_call(remaining)
+        response = get_session().post(
+            api_url,
+            json={"slide_nos": [str(slide_no) for slide_no in slide_numbers]},
+            timeout=(min(FETCH_CONNECT_TIMEOUT, remaining), remaining),
+        )
+        response.raise_for_status()
+        payload = response.json()
+    except CircuitOpenError:
+        return {}
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.error(f"Batched slide request failed, falling back to per-slide: {e}")
+        _record_error(e)
+        return {}
+    breaker.record_success()
+    PAYLOAD_BYTES.labels("batch").observe(len(response.content))
+    size = len(response.content)
+    if not isinstance(payload, dict):
+        logger.error("Batched slide response is not an object, falling back to per-slide")
+        return {}
+    slide_data = {
+        slide_no: payload[str(slide_no)]
+        for slide_no in slide_numbers
+        if str(slide_no) in payload
+    }
+    if slide_cache is not None:
+        # No per-slide ETags here; split the body size evenly for accounting
+        for slide_no, content in slide_data.items():
+            slide_cache.put(
+                _cache_key(api_url, slide_no), content, size=size // len(slide_data)
+            )
+    return slide_data
+
+
+def fetch_all_slide_data(api_url, slide_numbers, retries=3, deadline=None, batch=None):
+    """
+    Fetch the payloads for all slides concurrently.
+
+    Returns a dict keyed by slide number. Deck latency is bounded by the
+    slowest slide rather than the sum of all of them. The fetch never runs
+    past `deadline` or SLIDE_FETCH_DEADLINE seconds, whichever is sooner.
+    """
+    fetch_deadline = time.monotonic() + FETCH_DEADLINE
+    deadline = fetch_deadline if deadline is None else min(deadline, fetch_deadline)
+    if batch is None:
+        batch = FETCH_BATCH
+
+    slide_data = {}
+    if batch:
+        # Slides the cache can answer are left to the per-slide path
+        uncached = [
+            slide_no
+            for slide_no in slide_numbers
+            if slide_cache is None or not slide_cache.cached(_cache_key(api_url, slide_no))
+        ]
+        if uncached:
+            slide_data.update(fetch_slides_batch(api_url, uncached, deadline))
+
+    pending = [slide_no for slide_no in slide_numbers if slide_no not in slide_data]
+    futures = {
+        _executor.submit(
+            fetch_slide_data_with_retry, api_url, slide_no, retries, deadline
+        ): slide_no
+        for slide_no in pending
+    }
+    done, not_done = wait(futures, timeout=max(0, _remaining(deadline)))
+    for future in not_done:
+        future.cancel()
+    if not_done:
+        missing = sorted(futures[future] for future in not_done)
+        raise Exception(f"Timed out fetching slide data for slides {missing}")
+
+    for future in done:
+        slide_data[futures[future]] = future.result()
+
+    # Preserve the requested slide order
+    return {slide_no: slide_data[slide_no] for slide_no in slide_numbers}
@@ -0,0 +1,264 @@
+import time
+import logging
+import threading
+from collections import namedtuple
+
+from layouts import compile_layouts
+from normalize import normalize_slide
+from render import CELL_STYLE, YOY_COLORS
+
+logger = logging.getLogger(__name__)
+
+# What presentations().get has to return to address the template's tables and notes
+TEMPLATE_FIELDS = (
+    "slides(objectId,"
+    "pageElements(objectId,table(rows,columns,tableRows(tableCells("
+    "text(textElements(endIndex,paragraphMarker))))),"
+    "slideProperties(notesPage(notesProperties(speakerNotesObjectId),"
+    "pageElements(objectId,shape(text(textElements(endIndex)))))))"
+)
+
+# Minimal stand-ins for the python-pptx objects compile_layouts() reads, so
+# the same layout plans drive both render engines
+_Table = namedtuple("_Table", ["rows", "columns"])
+_Shape = namedtuple("_Shape", ["has_table", "table"])
+_Slide = namedtuple("_Slide", ["shapes"])
+_Deck = namedtuple("_Deck", ["slides"])
+
+# One template slide: its page id, the object id of every page element (in
+# the order compile_layouts indexes them), the text layout of every table
+# cell as {element_index: [[(length, first_paragraph_end), ...], ...]}, and
+# the speaker notes shape with the length of its text.
+SlidePage = namedtuple(
+    "SlidePage", ["object_id", "element_ids", "cells", "notes_id", "notes_length"]
+)
+
+
+def _utf16_len(text):
+    # Slides text indexes count UTF-16 code units
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _text_layout(text):
+    """
+    Return (length, first_paragraph_end) of a Slides text body; the length
+    includes the final newline, the paragraph end excludes its own.
+    """
+    elements = (text or {}).get("textElements", [])
+    if not elements:
+        return 0, 0
+    length = max(element.get("endIndex", 0) for element in elements)
+    first_end = next(
+        (element.get("endIndex", 0) for element in elements if "paragraphMarker" in element),
+        length,
+    )
+    return length, max(0, first_end - 1)
+
+
+def _parse_page(slide):
+    element_ids, shapes, cells = [], [], {}
+    for index, element in enumerate(slide.get("pageElements", [])):
+        element_ids.append(element["objectId"])
+        table = element.get("table")
+        if table is None:
+            shapes.append(_Shape(False, None))
+            continue
+        shapes.append(_Shape(True, _Table(range(table["rows"]), range(table["columns"]))))
+        cells[index] = [
+            [_text_layout(cell.get("text")) for cell in row.get("tableCells", [])]
+            for row in table.get("tableRows", [])
+        ]
+
+    notes_page = slide.get("slideProperties", {}).get("notesPage", {})
+    notes_id = notes_page.get("notesProperties", {}).get("speakerNotesObjectId")
+    notes_length = 0
+    for element in notes_page.get("pageElements", []):
+        if element["objectId"] == notes_id:
+            notes_length, _ = _text_layout(element.get("shape", {}).get("text"))
+    page = SlidePage(slide["objectId"], element_ids, cells, notes_id, notes_length)
+    return page, _Slide(shapes)
+
+
+class SlidesTemplate:
+    """
+    Google Slides counterpart of the .pptx template.
+
+    The template's structure is read once with presentations().get and its
+    tables are matched to the slide layouts exactly as for the .pptx
+    template. A Drive copy keeps every object id, so the ids read here
+    address the same tables and notes in each copy. The structure is read
+    again after `refresh_after` seconds to pick up template edits.
+    """
+
+    def __init__(self, template_id, pool, refresh_after=300.0):
+        self.template_id = template_id
+        self.pool = pool
+        self.refresh_after = refresh_after
+        # (pages, plans, loaded_at), replaced as a whole so readers never
+        # pair the pages of one load with the plans of another
+        self._loaded = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self.pool.lease() as slides_service:
+            presentation = slides_service.presentations().get(
+                presentationId=self.template_id, fields=TEMPLATE_FIELDS
+            ).execute()
+        pages, slides = [], []
+        for slide in presentation.get("slides", []):
+            page, adapter = _parse_page(slide)
+            pages.append(page)
+            slides.append(adapter)
+        self._loaded = (pages, compile_layouts(_Deck(slides)), time.monotonic())
+        logger.info(f"Loaded Slides template {self.template_id} ({len(pages)} slides)")
+
+    def _current(self):
+        loaded = self._loaded
+        if loaded is None or time.monotonic() - loaded[2] > self.refresh_after:
+            with self._lock:
+                loaded = self._loaded
+                if loaded is None or time.monotonic() - loaded[2] > self.refresh_after:
+                    self._load()
+                    loaded = self._loaded
+        pages, plans, _ = loaded
+        return pages, plans
+
+    def deck_requests(self, data, trim=False):
+        """
+        Return the batchUpdate requests that fill a copy of the template
+        with `data` ({slide_no: content}).
+
+        With `trim`, every slide without data is deleted.
+        """
+        pages, plans = self._current()
+        requests = []
+        for slide_no, content in data.items():
+            if not 0 < slide_no <= len(pages):
+                logger.error(f"Slide number {slide_no} is out of range for the presentation")
+                continue
+            plan = plans.get(slide_no)
+            if plan is None:
+                logger.error(f"No layout defined for slide {slide_no}")
+                continue
+            requests.extend(slide_requests(pages[slide_no - 1], plan, content))
+        if trim:
+            for slide_no, page in enumerate(pages, start=1):
+                if slide_no not in data:
+                    requests.append({"deleteObject": {"objectId": page.object_id}})
+        return requests
+
+
+# CELL_STYLE as a Slides text style
+_CELL_TEXT_STYLE = {
+    "fontFamily": CELL_STYLE.font,
+    "fontSize": {"magnitude": CELL_STYLE.size, "unit": "PT"},
+}
+_ALL = {"type": "ALL"}
+
+
+def _rgb(color):
+    red, green, blue = (int(color[i:i + 2], 16) / 255 for i in (0, 2, 4))
+    return {"opaqueColor": {"rgbColor": {"red": red, "green": green, "blue": blue}}}
+
+
+def _update_style(object_id, location, text_range, style, fields):
+    return {
+        "updateTextStyle": {
+            "objectId": object_id,
+            "cellLocation": location,
+            "style": style,
+            "textRange": text_range,
+            "fields": fields,
+        }
+    }
+
+
+def slide_requests(page, plan, content):
+    """
+    Return the requests populating one slide, mirroring populate_slide().
+    """
+    requests = []
+    normalized = normalize_slide(content, plan, bands=YOY_COLORS)
+
+    if plan.main_table is not None:
+        table_id = page.element_ids[plan.main_table]
+        cells = page.cells[plan.main_table]
+        for row, col, text, color in zip(
+            normalized.rows, normalized.columns, normalized.texts, normalized.bands
+        ):
+            location = {"rowIndex": row, "columnIndex": col}
+            length, _ = cells[row][col]
+            # Only the closing newline is left in an empty cell, and the
+            # API refuses to delete from it
+            if length > 1:
+                requests.append(
+                    {
+                        "deleteText": {
+                            "objectId": table_id,
+                            "cellLocation": location,
+                            "textRange": _ALL,
+                        }
+                    }
+                )
+            if text:
+                requests.append(
+                    {
+                        "insertText": {
+                            "objectId": table_id,
+                            "cellLocation": location,
+                            "text": text,
+                            "insertionIndex": 0,
+                        }
+                    }
+                )
+                style, fields = _CELL_TEXT_STYLE, "fontFamily,fontSize"
+                if color is not None:
+                    style = dict(style, foregroundColor=_rgb(color))
+                    fields += ",foregroundColor"
+                requests.append(_update_style(table_id, location, _ALL, style, fields))
+
+    if plan.insights_table is not None:
+        table_id = page.element_ids[plan.insights_table]
+        cells = page.cells[plan.insights_table]
+        for row, title, narrative in normalized.insights:
+            # Bold title and narrative appended to the cell's first paragraph
+            location = {"rowIndex": row, "columnIndex": 0}
+            _, start = cells[row][0]
+            title_end = start + _utf16_len(title)
+            end = title_end + _utf16_len(f" {narrative}")
+            requests.append(
+                {
+                    "insertText": {
+                        "objectId": table_id,
+                        "cellLocation": location,
+                        "text": f"{title} {narrative}",
+                        "insertionIndex": start,
+                    }
+                }
+            )
+            requests.append(
+                _update_style(table_id, location, _ALL, _CELL_TEXT_STYLE, "fontFamily,fontSize")
+            )
+            for range_start, range_end, bold in ((start, title_end, True), (title_end, end, False)):
+                if range_end > range_start:
+                    text_range = {
+                        "type": "FIXED_RANGE",
+                        "startIndex": range_start,
+                        "endIndex": range_end,
+                    }
+                    requests.append(
+                        _update_style(table_id, location, text_range, {"bold": bold}, "bold")
+                    )
+
+        if normalized.notes is not None and page.notes_id is not None:
+            requests.append(
+                {
+                    "insertText": {
+                        "objectId": page.notes_id,
+                        "text": "\n" + normalized.notes,
+                        "insertionIndex": max(0, page.notes_length - 1),
+                    }
+                }
+            )
+
+    return requests
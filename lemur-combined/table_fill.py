@@ -0,0 +1,136 @@
+import re
+import copy
+from itertools import repeat
+from collections import namedtuple
+
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls, qn
+
+# Font styling applied to a run; size is in points, bold None leaves it unset
+# and color is an RGB hex string such as "FF0000" (None keeps the theme's)
+RunStyle = namedtuple("RunStyle", ["font", "size", "bold", "color"])
+RunStyle.__new__.__defaults__ = (None, None)
+
+# Control characters python-pptx escapes as _xHHHH_ (tab and newline excepted)
+_CTRL_CHARS = re.compile(r"([\x00-\x08\x0B-\x1F])")
+
+_END_PARA_RPR = qn("a:endParaRPr")
+
+_run_templates = {}
+
+
+def _escape(text):
+    return _CTRL_CHARS.sub(lambda match: "_x%04X_" % ord(match.group(1)), text)
+
+
+def _run_template(style):
+    """
+    Return the pre-built `a:r` element for `style`, building it once.
+    """
+    template = _run_templates.get(style)
+    if template is None:
+        attrs = ""
+        if style.bold is not None:
+            attrs += ' b="%d"' % bool(style.bold)
+        attrs += ' sz="%d"' % round(style.size * 100)
+        fill = ""
+        if style.color is not None:
+            fill = '<a:solidFill><a:srgbClr val="%s"/></a:solidFill>' % style.color
+        template = parse_xml(
+            '<a:r %s><a:rPr%s>%s<a:latin typeface="%s"/></a:rPr><a:t/></a:r>'
+            % (nsdecls("a"), attrs, fill, style.font)
+        )
+        _run_templates[style] = template
+    return template
+
+
+def make_run(text, style):
+    """
+    Return a new styled `a:r` element containing `text`.
+    """
+    r = copy.deepcopy(_run_template(style))
+    r[-1].text = _escape(text)
+    return r
+
+
+def _tc_grid(table):
+    # One XPath pass over the table instead of one per cell lookup
+    return [tr.tc_lst for tr in table._tbl.tr_lst]
+
+
+def fill_cells(table, writes, style, colors=None):
+    """
+    Replace the text of many cells in one pass.
+
+    `writes` is an iterable of (row, col, text). Each cell ends up exactly as
+    if `cell.text = text` had been followed by styling every run with
+    `style`, but the styled runs are built straight into the cell XML.
+    `colors` optionally gives a text colour per write (None for none), as
+    font.color.rgb would set it.
+    """
+    grid = _tc_grid(table)
+    plain = _run_template(style)
+    for (row, col, text), color in zip(writes, repeat(None) if colors is None else colors):
+        template = plain if color is None else _run_template(style._replace(color=color))
+        txBody = grid[row][col].get_or_add_txBody()
+        txBody.clear_content()
+        for p_text in text.split("\n"):
+            p = txBody.add_p()
+            for idx, r_text in enumerate(p_text.split("\v")):
+                if idx > 0:
+                    p.add_br()
+                if r_text:
+                    r = copy.deepcopy(template)
+                    r[-1].text = _escape(r_text)
+                    p.append(r)
+
+
+def restyle_runs(txBody, style):
+    """
+    Apply `style` to every existing run of a text body.
+    """
+    for p in txBody.p_lst:
+        for r in p.r_lst:
+            rPr = r.get_or_add_rPr()
+            rPr.get_or_add_latin().typeface = style.font
+            rPr.sz = round(style.size * 100)
+
+
+def append_runs(table, row, col, runs, restyle=None):
+    """
+    Append styled runs to the first paragraph of a cell.
+
+    `runs` is a sequence of (text, RunStyle). With `restyle`, the runs
+    already in the cell are restyled first.
+    """
+    txBody = _tc_grid(table)[row][col].get_or_add_txBody()
+    _append_runs(txBody, runs, restyle)
+
+
+def _append_runs(txBody, runs, restyle):
+    if restyle is not None:
+        restyle_runs(txBody, restyle)
+    p_lst = txBody.p_lst
+    p = p_lst[0] if p_lst else txBody.add_p()
+    end = p.find(_END_PARA_RPR)
+    for text, style in runs:
+        r = make_run(text, style)
+        if end is not None:
+            end.addprevious(r)
+        else:
+            p.append(r)
+
+
+def fill_insights(table, insights, style):
+    """
+    Write the bold-title + narrative insight pattern into column 0.
+
+    `insights` is an iterable of (row, title, narrative). Existing runs in
+    each cell are restyled with `style`, then a bold title run and a
+    narrative run are appended to the first paragraph.
+    """
+    grid = _tc_grid(table)
+    title_style = style._replace(bold=True)
+    for row, title, narrative in insights:
+        txBody = grid[row][0].get_or_add_txBody()
+        _append_runs(txBody, ((title, title_style), (f" {narrative}", style)), style)
@@ -0,0 +1,276 @@
+import io
+import os
+import copy
+import hashlib
+import logging
+import threading
+
+from pptx import Presentation
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.opc.package import _Relationship
+from pptx.util import lazyproperty
+
+from metrics import timed_stage
+from package_writer import DeltaWriter
+
+logger = logging.getLogger(__name__)
+
+# Elements that only carry a jump to another slide and can be dropped with it
+_SLIDE_LINK_TAGS = ("hlinkClick", "hlinkMouseOver")
+
+
+class TemplateCache:
+    """
+    Parsed copy of the presentation template shared by every request.
+
+    The template is parsed once per worker. `checkout()` hands out an
+    independent Presentation whose parts share the parsed XML of the master
+    copy; only the parts a request is going to modify get their own deep
+    copy. `save()` writes such a Presentation by copying every part it did
+    not change straight out of the template file. The template is reloaded
+    automatically when the file changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._master = None
+        self._signature = None
+        self._writer = None
+        self._slide_partnames = []
+        self.digest = None
+        self._derived = {}
+
+    def load(self):
+        """
+        Parse the template file into the master copy.
+        """
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        stat = os.stat(self.path)
+        with open(self.path, "rb") as f:
+            blob = f.read()
+        with timed_stage("template_load"):
+            master = Presentation(io.BytesIO(blob))
+        self._slide_partnames = [
+            (slide.part.partname, _notes_partname(slide.part))
+            for slide in master.slides
+        ]
+        self._writer = DeltaWriter(blob, master.part.package)
+        self._master = master
+        self._signature = (stat.st_mtime_ns, stat.st_size)
+        self.digest = hashlib.sha256(blob).hexdigest()
+        self._derived = {}
+        logger.info(
+            f"Loaded template {self.path} ({len(blob)} bytes, {len(self._slide_partnames)} slides)"
+        )
+
+    def _ensure_current(self):
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError as e:
+            if self._master is None:
+                raise
+            logger.error(f"Could not stat template {self.path}, using cached copy: {e}")
+            return
+        if signature != self._signature:
+            with self._lock:
+                if signature != self._signature:
+                    if self._master is not None:
+                        logger.info(f"Template {self.path} changed on disk, reloading")
+                    self._load()
+
+    def current_digest(self):
+        """
+        Return the SHA-256 of the template, reloading it first if it changed.
+        """
+        self._ensure_current()
+        return self.digest
+
+    def derive(self, name, fn):
+        """
+        Return `fn(master)` computed once per template version.
+
+        Used for data precomputed from the template, such as compiled slide
+        layouts; it is recomputed after the template is reloaded.
+        """
+        self._ensure_current()
+        derived = self._derived
+        if name not in derived:
+            with self._lock:
+                if name not in self._derived:
+                    self._derived[name] = fn(self._master)
+                derived = self._derived
+        return derived[name]
+
+    def slide_partnames(self, slide_no):
+        """
+        Return the (slide, notes) partnames of a 1-based template slide; the
+        notes partname is None if the slide has no notes page.
+        """
+        self._ensure_current()
+        return self._slide_partnames[slide_no - 1]
+
+    def save(self, prs):
+        """
+        Return `prs`, checked out from this template, as a DeckPackage: a
+        file object over the .pptx whose untouched parts are the template's
+        compressed bytes, copied as they are.
+        """
+        return self._writer.write(prs.part.package)
+
+    def checkout(self, slide_numbers=None, mutable_presentation=False, rendered=None):
+        """
+        Return an independent Presentation cloned from the cached template.
+
+        `slide_numbers` are the 1-based slides the caller will modify; those
+        slides and their notes get private XML. Pass None to copy every
+        slide. `mutable_presentation` also gives the caller a private copy of
+        the presentation part, e.g. to reorder or drop slides.
+
+        `rendered` maps slide numbers to (slide, notes) XML elements from an
+        earlier render of this template, used in place of the template's
+        XML for those slides.
+        """
+        self._ensure_current()
+        master = self._master
+
+        overrides = {}
+        for slide_no, elements in (rendered or {}).items():
+            if 0 < slide_no <= len(self._slide_partnames):
+                for partname, element in zip(self._slide_partnames[slide_no - 1], elements):
+                    if partname and element is not None:
+                        overrides[partname] = element
+
+        if slide_numbers is None:
+            slide_numbers = range(1, len(self._slide_partnames) + 1)
+        mutable = set()
+        for slide_no in slide_numbers:
+            if 0 < slide_no <= len(self._slide_partnames):
+                mutable.update(p for p in self._slide_partnames[slide_no - 1] if p)
+        if mutable_presentation:
+            mutable.add(master.part.partname)
+
+        return _clone_presentation(master, mutable, overrides)
+
+
+def _notes_partname(slide_part):
+    for rel in slide_part.rels.values():
+        if rel.reltype.endswith("/notesSlide") and not rel.is_external:
+            return rel.target_part.partname
+    return None
+
+
+def _clone_part(part, package, mutable, overrides):
+    """
+    Shallow-copy a part onto `package`, dropping cached lazy properties.
+    """
+    clone = object.__new__(type(part))
+    cls = type(part)
+    for name, value in part.__dict__.items():
+        if isinstance(getattr(cls, name, None), lazyproperty):
+            continue
+        clone.__dict__[name] = value
+    clone._package = package
+    if part.partname in overrides:
+        clone._element = overrides[part.partname]
+    if part.partname in mutable and hasattr(part, "_element"):
+        clone._element = copy.deepcopy(clone._element)
+    return clone
+
+
+def _clone_rels(source_rels, target_rels, parts):
+    for rId, rel in source_rels.items():
+        target = rel.target_ref if rel.is_external else parts[rel.target_partname]
+        target_rels._rels[rId] = _Relationship(
+            target_rels._base_uri, rId, rel.reltype, rel._target_mode, target
+        )
+
+
+def _clone_presentation(master, mutable, overrides=None):
+    """
+    Build a new package whose parts share unmodified XML with `master`, or
+    with the elements in `overrides` (partname -> element).
+    """
+    overrides = overrides or {}
+    master_package = master.part.package
+    package = type(master_package)(None)
+
+    master_parts = list(master_package.iter_parts())
+    parts = {
+        part.partname: _clone_part(part, package, mutable, overrides)
+        for part in master_parts
+    }
+    for master_part in master_parts:
+        _clone_rels(master_part.rels, parts[master_part.partname]._rels, parts)
+    _clone_rels(master_package._rels, package._rels, parts)
+
+    return package.main_document_part.presentation
+
+
+def trim_presentation(prs, slide_numbers):
+    """
+    Drop every slide of `prs` except the 1-based `slide_numbers`.
+
+    Dropped slides are removed from the slide list and the presentation
+    part's relationships, and slide layouts no kept slide uses are removed
+    from their masters. The package writer only follows relationships, so
+    notes, layouts and media nothing else references are left out of the
+    saved file. Links from kept slides to dropped ones are removed.
+    `prs` must own a private presentation part and private copies of the
+    kept slides (see TemplateCache.checkout).
+    """
+    keep = set(slide_numbers)
+    sldIdLst = prs.slides._sldIdLst
+    kept_parts, dropped_parts = [], set()
+    for slide_no, sldId in enumerate(list(sldIdLst), start=1):
+        slide_part = prs.part.related_part(sldId.rId)
+        if slide_no in keep:
+            kept_parts.append(slide_part)
+            continue
+        dropped_parts.add(slide_part)
+        sldIdLst.remove(sldId)
+        prs.part.drop_rel(sldId.rId)
+
+    for slide_part in kept_parts:
+        for rId, rel in list(slide_part.rels.items()):
+            if rel.reltype != RT.SLIDE or rel.is_external:
+                continue
+            if rel.target_part not in dropped_parts:
+                continue
+            for element in slide_part._element.xpath(f'.//*[@r:id="{rId}"]'):
+                if element.tag.rsplit("}", 1)[-1] in _SLIDE_LINK_TAGS:
+                    element.getparent().remove(element)
+            slide_part.drop_rel(rId)
+
+    _drop_unused_layouts(prs, kept_parts)
+    return prs
+
+
+def _drop_unused_layouts(prs, kept_parts):
+    """
+    Remove slide layouts no kept slide uses, along with what only they use.
+
+    Masters get a private copy of their XML first since they are shared with
+    the template. A master keeps at least one layout.
+    """
+    used = {slide_part.part_related_by(RT.SLIDE_LAYOUT) for slide_part in kept_parts}
+    for rel in list(prs.part.rels.values()):
+        if rel.reltype != RT.SLIDE_MASTER:
+            continue
+        master_part = rel.target_part
+        entries = master_part._element.sldLayoutIdLst.sldLayoutId_lst
+        unused = [
+            entry for entry in entries if master_part.related_part(entry.rId) not in used
+        ]
+        if not unused or len(unused) == len(entries):
+            continue
+        master_part._element = copy.deepcopy(master_part._element)
+        sldLayoutIdLst = master_part._element.sldLayoutIdLst
+        for entry in list(sldLayoutIdLst.sldLayoutId_lst):
+            if master_part.related_part(entry.rId) not in used:
+                sldLayoutIdLst.remove(entry)
+                master_part.drop_rel(entry.rId)
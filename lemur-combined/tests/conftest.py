@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The service modules live next to main.py, not in a package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
@@ -0,0 +1,121 @@
+import threading
+
+import pytest
+
+from admission import AdmissionRejected, MemoryAdmission
+
+MB = 1024 * 1024
+
+
+class FakeRss:
+    def __init__(self, value=100 * MB):
+        self.value = value
+
+    def __call__(self):
+        return self.value
+
+
+def _admission(rss, **kwargs):
+    kwargs.setdefault("estimate", 10 * MB)
+    kwargs.setdefault("sample_interval", 0.001)
+    return MemoryAdmission(rss=rss, **kwargs)
+
+
+def _render(admission, rss, growth):
+    with admission.admit(timeout=1):
+        rss.value += growth
+    rss.value -= growth
+
+
+def test_without_budget_everything_is_admitted():
+    rss = FakeRss()
+    admission = _admission(rss)
+    holds = [admission.admit(timeout=0) for _ in range(5)]
+    for hold in holds:
+        hold.__enter__()
+    assert admission.stats()["in_flight"] == 5
+    for hold in holds:
+        hold.__exit__(None, None, None)
+    assert admission.stats()["admitted"] == 5
+
+
+def test_reservation_follows_measured_peaks_but_never_drops_below_the_estimate():
+    rss = FakeRss()
+    admission = _admission(rss)
+    _render(admission, rss, 30 * MB)
+    assert admission.stats()["estimate_bytes"] == 30 * MB
+    # Arenas stay mapped: RSS no longer grows during renders
+    for _ in range(60):
+        _render(admission, rss, 0)
+    assert admission.stats()["estimate_bytes"] == 10 * MB
+
+
+def test_renders_over_budget_wait_and_are_rejected_after_their_timeout():
+    rss = FakeRss()
+    admission = _admission(rss, budget=100 * MB + 25 * MB)
+    with admission.admit(timeout=0):
+        with admission.admit(timeout=0):
+            with pytest.raises(AdmissionRejected) as excinfo:
+                with admission.admit(timeout=0.05):
+                    pass
+    assert excinfo.value.retry_after > 0
+    stats = admission.stats()
+    assert (stats["admitted"], stats["queued"], stats["rejected"]) == (2, 1, 1)
+
+
+def test_waiting_render_starts_when_one_finishes():
+    rss = FakeRss()
+    admission = _admission(rss, budget=100 * MB + 15 * MB)
+    first = admission.admit(timeout=0)
+    first.__enter__()
+    started = threading.Event()
+
+    def second():
+        with admission.admit(timeout=2):
+            started.set()
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    assert not started.wait(0.05)
+    assert admission.stats()["waiting"] == 1
+    first.__exit__(None, None, None)
+    thread.join(2)
+    assert started.is_set()
+
+
+def test_a_lone_render_is_admitted_even_over_budget():
+    rss = FakeRss(500 * MB)
+    admission = _admission(rss, budget=100 * MB)
+    with admission.admit(timeout=0):
+        assert admission.stats()["in_flight"] == 1
+
+
+def test_overlapping_renders_share_the_measured_growth():
+    rss = FakeRss()
+    admission = _admission(rss, estimate=1)
+    first, second = admission.admit(), admission.admit()
+    first.__enter__()
+    second.__enter__()
+    rss.value += 40 * MB
+    first.__exit__(None, None, None)
+    second.__exit__(None, None, None)
+    assert admission.stats()["estimate_bytes"] == 20 * MB
+
+
+def test_recycle_is_requested_once_idle_rss_drifts_past_the_baseline():
+    rss = FakeRss()
+    admission = _admission(rss, recycle_drift=50 * MB, warmup=2)
+    for _ in range(2):
+        _render(admission, rss, 0)
+    assert admission.stats()["baseline_rss_bytes"] == 100 * MB
+    rss.value += 40 * MB
+    _render(admission, rss, 0)
+    assert not admission.should_recycle()
+    rss.value += 20 * MB
+    hold = admission.admit()
+    hold.__enter__()
+    hold.__exit__(None, None, None)
+    assert admission.should_recycle()
+    # Not while a render is running
+    with admission.admit():
+        assert not admission.should_recycle()
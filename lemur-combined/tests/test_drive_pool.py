@@ -0,0 +1,209 @@
+import contextlib
+import threading
+import time
+
+import pytest
+
+import drive_pool
+from drive_pool import PermissionBatcher
+
+
+class FakeDrive:
+    """
+    Drive service whose permission requests can be held open and failed.
+    """
+
+    def __init__(self):
+        self.sent = []
+        self.release = threading.Event()
+        self.release.set()
+        self.failing = set()
+        self.batch_error = None
+
+    def permissions(self):
+        return self
+
+    def create(self, fileId, body):
+        return _Request(self, fileId)
+
+    def new_batch_http_request(self, callback):
+        return _Batch(self, callback)
+
+    def answer(self, file_id):
+        if file_id in self.failing:
+            return None, RuntimeError(f"denied {file_id}")
+        return {"id": file_id}, None
+
+
+class _Request:
+    def __init__(self, drive, file_id):
+        self.drive = drive
+        self.file_id = file_id
+
+    def execute(self):
+        self.drive.sent.append([self.file_id])
+        self.drive.release.wait()
+        response, error = self.drive.answer(self.file_id)
+        if error is not None:
+            raise error
+        return response
+
+
+class _Batch:
+    def __init__(self, drive, callback):
+        self.drive = drive
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request, request_id))
+
+    def execute(self):
+        self.drive.sent.append([request.file_id for request, _ in self.requests])
+        self.drive.release.wait()
+        if self.drive.batch_error is not None:
+            raise self.drive.batch_error
+        for request, request_id in self.requests:
+            self.callback(request_id, *self.drive.answer(request.file_id))
+
+
+class FakePool:
+    def __init__(self, drive):
+        self.drive = drive
+
+    @contextlib.contextmanager
+    def lease(self):
+        yield self.drive
+
+
+def _grant_all(batcher, drive, file_ids, results):
+    """
+    Start a grant per file id, each once the previous one is queued or sent,
+    recording each result or error in `results`. Returns the threads.
+    """
+
+    def grant(file_id):
+        try:
+            results[file_id] = batcher.grant(file_id, {"role": "reader"})
+        except Exception as e:
+            results[file_id] = e
+
+    threads = []
+    for file_id in file_ids:
+        thread = threading.Thread(target=grant, args=(file_id,))
+        thread.start()
+        threads.append(thread)
+        _wait_for(lambda: _queued_or_sent(batcher, drive, file_id))
+    return threads
+
+
+def _queued_or_sent(batcher, drive, file_id):
+    with batcher._lock:
+        queued = [entry.file_id for entry in batcher._pending]
+    return file_id in queued or any(file_id in sent for sent in drive.sent)
+
+
+def _wait_for(condition, timeout=2):
+    stop = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < stop
+        time.sleep(0.001)
+
+
+def _join(threads):
+    for thread in threads:
+        thread.join(2)
+        assert not thread.is_alive()
+
+
+def test_a_lone_grant_is_sent_as_a_single_request():
+    drive = FakeDrive()
+    batcher = PermissionBatcher(FakePool(drive))
+    assert batcher.grant("a", {"role": "reader"}) == {"id": "a"}
+    assert drive.sent == [["a"]]
+    assert batcher.stats() == {"batches": 1, "grants": 1}
+    assert not batcher._flushing
+
+
+def test_grants_queued_behind_a_request_in_flight_share_one_batch():
+    drive = FakeDrive()
+    drive.release.clear()
+    batcher = PermissionBatcher(FakePool(drive))
+    results = {}
+    threads = _grant_all(batcher, drive, ["a"], results)
+    _wait_for(lambda: drive.sent)
+    more = _grant_all(batcher, drive, ["b", "c", "d"], results)
+    _wait_for(lambda: len(batcher._pending) == 3)
+    drive.release.set()
+    _join(threads + more)
+    assert drive.sent == [["a"], ["b", "c", "d"]]
+    assert results == {file_id: {"id": file_id} for file_id in "abcd"}
+    assert not batcher._flushing
+
+
+def test_batches_are_capped_and_each_caller_sends_at_most_one(monkeypatch):
+    monkeypatch.setattr(drive_pool, "MAX_BATCH_SIZE", 2)
+    drive = FakeDrive()
+    drive.release.clear()
+    batcher = PermissionBatcher(FakePool(drive))
+    senders = {}
+    send = batcher._send
+
+    def record_sender(batch):
+        senders.setdefault(threading.current_thread(), []).append(batch)
+        send(batch)
+
+    monkeypatch.setattr(batcher, "_send", record_sender)
+    results = {}
+    threads = _grant_all(batcher, drive, ["a"], results)
+    _wait_for(lambda: drive.sent)
+    more = _grant_all(batcher, drive, ["b", "c", "d", "e", "f"], results)
+    _wait_for(lambda: len(batcher._pending) == 5)
+    drive.release.set()
+    _join(threads + more)
+    assert drive.sent == [["a"], ["b", "c"], ["d", "e"], ["f"]]
+    assert all(len(batches) == 1 for batches in senders.values())
+    assert batcher.stats() == {"batches": 4, "grants": 6}
+
+
+def test_a_failed_batch_fails_every_grant_in_it():
+    drive = FakeDrive()
+    drive.release.clear()
+    batcher = PermissionBatcher(FakePool(drive))
+    results = {}
+    threads = _grant_all(batcher, drive, ["a"], results)
+    _wait_for(lambda: drive.sent)
+    more = _grant_all(batcher, drive, ["b", "c"], results)
+    _wait_for(lambda: len(batcher._pending) == 2)
+    drive.batch_error = RuntimeError("batch refused")
+    drive.release.set()
+    _join(threads + more)
+    assert all(results[file_id] is drive.batch_error for file_id in "bc")
+    assert not batcher._flushing
+    # The batcher keeps working afterwards
+    assert batcher.grant("d", {}) == {"id": "d"}
+
+
+def test_errors_of_single_grants_in_a_batch_go_to_their_callers():
+    drive = FakeDrive()
+    drive.release.clear()
+    drive.failing = {"c"}
+    batcher = PermissionBatcher(FakePool(drive))
+    results = {}
+    threads = _grant_all(batcher, drive, ["a"], results)
+    _wait_for(lambda: drive.sent)
+    more = _grant_all(batcher, drive, ["b", "c", "d"], results)
+    _wait_for(lambda: len(batcher._pending) == 3)
+    drive.release.set()
+    _join(threads + more)
+    assert results["b"] == {"id": "b"} and results["d"] == {"id": "d"}
+    assert isinstance(results["c"], RuntimeError)
+
+
+def test_a_failed_lone_grant_raises():
+    drive = FakeDrive()
+    drive.failing = {"a"}
+    batcher = PermissionBatcher(FakePool(drive))
+    with pytest.raises(RuntimeError):
+        batcher.grant("a", {})
+    assert not batcher._flushing
@@ -0,0 +1,196 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from fetch_policy import (
+    BREAKER_CLOSED,
+    BREAKER_HALF_OPEN,
+    BREAKER_OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    LatencyWindow,
+    hedged_call,
+)
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=4)
+    yield executor
+    executor.shutdown(wait=False)
+
+
+def _open_breaker(reset_after=0.05):
+    breaker = CircuitBreaker("test", failures=2, reset_after=reset_after)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failures=3, reset_after=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == BREAKER_CLOSED
+    breaker.record_failure()
+    assert breaker.state == BREAKER_OPEN
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.before_call(timeout=1)
+    assert 59 < excinfo.value.retry_after <= 60
+    assert breaker.stats() == {
+        "opened": 1,
+        "rejected": 1,
+        "open": 1,
+        "consecutive_failures": 3,
+    }
+
+
+def test_disabled_breaker_never_rejects():
+    breaker = CircuitBreaker("test", failures=0)
+    for _ in range(10):
+        breaker.record_failure()
+    breaker.before_call(timeout=0)
+    assert breaker.state == BREAKER_CLOSED
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    breaker.before_call(timeout=1)
+    assert breaker.state == BREAKER_HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call(timeout=0)
+
+
+def test_trial_success_closes_and_releases_waiters():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    breaker.before_call(timeout=1)
+    admitted = threading.Event()
+
+    def wait_for_trial():
+        breaker.before_call(timeout=2)
+        admitted.set()
+
+    waiter = threading.Thread(target=wait_for_trial)
+    waiter.start()
+    time.sleep(0.05)
+    assert not admitted.is_set()
+    breaker.record_success()
+    waiter.join(2)
+    assert admitted.is_set()
+    assert breaker.state == BREAKER_CLOSED
+
+
+def test_trial_failure_reopens_and_rejects_waiters():
+    breaker = _open_breaker(reset_after=30)
+    breaker._opened_at -= 31
+    breaker.before_call(timeout=1)
+    errors = []
+
+    def wait_for_trial():
+        try:
+            breaker.before_call(timeout=2)
+        except CircuitOpenError as e:
+            errors.append(e)
+
+    waiter = threading.Thread(target=wait_for_trial)
+    waiter.start()
+    time.sleep(0.05)
+    breaker.record_failure()
+    waiter.join(2)
+    assert len(errors) == 1
+    assert breaker.state == BREAKER_OPEN
+    assert breaker.stats()["opened"] == 2
+
+
+def test_abandoned_trial_expires_after_its_timeout():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    # The trial caller never reports an outcome
+    breaker.before_call(timeout=0.1)
+    started = time.monotonic()
+    breaker.before_call(timeout=1)
+    assert 0.05 < time.monotonic() - started < 0.5
+    breaker.record_success()
+    assert breaker.state == BREAKER_CLOSED
+
+
+def test_latency_window_needs_min_samples():
+    window = LatencyWindow(size=10, min_samples=3)
+    window.record("a", 1.0)
+    window.record("a", 3.0)
+    assert window.percentile("a", 50) is None
+    window.record("a", 2.0)
+    assert window.percentile("a", 50) == 2.0
+    assert window.percentile("a", 99) == 3.0
+    for _ in range(10):
+        window.record("a", 5.0)
+    assert window.percentile("a", 0) == 5.0
+    assert window.percentile("b", 50) is None
+
+
+def test_fast_call_is_not_hedged(executor):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return "ok"
+
+    assert hedged_call(executor, fn, hedge_after=1, timeout=2, operation="test") == "ok"
+    assert len(calls) == 1
+
+
+def test_slow_call_is_hedged_and_the_faster_answer_wins(executor):
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(2)
+            return "primary"
+        return "hedge"
+
+    assert hedged_call(executor, fn, hedge_after=0.02, timeout=2, operation="test") == "hedge"
+    assert len(calls) == 2
+    release.set()
+
+
+def test_hedged_call_raises_once_every_call_failed(executor):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        time.sleep(0.05)
+        raise ValueError(f"failure {len(calls)}")
+
+    with pytest.raises(ValueError):
+        hedged_call(executor, fn, hedge_after=0.01, timeout=2, operation="test")
+    assert len(calls) == 2
+
+
+def test_hedged_call_survives_one_failure(executor):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.05)
+            raise ValueError("primary failed")
+        time.sleep(0.1)
+        return "hedge"
+
+    assert hedged_call(executor, fn, hedge_after=0.01, timeout=2, operation="test") == "hedge"
+
+
+def test_hedged_call_times_out(executor):
+    release = threading.Event()
+    with pytest.raises(TimeoutError):
+        hedged_call(executor, lambda: release.wait(2), hedge_after=0.01, timeout=0.1, operation="test")
+    release.set()
@@ -0,0 +1,147 @@
+import io
+import os
+import posixpath
+import struct
+import zipfile
+
+import pytest
+from lxml import etree
+
+from conftest import ROOT
+from package_writer import DeckPackage, zip_entries
+from template_cache import TemplateCache
+
+TEMPLATE = os.path.join(ROOT, "template.pptx")
+
+
+@pytest.fixture(scope="module")
+def template():
+    cache = TemplateCache(TEMPLATE)
+    cache.load()
+    return cache
+
+
+@pytest.fixture(scope="module")
+def template_blob():
+    with open(TEMPLATE, "rb") as f:
+        return f.read()
+
+
+def _modified_deck(template, slide_no=14):
+    prs = template.checkout([slide_no])
+    shape = next(s for s in prs.slides[slide_no - 1].shapes if s.has_text_frame)
+    shape.text_frame.text = "Changed by the test"
+    return prs
+
+
+def _saved(prs):
+    out = io.BytesIO()
+    prs.save(out)
+    return out.getvalue()
+
+
+def _relationships(name, data):
+    # Targets resolved against the source part: the template writes some as
+    # absolute paths where python-pptx writes relative ones
+    base = posixpath.dirname(posixpath.dirname(name))
+    rels = set()
+    for rel in etree.fromstring(data):
+        attrib = dict(rel.attrib)
+        if attrib.get("TargetMode") != "External":
+            attrib["Target"] = posixpath.normpath(posixpath.join("/", base, attrib["Target"]))
+        rels.add(tuple(sorted(attrib.items())))
+    return rels
+
+
+def _canonical(data):
+    return etree.tostring(etree.fromstring(data), method="c14n")
+
+
+def test_delta_zip_passes_crc_check(template):
+    package = template.save(_modified_deck(template))
+    with zipfile.ZipFile(io.BytesIO(package.getvalue())) as archive:
+        assert archive.testzip() is None
+
+
+def test_delta_zip_matches_prs_save(template):
+    prs = _modified_deck(template)
+    delta = zipfile.ZipFile(io.BytesIO(template.save(prs).getvalue()))
+    reference = zipfile.ZipFile(io.BytesIO(_saved(prs)))
+    assert delta.namelist() == reference.namelist()
+    for name in reference.namelist():
+        expected, actual = reference.read(name), delta.read(name)
+        if name.endswith(".rels"):
+            # Relationships are equal as a set; their order may differ
+            assert _relationships(name, actual) == _relationships(name, expected), name
+        elif name.endswith(".xml"):
+            assert _canonical(actual) == _canonical(expected), name
+        else:
+            assert actual == expected, name
+
+
+def test_local_headers_agree_with_central_directory(template):
+    blob = template.save(_modified_deck(template)).getvalue()
+    header = struct.Struct(zipfile.structFileHeader)
+    with zipfile.ZipFile(io.BytesIO(blob)) as archive:
+        infos = archive.infolist()
+        for info in infos:
+            fields = header.unpack_from(blob, info.header_offset)
+            assert fields[0] == zipfile.stringFileHeader
+            assert fields[7:10] == (info.CRC, info.compress_size, info.file_size)
+            name_start = info.header_offset + header.size
+            assert blob[name_start:name_start + fields[10]].decode("utf-8") == info.filename
+        # Members are laid out back to back, followed by the central directory
+        ends = [
+            info.header_offset + header.size + len(info.filename.encode("utf-8"))
+            + info.compress_size
+            for info in infos
+        ]
+        assert [info.header_offset for info in infos[1:]] == ends[:-1]
+        assert archive.start_dir == ends[-1]
+
+
+def test_untouched_parts_are_copied_compressed(template, template_blob):
+    blob = template.save(_modified_deck(template)).getvalue()
+    before, after = zip_entries(template_blob), zip_entries(blob)
+    changed = {name for name in after if name not in before or after[name].data != before[name].data}
+    assert "ppt/slides/slide14.xml" in changed
+    assert "ppt/slides/slide15.xml" not in changed
+    assert "ppt/media/" not in {name[:10] for name in changed}
+
+
+def test_unmodified_checkout_copies_every_slide(template, template_blob):
+    blob = template.save(template.checkout([])).getvalue()
+    before, after = zip_entries(template_blob), zip_entries(blob)
+    slides = [name for name in after if name.startswith("ppt/slides/slide")]
+    assert slides
+    assert all(after[name].data == before[name].data for name in slides)
+
+
+def test_deck_package_reads_across_segments():
+    segments = [b"abc", b"", b"defgh", b"i", b"jklmnop"]
+    package = DeckPackage(segments)
+    expected = b"".join(segments)
+    assert len(package) == len(expected)
+    assert package.getvalue() == expected
+    chunks = []
+    while True:
+        chunk = package.read(4)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    assert b"".join(chunks) == expected
+    assert package.tell() == len(expected)
+
+
+def test_deck_package_seek():
+    package = DeckPackage([b"0123", b"4567", b"89"])
+    assert package.seek(5) == 5
+    assert package.read(3) == b"567"
+    assert package.seek(-2, io.SEEK_CUR) == 6
+    assert package.read() == b"6789"
+    assert package.seek(-3, io.SEEK_END) == 7
+    assert package.read(10) == b"789"
+    assert package.seek(20) == 20
+    assert package.read(1) == b""
+    with pytest.raises(ValueError):
+        package.seek(-1)
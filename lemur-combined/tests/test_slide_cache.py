@@ -0,0 +1,189 @@
+import time
+import threading
+
+import pytest
+
+import slide_cache
+from slide_cache import SlideCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class ManualExecutor:
+    """
+    Runs submitted refreshes only when the test says so.
+    """
+
+    def __init__(self):
+        self.pending = []
+
+    def submit(self, fn, *args):
+        self.pending.append((fn, args))
+
+    def run(self):
+        pending, self.pending = self.pending, []
+        for fn, args in pending:
+            fn(*args)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(slide_cache, "time", clock)
+    return clock
+
+
+class Upstream:
+    def __init__(self, payload="v1", etag='"1"', size=10):
+        self.payload = payload
+        self.etag = etag
+        self.size = size
+        self.calls = []
+        self.not_modified = False
+
+    def __call__(self, etag):
+        self.calls.append(etag)
+        if self.not_modified and etag == self.etag:
+            return None
+        return self.payload, self.etag, self.size
+
+
+def test_fresh_entries_are_served_from_memory(clock):
+    cache = SlideCache(ttl=60)
+    upstream = Upstream()
+    assert cache.get("k", upstream) == "v1"
+    clock.now += 59
+    assert cache.get("k", upstream) == "v1"
+    assert upstream.calls == [None]
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_expired_entry_is_revalidated_with_its_etag(clock):
+    cache = SlideCache(ttl=60)
+    upstream = Upstream()
+    cache.get("k", upstream)
+    clock.now += 61
+    upstream.not_modified = True
+    assert cache.get("k", upstream) == "v1"
+    assert upstream.calls == [None, '"1"']
+    assert cache.stats()["revalidated"] == 1
+    # The 304 renewed the entry
+    clock.now += 59
+    assert cache.get("k", upstream) == "v1"
+    assert len(upstream.calls) == 2
+
+
+def test_expired_entry_is_replaced_by_a_changed_payload(clock):
+    cache = SlideCache(ttl=60)
+    upstream = Upstream()
+    cache.get("k", upstream)
+    clock.now += 61
+    upstream.payload, upstream.etag = "v2", '"2"'
+    assert cache.get("k", upstream) == "v2"
+    assert upstream.calls == [None, '"1"']
+
+
+def test_stale_entry_is_served_while_one_refresh_runs(clock):
+    executor = ManualExecutor()
+    cache = SlideCache(ttl=60, stale_ttl=30, executor=executor)
+    upstream = Upstream()
+    cache.get("k", upstream)
+    clock.now += 70
+    upstream.payload, upstream.etag = "v2", '"2"'
+    assert cache.get("k", upstream) == "v1"
+    assert cache.get("k", upstream) == "v1"
+    assert len(executor.pending) == 1
+    assert upstream.calls == [None]
+    executor.run()
+    assert cache.get("k", upstream) == "v2"
+    stats = cache.stats()
+    assert (stats["stale_hits"], stats["refreshes"], stats["hits"]) == (2, 1, 1)
+
+
+def test_failed_refresh_keeps_the_stale_entry(clock):
+    executor = ManualExecutor()
+    cache = SlideCache(ttl=60, stale_ttl=30, executor=executor)
+    cache.get("k", Upstream())
+    clock.now += 70
+
+    def failing(etag):
+        raise RuntimeError("upstream down")
+
+    assert cache.get("k", failing) == "v1"
+    executor.run()
+    assert cache.stats()["refresh_errors"] == 1
+    assert cache.get("k", failing) == "v1"
+    # The key can be refreshed again
+    assert len(executor.pending) == 1
+
+
+def test_entry_past_the_stale_window_is_fetched_again(clock):
+    executor = ManualExecutor()
+    cache = SlideCache(ttl=60, stale_ttl=30, executor=executor)
+    upstream = Upstream()
+    cache.get("k", upstream)
+    clock.now += 91
+    upstream.payload = "v2"
+    assert cache.get("k", upstream) == "v2"
+    assert not executor.pending
+
+
+def test_concurrent_misses_share_one_fetch(clock):
+    cache = SlideCache(ttl=60)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow(etag):
+        calls.append(etag)
+        started.set()
+        release.wait(5)
+        return "v1", None, 10
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(cache.get("k", slow)))
+    leader.start()
+    started.wait(5)
+    followers = [
+        threading.Thread(target=lambda: results.append(cache.get("k", slow))) for _ in range(3)
+    ]
+    for thread in followers:
+        thread.start()
+    stop = time.monotonic() + 5
+    while cache.stats()["coalesced"] < 3 and time.monotonic() < stop:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+    assert results == ["v1"] * 4
+    assert len(calls) == 1
+
+
+def test_fetch_errors_reach_every_waiter_and_are_not_cached(clock):
+    cache = SlideCache(ttl=60)
+
+    def failing(etag):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        cache.get("k", failing)
+    assert not cache.cached("k")
+    assert cache.get("k", Upstream()) == "v1"
+
+
+def test_memory_is_bounded_by_bytes(clock):
+    cache = SlideCache(ttl=60, max_bytes=25)
+    for key in "abc":
+        cache.get(key, Upstream(payload=key, size=10))
+    assert not cache.cached("a")
+    assert cache.cached("b") and cache.cached("c")
+    assert cache.stats()["bytes"] == 20
+    assert cache.stats()["evictions"] == 1
+    cache.get("big", Upstream(size=30))
+    assert not cache.cached("big")
@@ -0,0 +1,87 @@
+import time
+from unittest import mock
+
+import pytest
+import requests
+
+import slide_fetch
+from fetch_policy import CircuitBreaker
+
+
+def _response(status, body=b'{"14": {"a": 1}}', headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response._content = body
+    response.url = "http://slides.test"
+    response.headers.update(headers or {})
+    return response
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker("test", failures=1, reset_after=60)
+    monkeypatch.setattr(slide_fetch, "breaker", breaker)
+    monkeypatch.setattr(slide_fetch.time, "sleep", lambda seconds: None)
+    return breaker
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = mock.Mock()
+    monkeypatch.setattr(slide_fetch, "get_session", lambda: session)
+    return session
+
+
+def _fetch(retries=3):
+    return slide_fetch._fetch_slide_data(
+        "http://slides.test", 14, retries, time.monotonic() + 10
+    )
+
+
+def test_malformed_slide_body_is_a_failed_attempt(breaker, session):
+    breaker.failures = 5
+    recorded = []
+    breaker.record_failure = mock.Mock(side_effect=lambda: recorded.append("failure"))
+    breaker.record_success = mock.Mock(side_effect=lambda: recorded.append("success"))
+    session.post.side_effect = [_response(200, b"not json"), _response(200, b'{"x": 1}')]
+    payload, _, size = _fetch()
+    assert payload == {"x": 1}
+    assert size == len(b'{"x": 1}')
+    assert recorded == ["failure", "success"]
+
+
+def test_malformed_slide_bodies_exhaust_the_retries(breaker, session):
+    breaker.failures = 5
+    session.post.return_value = _response(200, b"not json")
+    with pytest.raises(Exception, match="after several retries"):
+        _fetch()
+    assert breaker.stats()["consecutive_failures"] == 3
+
+
+def test_not_modified_returns_none(breaker, session):
+    session.post.return_value = _response(304, b"")
+    assert slide_fetch._fetch_slide_data(
+        "http://slides.test", 14, 3, time.monotonic() + 10, etag='"1"'
+    ) is None
+    assert breaker.stats()["consecutive_failures"] == 0
+
+
+@pytest.mark.parametrize(
+    "answer, opened, slide_data",
+    [
+        (_response(500), 1, {}),
+        (requests.exceptions.ConnectionError("down"), 1, {}),
+        (_response(200, b"not json"), 1, {}),
+        (_response(404), 0, {}),
+        (_response(200), 0, {14: {"a": 1}}),
+    ],
+)
+def test_batched_request_outcomes_reach_the_breaker(breaker, session, answer, opened, slide_data):
+    if isinstance(answer, Exception):
+        session.post.side_effect = answer
+    else:
+        session.post.return_value = answer
+    assert slide_fetch.fetch_slides_batch(
+        "http://slides.test", [14], time.monotonic() + 10
+    ) == slide_data
+    assert breaker.stats()["opened"] == opened